@@ -9,10 +9,13 @@ from alembic import context
 from app.models.user import User
 from app.models.project import Project
 from app.models.content import Content
-from app.models.dataset import Dataset, DatasetContent, DatasetPair
+from app.models.dataset import Dataset, DatasetContent, DatasetPair, DatasetChunk, DatasetUsage
 from app.models.fine_tuning import FineTuning
 from app.models.api_key import ApiKey
 from app.models.payment import Payment, CharacterTransaction
+from app.models.qa_pair_cache import QAPairCacheEntry
+from app.models.qa_generation_stat import QAGenerationStat
+from app.models.stored_blob import StoredBlob
 from app.db.session import Base
 
 # this is the Alembic Config object, which provides
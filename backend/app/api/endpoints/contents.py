@@ -14,6 +14,8 @@ from app.models.user import User
 from app.models.project import Project
 from app.models.content import Content
 from app.schemas.content import ContentCreate, ContentResponse, ContentUpdate, URLContent
+from app.services.extraction import reuse_blob_extraction
+from app.services.storage import FileTooLargeError, storage_service
 from app.tasks.content_processing import process_content
 
 router = APIRouter()
@@ -102,46 +104,48 @@ async def upload_file(
             detail="Project not found or not owned by user"
         )
     
-    # Check file size
-    file_size = 0
-    for chunk in file.file:
-        file_size += len(chunk)
-        if file_size > settings.MAX_UPLOAD_SIZE:
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail=f"File too large. Maximum size is {settings.MAX_UPLOAD_SIZE / 1024 / 1024}MB"
-            )
-    
-    # Reset file position
-    await file.seek(0)
-    
-    # Create upload directory if it doesn't exist
-    upload_dir = Path(settings.UPLOAD_DIR) / str(current_user.id) / str(project_id)
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Save file
-    file_path = upload_dir / file.filename
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Enregistrer le fichier sous son SHA-256 (calculé pendant la lecture) : un fichier
+    # identique déjà envoyé n'est stocké qu'une fois
+    try:
+        blob = await storage_service.store_upload(db, file, settings.MAX_UPLOAD_SIZE)
+    except FileTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
     
     # Create content
-    db_content = Content(
-        name=name,
-        description=description,
-        type=file_type,
-        file_path=str(file_path),
-        status="processing",
-        size=file_size,
-        project_id=project_id,
-        content_metadata={"original_name": file.filename}  # Initialiser les métadonnées
-    )
-    
-    db.add(db_content)
-    db.commit()
+    sha256 = blob.sha256
+    try:
+        db_content = Content(
+            name=name,
+            description=description,
+            type=file_type,
+            file_path=blob.file_path,
+            status="processing",
+            size=blob.size,
+            project_id=project_id,
+            content_metadata={"original_name": file.filename, "sha256": sha256}  # Initialiser les métadonnées
+        )
+        
+        # Fichier déjà extrait : le texte est repris, sans tâche d'extraction
+        reused_extraction = reuse_blob_extraction(db_content, blob)
+        
+        db.add(db_content)
+        db.commit()
+    except Exception:
+        # La référence au fichier est déjà enregistrée : on la rend, sinon le fichier ne serait jamais supprimé
+        db.rollback()
+        blob_path = storage_service.release_blob(db, sha256)
+        db.commit()
+        if blob_path:
+            storage_service.delete_file(blob_path)
+        raise
     db.refresh(db_content)
     
     # Déclencher la tâche de traitement de contenu
-    process_content.delay(db_content.id)
+    if not reused_extraction:
+        process_content.delay(db_content.id)
     
     return db_content
 
@@ -326,12 +330,19 @@ def delete_content(
             detail="Content not found"
         )
     
-    # Delete file if exists
-    if content.file_path and os.path.exists(content.file_path):
+    # Delete file if exists (un fichier stocké par SHA-256 n'est supprimé qu'avec sa dernière référence)
+    sha256 = (content.content_metadata or {}).get("sha256")
+    blob_path = None
+    if sha256:
+        blob_path = storage_service.release_blob(db, sha256)
+    elif content.file_path and os.path.exists(content.file_path):
         os.remove(content.file_path)
     
     db.delete(content)
     db.commit()
+    # Le fichier partagé n'est supprimé qu'une fois sa dernière référence supprimée en base
+    if blob_path:
+        storage_service.delete_file(blob_path)
     
     return None
 
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from celery import current_app as celery_app
@@ -13,9 +14,11 @@ from app.models.fine_tuning import FineTuning
 from app.schemas.dataset import (
     DatasetCreate, DatasetResponse, DatasetUpdate, 
     DatasetPairCreate, DatasetPairResponse, DatasetWithPairs,
-    BulkPairUpload
+    BulkPairUpload, BulkPairUploadResponse, DatasetUsageResponse
 )
 from app.schemas.fine_tuning import FineTuningResponse
+from app.services.dedup import filter_new_pairs, clean_user_pair_metadata
+from app.services.usage_ledger import summarize_dataset_usage
 
 router = APIRouter()
 
@@ -136,6 +139,28 @@ def get_dataset(
     
     return dataset
 
+@router.get("/{dataset_id}/usage", response_model=DatasetUsageResponse)
+def get_dataset_usage(
+    dataset_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get the token usage and estimated cost of a dataset generation, per model and for the least efficient chunks.
+    """
+    dataset = db.query(Dataset).join(Project).filter(
+        Dataset.id == dataset_id,
+        Project.user_id == current_user.id
+    ).first()
+    
+    if not dataset:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dataset not found"
+        )
+    
+    return summarize_dataset_usage(db, dataset)
+
 @router.get("/{dataset_id}/pairs", response_model=DatasetWithPairs)
 def get_dataset_with_pairs(
     dataset_id: int,
@@ -239,7 +264,7 @@ def add_dataset_pair(
     db_pair = DatasetPair(
         question=pair_in.question,
         answer=pair_in.answer,
-        pair_metadata=pair_in.pair_metadata,
+        pair_metadata=clean_user_pair_metadata(pair_in.pair_metadata),
         dataset_id=dataset_id
     )
     
@@ -254,7 +279,7 @@ def add_dataset_pair(
     
     return db_pair
 
-@router.post("/{dataset_id}/pairs/bulk", response_model=DatasetResponse, status_code=status.HTTP_201_CREATED)
+@router.post("/{dataset_id}/pairs/bulk", response_model=BulkPairUploadResponse, status_code=status.HTTP_201_CREATED)
 def add_bulk_pairs(
     dataset_id: int,
     pairs_in: BulkPairUpload,
@@ -263,6 +288,7 @@ def add_bulk_pairs(
 ):
     """
     Add multiple pairs to a dataset in bulk.
+    Near-duplicate pairs are rejected; the response reports how many were added and rejected.
     """
     # Verify dataset belongs to user
     dataset = db.query(Dataset).join(Project).filter(
@@ -276,15 +302,20 @@ def add_bulk_pairs(
             detail="Dataset not found"
         )
     
-    # Add pairs
-    for pair in pairs_in.pairs:
-        db_pair = DatasetPair(
-            question=pair.question,
-            answer=pair.answer,
-            pair_metadata=pair.pair_metadata,
-            dataset_id=dataset_id
-        )
-        db.add(db_pair)
+    # Écarter les paires quasi identiques à une paire existante ou du même lot
+    new_pairs = filter_new_pairs(db, dataset, pairs_in.pairs)
+    
+    # Add pairs (une seule requête executemany, sans objet ORM par paire)
+    if new_pairs:
+        db.execute(insert(DatasetPair), [
+            {
+                "question": pair.question,
+                "answer": pair.answer,
+                "pair_metadata": clean_user_pair_metadata(pair.pair_metadata),
+                "dataset_id": dataset_id,
+            }
+            for pair in new_pairs
+        ])
     
     db.commit()
     
@@ -294,7 +325,10 @@ def add_bulk_pairs(
     db.commit()
     db.refresh(dataset)
     
-    return dataset
+    return BulkPairUploadResponse.model_validate(dataset).model_copy(update={
+        "pairs_added": len(new_pairs),
+        "pairs_rejected": len(pairs_in.pairs) - len(new_pairs),
+    })
 
 @router.delete("/{dataset_id}/pairs/{pair_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_dataset_pair(
@@ -268,7 +268,7 @@ async def test_fine_tuning(
         
         # Appeler la méthode sur l'instance obtenue
         # On passe explicitement le modèle fine-tuné
-        completion = await provider_instance.generate_completion(
+        completion = await provider_instance.generate_completion_async(
             model=fine_tuning.fine_tuned_model, # <-- Utiliser le modèle FT spécifique
             prompt=request_data.prompt,
             system_prompt=fine_tuning.dataset.system_content # <-- Passer le system prompt du dataset
@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
@@ -67,17 +68,6 @@ async def generate_system_content(
         \"\"\"{request.purpose}\"\"\"
         """
         
-        # Générer le system content (avec await)
-        system_content_raw = await provider.generate_completion(prompt1)
-        
-        # Nettoyer le résultat
-        system_content = system_content_raw.strip().strip('"').strip()
-        if "\n" in system_content: system_content = system_content.split("\n")[0].strip()
-        # Assurer que ça commence par "You are" (ou équivalent localisé si besoin)
-        # if not system_content.lower().startswith("you are"): system_content = "You are " + system_content
-        # Note: Le prompt demande déjà de commencer par You are, mais la vérif peut être utile
-        # Il faudrait adapter si la langue n'est pas l'anglais
-        
         # Construire le second prompt (pour la catégorisation)
         prompt2 = f"""
         You are a classification assistant. Your job is to decide which single category from the list below best corresponds to the assistant description that follows.
@@ -95,8 +85,20 @@ async def generate_system_content(
         \"\"\"{request.purpose}\"\"\"
         """
         
-        # Obtenir la catégorie (avec await)
-        fine_tuning_category_raw = await provider.generate_completion(prompt2)
+        # Les deux prompts sont indépendants : system content et catégorie sont demandés en parallèle
+        system_content_raw, fine_tuning_category_raw = await asyncio.gather(
+            provider.generate_completion_async(prompt1),
+            provider.generate_completion_async(prompt2)
+        )
+
+        # Nettoyer le résultat
+        system_content = system_content_raw.strip().strip('"').strip()
+        if "\n" in system_content: system_content = system_content.split("\n")[0].strip()
+        # Assurer que ça commence par "You are" (ou équivalent localisé si besoin)
+        # if not system_content.lower().startswith("you are"): system_content = "You are " + system_content
+        # Note: Le prompt demande déjà de commencer par You are, mais la vérif peut être utile
+        # Il faudrait adapter si la langue n'est pas l'anglais
+        
         fine_tuning_category = fine_tuning_category_raw.strip().strip('"').strip()
         
         # Déterminer le nombre minimum de caractères recommandé
@@ -192,7 +194,7 @@ async def generate_completion_endpoint(
         )
         
         # Appeler la méthode sur l'instance
-        completion = await provider_instance.generate_completion(
+        completion = await provider_instance.generate_completion_async(
             model=model_to_use, 
             prompt=request_data.prompt,
             system_prompt=request_data.system_message
@@ -11,6 +11,7 @@ from app.models.content import Content
 from app.models.dataset import Dataset
 from app.schemas.content import ContentResponse
 from app.schemas.dataset import DatasetResponse
+from app.services.storage import storage_service
 
 router = APIRouter()
 
@@ -119,8 +120,18 @@ def delete_project(
             detail="Project not found"
         )
     
+    # Libérer les fichiers des contenus (supprimés avec le projet) stockés par SHA-256
+    blob_paths = []
+    for content in project.contents:
+        sha256 = (content.content_metadata or {}).get("sha256")
+        if sha256:
+            blob_paths.append(storage_service.release_blob(db, sha256))
+    
     db.delete(project)
     db.commit()
+    # Les fichiers ne sont supprimés qu'une fois la suppression validée en base
+    for blob_path in filter(None, blob_paths):
+        storage_service.delete_file(blob_path)
     
     return None
 
@@ -88,11 +88,120 @@ class Settings(BaseSettings):
 
     # IA settings 
     OPENAI_API_KEY: str = Field(default="")
+    OPENAI_BASE_URL: Optional[str] = None  # Serveur compatible OpenAI (stub local en test)
     ANTHROPIC_API_KEY: str = Field(default="")
+    ANTHROPIC_BASE_URL: Optional[str] = None
     MISTRAL_API_KEY: str = Field(default="")
+    MISTRAL_BASE_URL: str = Field(default="https://api.mistral.ai/v1")
+    # Provider "local" : serveur compatible OpenAI (llama.cpp server, vLLM, Ollama) si LOCAL_LLM_BASE_URL
+    # est renseignée, sinon modèle transformers chargé dans le worker, qui génère les appels
+    # simultanés par lots d'au plus LOCAL_LLM_BATCH_SIZE conversations
+    LOCAL_LLM_BASE_URL: Optional[str] = None
+    LOCAL_LLM_API_KEY: str = Field(default="local")  # Ignorée par les serveurs locaux lancés sans clé
+    LOCAL_LLM_MODEL: str = Field(default="Qwen/Qwen2.5-0.5B-Instruct")  # Modèle des datasets "local" sans modèle choisi
+    LOCAL_LLM_DEVICE: str = Field(default="cpu")
+    LOCAL_LLM_MAX_NEW_TOKENS: int = Field(default=1024)
+    LOCAL_LLM_BATCH_SIZE: int = Field(default=8)
+    LOCAL_LLM_BATCH_WAIT_MS: int = Field(default=50)  # Attente maximale pour compléter un lot
+
+    # Clients HTTP des providers, partagés par (provider, clé API) dans chaque processus
+    PROVIDER_HTTP_MAX_CONNECTIONS: int = Field(default=32)
+    PROVIDER_HTTP_MAX_KEEPALIVE: int = Field(default=16)
+    PROVIDER_HTTP_KEEPALIVE_EXPIRY: float = Field(default=60.0)
+    PROVIDER_HTTP_TIMEOUT: float = Field(default=600.0)  # Les générations longues peuvent prendre plusieurs minutes
+    PROVIDER_HTTP_CONNECT_TIMEOUT: float = Field(default=10.0)
+    PROVIDER_HTTP2: bool = Field(default=True)  # Effectif seulement si le paquet h2 est installé
+    PROVIDER_CLIENT_CACHE_SIZE: int = Field(default=64)
+
+    # Limitation de débit des appels aux providers, partagée entre workers via Redis (par provider
+    # et clé API). rpm / tpm : requêtes et tokens par minute, 0 = pas de limite configurée ; les
+    # limites annoncées par les en-têtes des providers s'appliquent aussi, moins RATE_LIMIT_HEADROOM.
+    RATE_LIMIT_ENABLED: bool = Field(default=True)
+    PROVIDER_RATE_LIMITS: Dict[str, Dict[str, int]] = Field(default={
+        "openai": {"rpm": 500, "tpm": 200000},
+        "anthropic": {"rpm": 50, "tpm": 40000},
+        "mistral": {"rpm": 300, "tpm": 500000},
+    })
+    RATE_LIMIT_HEADROOM: float = Field(default=0.95)
+    RATE_LIMIT_MAX_WAIT_SECONDS: float = Field(default=300.0)
+    RATE_LIMIT_MAX_RETRIES: int = Field(default=5)  # Nouvelles tentatives après un 429
+    RATE_LIMIT_DEFAULT_COMPLETION_TOKENS: int = Field(default=1500)  # Réservation pour la réponse quand max_tokens n'est pas fixé
     
     # Content processing settings
     DEFAULT_AI_MODEL: str = Field(default="gpt-4.1")
+    # Extraction du texte des PDF : à partir de PDF_PARALLEL_MIN_PAGES pages, plages de pages réparties
+    # sur un pool de processus (0 worker = un par cœur) ; une page dont l'extraction dépasse
+    # PDF_PAGE_TIMEOUT_SECONDS est laissée vide (0 = pas de délai)
+    PDF_EXTRACTION_WORKERS: int = Field(default=0)
+    PDF_PARALLEL_MIN_PAGES: int = Field(default=20)
+    PDF_PAGE_TIMEOUT_SECONDS: float = Field(default=30.0)
+    # Fichiers texte : encodage détecté sur les TEXT_ENCODING_SAMPLE_BYTES premiers octets (BOM, UTF-8,
+    # sinon charset_normalizer) ; parmi les encodages candidats, ceux de TEXT_PREFERRED_ENCODINGS
+    # l'emportent (les détecteurs confondent cp1252 et cp1250 sur du texte français)
+    TEXT_ENCODING_SAMPLE_BYTES: int = Field(default=65536)
+    TEXT_PREFERRED_ENCODINGS: List[str] = Field(default=["cp1252"])
+
+    # Dataset generation settings
+    # "threads" : tous les chunks dans la tâche generate_dataset ; "chord" : une sous-tâche par chunk ;
+    # "batch" : un job batch du provider (OpenAI), relevé par poll_dataset_batch
+    DATASET_GENERATION_MODE: str = Field(default="threads")
+    DATASET_BATCH_POLL_SECONDS: int = Field(default=300)
+    # Nombre maximum d'appels generate_qa_pairs en vol simultanément, par provider
+    DATASET_GENERATION_CONCURRENCY: Dict[str, int] = Field(default={"openai": 8, "anthropic": 4, "mistral": 4, "local": 8})
+    DATASET_GENERATION_DEFAULT_CONCURRENCY: int = Field(default=2)
+    # Fenêtre adaptative (AIMD) : part de la valeur ci-dessus, +1 par fenêtre d'appels réussis,
+    # multipliée par DECREASE_FACTOR sur un 429 / 5xx ou une latence anormale
+    DATASET_GENERATION_ADAPTIVE: bool = Field(default=True)
+    DATASET_GENERATION_MAX_CONCURRENCY: int = Field(default=32)
+    DATASET_GENERATION_DECREASE_FACTOR: float = Field(default=0.5)
+    DATASET_GENERATION_LATENCY_TOLERANCE: float = Field(default=3.0)  # Multiple de la latence habituelle jugé anormal
+    # Regroupement de petits chunks consécutifs dans une même requête (mode "threads", sortie structurée) :
+    # au plus DATASET_PACK_MAX_CHUNKS chunks et DATASET_PACK_MAX_TOKENS tokens estimés par requête
+    DATASET_PACKING: bool = Field(default=False)
+    DATASET_PACK_MAX_CHUNKS: int = Field(default=4)
+    DATASET_PACK_MAX_TOKENS: int = Field(default=2400)
+    # Chunks d'un paquet sans paire regénérés seuls (facturés une seconde fois) ; au-delà,
+    # ils restent sans checkpoint et sont regénérés à la reprise suivante
+    DATASET_PACK_MAX_SOLO_RETRIES: int = Field(default=1)
+    # Découpage du texte agrégé : "semantic" (frontières de phrases, taille en tokens) ou "fixed" (3000 caractères)
+    DATASET_CHUNKER: str = Field(default="semantic")
+    DATASET_CHUNK_TOKENS: int = Field(default=800)
+    DATASET_CHUNK_OVERLAP_TOKENS: int = Field(default=0)
+    # Sortie structurée native des providers (JSON schema OpenAI, outil Anthropic, json_object Mistral)
+    # plutôt que l'extraction du JSON dans le texte de la réponse
+    QA_STRUCTURED_OUTPUT: bool = Field(default=True)
+    # Prompt disposé pour le cache de préfixe des providers : consignes et objectif du dataset
+    # dans le prompt système, le chunk seul dans le message utilisateur. Désactivé par défaut :
+    # le préfixe commun (~500 tokens) n'atteint le minimum de cache des providers qu'avec un
+    # objectif de dataset long, et le changer change les clés du cache des paires QA
+    QA_PROMPT_CACHING: bool = Field(default=False)
+
+    # Tarifs en USD par million de tokens (prompt / completion / prompt lu dans le cache du provider),
+    # pour le coût estimé des datasets ; un modèle daté ("gpt-4.1-2025-04-14") prend le tarif de
+    # son préfixe le plus long
+    MODEL_TOKEN_PRICES: Dict[str, Dict[str, float]] = Field(default={
+        "gpt-4.1": {"prompt": 2.0, "completion": 8.0, "cached_prompt": 0.5},
+        "gpt-4.1-mini": {"prompt": 0.4, "completion": 1.6, "cached_prompt": 0.1},
+        "gpt-4.1-nano": {"prompt": 0.1, "completion": 0.4, "cached_prompt": 0.025},
+        "gpt-4o": {"prompt": 2.5, "completion": 10.0, "cached_prompt": 1.25},
+        "gpt-4o-mini": {"prompt": 0.15, "completion": 0.6, "cached_prompt": 0.075},
+        "claude-3-sonnet": {"prompt": 3.0, "completion": 15.0},
+        "claude-3-5-sonnet": {"prompt": 3.0, "completion": 15.0, "cached_prompt": 0.3},
+        "claude-3-haiku": {"prompt": 0.25, "completion": 1.25, "cached_prompt": 0.03},
+        "mistral-large": {"prompt": 2.0, "completion": 6.0},
+        "mistral-small": {"prompt": 0.2, "completion": 0.6},
+    })
+
+    # Dédoublonnage des paires quasi identiques (MinHash/LSH), à la génération et à l'import
+    DEDUP_ENABLED: bool = Field(default=True)
+    DEDUP_THRESHOLD: float = Field(default=0.8)  # Similarité de Jaccard estimée à partir de laquelle une paire est écartée
+    DEDUP_NUM_PERM: int = Field(default=64)
+    DEDUP_BANDS: int = Field(default=16)
+
+    # Cache des paires QA générées (table qa_pair_cache)
+    QA_CACHE_ENABLED: bool = Field(default=True)
+    QA_CACHE_TTL_DAYS: int = Field(default=30)
+    QA_CACHE_MAX_BYTES: int = Field(default=536870912)  # 512MB
 
     # Frontend configuration
     FRONTEND_URL: str = Field(default="https://finetuner.io")
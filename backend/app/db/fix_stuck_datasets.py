@@ -1,46 +1,62 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from loguru import logger
 
 from app.db.session import SessionLocal
 
 # Importer tous les modèles pour s'assurer qu'ils sont correctement chargés
-from app.models import User, Project, Content, Dataset, DatasetContent, DatasetPair, FineTuning
+from app.models import User, Project, Content, Dataset, DatasetContent, DatasetPair, DatasetChunk, FineTuning
 
-def fix_stuck_datasets():
+def _as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def fix_stuck_datasets(stale_after_minutes: int = 30):
     """
-    Répare les datasets bloqués en statut 'processing' sans avancement.
+    Relance la génération des datasets bloqués en statut 'processing' sans avancement.
+
+    Un dataset est considéré bloqué si aucun chunk n'a été checkpointé depuis
+    `stale_after_minutes`. La tâche generate_dataset reprend alors au premier
+    chunk manquant au lieu de tout régénérer. Pour un dataset en mode batch, seule la
+    relève du job est relancée (une relève en double est sans effet).
     """
+    from celery_app import celery_app
+
     db = SessionLocal()
     try:
-        # Récupérer tous les datasets bloqués
-        stuck_datasets = db.query(Dataset).filter(Dataset.status == "processing").all()
+        cutoff = datetime.now(timezone.utc) - timedelta(minutes=stale_after_minutes)
+        processing_datasets = db.query(Dataset).filter(Dataset.status == "processing").all()
+
+        stuck_datasets = []
+        for dataset in processing_datasets:
+            last_checkpoint = db.query(func.max(DatasetChunk.created_at)).filter(DatasetChunk.dataset_id == dataset.id).scalar()
+            activity = [_as_utc(d) for d in (last_checkpoint, dataset.updated_at, dataset.created_at) if d]
+            if not activity or max(activity) < cutoff:
+                stuck_datasets.append(dataset)
+
         count = len(stuck_datasets)
-        
         if count == 0:
             logger.info("Aucun dataset bloqué trouvé")
             return
-        
-        logger.info(f"Réparation de {count} datasets bloqués")
-        
-        # Pour chaque dataset bloqué
+
+        logger.info(f"Reprise de {count} datasets bloqués")
+
         for dataset in stuck_datasets:
-            # Marquer comme "ready" pour permettre le fine-tuning
-            dataset.status = "ready"
-            
-            # Compter les paires existantes s'il y en a
-            pairs_count = db.query(DatasetPair).filter(DatasetPair.dataset_id == dataset.id).count()
-            dataset.pairs_count = pairs_count
-            
-            logger.info(f"Dataset {dataset.id} marqué comme prêt avec {pairs_count} paires")
-        
-        db.commit()
-        logger.info(f"{count} datasets réparés avec succès")
+            if dataset.batch_job_id:
+                celery_app.send_task("poll_dataset_batch", args=[dataset.id], queue='dataset_generation')
+                logger.info(f"Dataset {dataset.id} : relève du batch {dataset.batch_job_id} relancée")
+                continue
+            done_chunks = db.query(DatasetChunk).filter(DatasetChunk.dataset_id == dataset.id).count()
+            celery_app.send_task("generate_dataset", args=[dataset.id], queue='dataset_generation')
+            logger.info(f"Dataset {dataset.id} relancé ({done_chunks} chunks déjà générés)")
+
+        logger.info(f"{count} datasets relancés avec succès")
         
     except Exception as e:
-        logger.error(f"Erreur lors de la réparation des datasets: {str(e)}")
+        logger.error(f"Erreur lors de la reprise des datasets: {str(e)}")
         db.rollback()
     finally:
         db.close()
 
 if __name__ == "__main__":
-    fix_stuck_datasets() 
\ No newline at end of file
+    fix_stuck_datasets() 
@@ -3,6 +3,9 @@ from app.models.user import User
 from app.models.api_key import ApiKey  # Assurez-vous que ce fichier existe 
 from app.models.project import Project
 from app.models.content import Content
-from app.models.dataset import Dataset, DatasetContent, DatasetPair
+from app.models.dataset import Dataset, DatasetContent, DatasetPair, DatasetChunk, DatasetUsage
 from app.models.payment import Payment, CharacterTransaction
-from app.models.fine_tuning import FineTuning 
\ No newline at end of file
+from app.models.fine_tuning import FineTuning
+from app.models.qa_pair_cache import QAPairCacheEntry 
+from app.models.qa_generation_stat import QAGenerationStat
+from app.models.stored_blob import StoredBlob
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, BigInteger, JSON
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, BigInteger, JSON, UniqueConstraint, Boolean, Float
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
@@ -17,14 +17,29 @@ class Dataset(Base):
     character_count = Column(Integer, nullable=True)  # Nombre total de caractères dans le dataset
     size = Column(BigInteger, nullable=True)
     error_message = Column(Text, nullable=True)
+    chunks_total = Column(Integer, nullable=True)  # Nombre de chunks du texte agrégé
+    chunks_completed = Column(Integer, nullable=True)  # Chunks déjà générés et enregistrés
+    batch_job_id = Column(String, nullable=True)  # Job batch du provider en cours (mode "batch")
+    batch_structured = Column(Boolean, nullable=True)  # Sortie structurée demandée à la soumission du batch
+    dedup_stats = Column(JSON, nullable=True)  # Paires quasi identiques écartées (voir app.services.dedup)
+    token_usage = Column(JSON, nullable=True)  # Totaux du registre dataset_usage (voir app.services.usage_ledger)
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    @property
+    def progress(self):
+        """Avancement de la génération (chunks terminés / total), entre 0 et 1."""
+        if not self.chunks_total:
+            return None
+        return min(1.0, (self.chunks_completed or 0) / self.chunks_total)
+    
     # Relationships
     project = relationship("Project", back_populates="datasets")
     dataset_contents = relationship("DatasetContent", back_populates="dataset", cascade="all, delete-orphan")
     pairs = relationship("DatasetPair", back_populates="dataset", cascade="all, delete-orphan")
+    chunks = relationship("DatasetChunk", back_populates="dataset", cascade="all, delete-orphan")
+    usage_entries = relationship("DatasetUsage", back_populates="dataset", cascade="all, delete-orphan")
     fine_tunings = relationship("FineTuning", back_populates="dataset", cascade="all, delete-orphan")
     character_transactions = relationship("CharacterTransaction", back_populates="dataset")
 
@@ -51,4 +66,41 @@ class DatasetPair(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
-    dataset = relationship("Dataset", back_populates="pairs") 
\ No newline at end of file
+    dataset = relationship("Dataset", back_populates="pairs")
+
+class DatasetChunk(Base):
+    """Checkpoint de génération : un chunk dont les paires ont déjà été enregistrées."""
+    __tablename__ = "dataset_chunks"
+    __table_args__ = (UniqueConstraint("dataset_id", "chunk_index", name="uq_dataset_chunks_dataset_chunk"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    dataset_id = Column(Integer, ForeignKey("datasets.id"), nullable=False, index=True)
+    chunk_index = Column(Integer, nullable=False)
+    chunk_hash = Column(String(64), nullable=False)  # SHA-256 du texte du chunk
+    pairs_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    dataset = relationship("Dataset", back_populates="chunks")
+
+class DatasetUsage(Base):
+    """Registre d'usage : un appel au provider pour générer les paires d'un chunk."""
+    __tablename__ = "dataset_usage"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    dataset_id = Column(Integer, ForeignKey("datasets.id"), nullable=False, index=True)
+    chunk_index = Column(Integer, nullable=False)
+    provider = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    prompt_tokens = Column(Integer, nullable=True)  # None si le provider ne renvoie pas l'usage
+    completion_tokens = Column(Integer, nullable=True)
+    cached_tokens = Column(Integer, nullable=True)  # Tokens du prompt lus dans le cache de préfixe du provider
+    latency_ms = Column(Integer, nullable=True)  # Durée de l'appel, hors attente du limiteur de débit
+    retries = Column(Integer, nullable=False, default=0)
+    parse_ok = Column(Boolean, nullable=False, default=True)
+    pairs_count = Column(Integer, nullable=False, default=0)  # Paires extraites de la réponse, avant dédoublonnage
+    cost = Column(Float, nullable=True)  # Coût estimé en USD (MODEL_TOKEN_PRICES), None si le modèle n'a pas de tarif
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    dataset = relationship("Dataset", back_populates="usage_entries")
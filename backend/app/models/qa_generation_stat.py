@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, UniqueConstraint
+from sqlalchemy.sql import func
+
+from app.db.session import Base
+
+class QAGenerationStat(Base):
+    __tablename__ = "qa_generation_stats"
+    __table_args__ = (UniqueConstraint("provider", "model", "structured", name="uq_qa_generation_stats_provider_model"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    provider = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    structured = Column(Boolean, nullable=False, default=False)  # Sortie structurée native ou extraction dans le texte
+    calls = Column(Integer, nullable=False, default=0)  # Réponses reçues (hors erreurs d'API)
+    parse_failures = Column(Integer, nullable=False, default=0)  # Réponses sans paire conforme au format demandé
+    pairs = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    @property
+    def parse_failure_rate(self):
+        return self.parse_failures / self.calls if self.calls else None
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+from sqlalchemy.sql import func
+
+from app.db.session import Base
+
+class QAPairCacheEntry(Base):
+    __tablename__ = "qa_pair_cache"
+    
+    # SHA-256 de (texte du chunk, modèle, provider, system_content, version du prompt)
+    cache_key = Column(String(64), primary_key=True)
+    provider = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    prompt_version = Column(String, nullable=False)
+    pairs = Column(JSON, nullable=False)  # Liste de {"question": ..., "answer": ...}
+    size_bytes = Column(Integer, nullable=False, default=0)
+    hit_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
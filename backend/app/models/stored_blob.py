@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, DateTime, BigInteger, Text, JSON
+from sqlalchemy.sql import func
+
+from app.db.session import Base
+
+class StoredBlob(Base):
+    __tablename__ = "stored_blobs"
+    
+    # SHA-256 du fichier envoyé ; les contenus le référencent via content_metadata["sha256"]
+    sha256 = Column(String(64), primary_key=True)
+    file_path = Column(String, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)  # Nombre de contenus qui utilisent ce fichier
+    # Texte déjà extrait du fichier, réutilisé pour les contenus qui ont le même extracteur
+    extractor = Column(String, nullable=True)
+    extracted_text = Column(Text, nullable=True)
+    extraction_metadata = Column(JSON, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -47,6 +47,11 @@ class DatasetResponse(DatasetBase):
     pairs_count: Optional[int] = None
     size: Optional[int] = None
     error_message: Optional[str] = None
+    chunks_total: Optional[int] = None
+    chunks_completed: Optional[int] = None
+    progress: Optional[float] = None  # chunks_completed / chunks_total pendant la génération
+    dedup_stats: Optional[Dict[str, Any]] = None
+    token_usage: Optional[Dict[str, Any]] = None  # Totaux de tokens et coût estimé de la génération
     project_id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
@@ -54,6 +59,14 @@ class DatasetResponse(DatasetBase):
     class Config:
         orm_mode = True
 
+# Model for the response of a bulk pair upload
+class BulkPairUploadResponse(DatasetResponse):
+    pairs_added: int = 0
+    pairs_rejected: int = 0  # Paires écartées comme quasi identiques à une paire existante ou du lot
+
+    class Config:
+        from_attributes = True
+
 # Model for Dataset with pairs
 class DatasetWithPairs(DatasetResponse):
     pairs: List[DatasetPairResponse] = []
@@ -61,6 +74,39 @@ class DatasetWithPairs(DatasetResponse):
     class Config:
         orm_mode = True
 
+# Models for the token usage of a dataset generation
+class DatasetUsageTotals(BaseModel):
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    cached_tokens: int = 0  # Tokens du prompt servis par le cache de préfixe du provider
+    retries: int = 0
+    parse_failures: int = 0
+    pairs: int = 0
+    avg_latency_ms: Optional[int] = None
+    estimated_cost: Optional[float] = None  # USD, d'après MODEL_TOKEN_PRICES
+    tokens_per_pair: Optional[float] = None
+    cost_per_pair: Optional[float] = None
+
+class DatasetModelUsage(DatasetUsageTotals):
+    provider: str
+    model: str
+
+class DatasetChunkUsage(BaseModel):
+    chunk_index: int
+    model: str
+    total_tokens: int
+    pairs: int
+    parse_ok: bool
+    estimated_cost: Optional[float] = None
+
+class DatasetUsageResponse(BaseModel):
+    dataset_id: int
+    totals: DatasetUsageTotals
+    by_model: List[DatasetModelUsage] = []
+    least_efficient_chunks: List[DatasetChunkUsage] = []  # Chunks ayant coûté le plus de tokens par paire
+
 # Model for bulk pair upload
 class BulkPairUpload(BaseModel):
     pairs: List[DatasetPairBase] 
\ No newline at end of file
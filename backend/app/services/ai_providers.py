@@ -1,19 +1,284 @@
 from loguru import logger
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Callable, Awaitable, Optional, List, Iterable, Iterator, Tuple
 import os
 import json
-from openai import OpenAI
-import anthropic
-import requests
-
+import random
+import tempfile
+import time
+import asyncio
+from types import SimpleNamespace
 from app.core.config import settings
+from app.services.chunking import estimate_tokens
+from app.services.local_llm import TRANSFORMERS_AVAILABLE, get_local_runner
+from app.services.provider_clients import provider_clients
+from app.services.rate_limiter import rate_limiter, get_error_status, retry_after_seconds
+from app.services.qa_parser import QA_PAIRS_SCHEMA, QA_PACKED_PAIRS_SCHEMA, parse_qa_pairs, parse_structured_qa_pairs, parse_packed_qa_pairs
+
+# Version du prompt de génération QA : à incrémenter à chaque modification du prompt
+# ou du parsing, pour invalider les paires en cache (voir app.services.qa_cache).
+QA_PROMPT_VERSION = "qa-v3"
+
+# Prompt de génération des paires QA, commun aux providers. En mode structuré, seules
+# les consignes de format changent : la forme de la sortie est imposée par le provider.
+_QA_SYSTEM_HEADER = """You are a training data creation assistant. 
+Your task is to read a given text chunk and produce high-quality question-answer pairs that replicate 
+the original style, tone, slang, vocabulary, and even spelling quirks. 
+
+Important rules:
+1. Do NOT sanitize or correct anything: if the text says "No biggi" or "Gimme a sec", keep it exactly like that.
+2. Do NOT introduce any facts not present in the text.
+4. If the texte use words that you don't know about, keep it
+5. If the texte does not mean anything, keep it
+6. If the text uses casual or "incorrect" grammar, keep it. If it uses comedic or childish language, keep it.
+"""
+_QA_SYSTEM_FORMAT = {
+    False: """7. Return the result strictly as valid JSONl (an array of objects, each with "question" and "answer").
+8. Include no extra commentary, explanation, or text outside the JSON.
+""",
+    True: """7. Return the result as a JSON object with a "pairs" array, each item having a "question" and an "answer" string.
+8. Include no extra commentary, explanation, or text outside the JSON.
+""",
+}
+_QA_SYSTEM_RULES_END = """9. You must produce between 2 and 20 Q&A pairs, no fewer and no more.
+10. All the informations from text need to be in the Q&A pairs.
+11. The Q&A pairs can be long.
+12. Use the language of the text to generate the Q&A pairs."""
+_QA_SYSTEM_EXAMPLE = {
+    False: """
+
+Each entry MUST follow this exact format:
+   {"messages": [{"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": "QUESTION"}, {"role": "assistant", "content": "ANSWER"}]}
+
+Here is an EXAMPLE of the desired style output (fictional sample to illustrate how to preserve style):
+
+EXAMPLE Q&A:
+
+{"messages": [{"role": "system", "content": ""}, {"role": "user", "content": "Yo, did you see that giant robot stomping around the city? "}, {"role": "assistant", "content": "It was crashin' through buildings like a bulldozer on steroids, man! "}]},
+
+Notice how we kept the casual/familiar language exactly as is, with no corrections.""",
+    True: """
+
+Here is an EXAMPLE of the desired style output (fictional sample to illustrate how to preserve style):
+
+EXAMPLE Q&A:
+
+{"pairs": [{"question": "Yo, did you see that giant robot stomping around the city? ", "answer": "It was crashin' through buildings like a bulldozer on steroids, man! "}]}
+
+Notice how we kept the casual/familiar language exactly as is, with no corrections.""",
+}
+# Consignes ajoutées quand plusieurs chunks sont regroupés dans une requête (sortie structurée)
+_QA_PACKED_INSTRUCTIONS = """
+
+You will receive several text chunks, each enclosed in <chunk id="N"> and </chunk> tags.
+Treat every chunk on its own: generate the question-answer pairs for EACH chunk from that chunk's text only,
+and set the "chunk" field of every pair to the id of the chunk it comes from."""
+# Consignes de format du message utilisateur : (avant, après) la consigne de style
+_QA_USER_FORMAT = {
+    False: ("""Each entry MUST follow this exact format: {"messages": [{"role": "system", "content": ""}, {"role": "user", "content": "QUESTION"}, {"role": "assistant", "content": "ANSWER"}]} """, """Your response must be a valid JSONl array (with no additional text outside of it).
+IMPORTANT: Each JSON object must be on its own line, and each line must be a complete, valid JSON object."""),
+    True: ("", "Return the pairs in the \"pairs\" array of the JSON object."),
+}
+
+def use_structured_output(structured: Optional[bool] = None) -> bool:
+    """Resolve the structured output flag, defaulting to the QA_STRUCTURED_OUTPUT setting."""
+    return settings.QA_STRUCTURED_OUTPUT if structured is None else structured
+
+def use_prompt_caching(cacheable: Optional[bool] = None) -> bool:
+    """Resolve the cacheable prompt layout flag, defaulting to the QA_PROMPT_CACHING setting."""
+    return settings.QA_PROMPT_CACHING if cacheable is None else cacheable
+
+def get_qa_prompt_version(structured: Optional[bool] = None, cacheable: Optional[bool] = None) -> str:
+    """Version of the QA prompt actually sent, used in the QA pair cache keys."""
+    version = f"{QA_PROMPT_VERSION}-structured" if use_structured_output(structured) else QA_PROMPT_VERSION
+    return f"{version}-prefix" if use_prompt_caching(cacheable) else version
+
+def pack_qa_chunks(chunk_texts: List[str]) -> str:
+    """Join several chunks into one prompt text, each delimited by its id (1 to n)."""
+    return "\n\n".join(f'<chunk id="{number}">\n{text}\n</chunk>' for number, text in enumerate(chunk_texts, start=1))
+
+def build_qa_prompts(chunk_text: str, system_content: Optional[str] = None, structured: bool = False, cacheable: Optional[bool] = None, packed: bool = False) -> Tuple[str, str]:
+    """
+    Build the system and user prompts asking for QA pairs from a text chunk.
+    
+    In the cacheable layout, everything that does not depend on the chunk (rules, example,
+    training goal and output instructions) goes into the system prompt, and the user prompt
+    only carries the chunk: every request of a dataset then starts with the same prefix,
+    which providers can serve from their prompt cache.
+    
+    With `packed`, `chunk_text` holds several chunks joined by pack_qa_chunks and the
+    pairs must name their source chunk; packed prompts always use the cacheable layout.
+    
+    Returns:
+        (system_prompt, user_prompt)
+    """
+    system_prompt = _QA_SYSTEM_HEADER + _QA_SYSTEM_FORMAT[structured] + _QA_SYSTEM_RULES_END + _QA_SYSTEM_EXAMPLE[structured]
+    effective_system_content = system_content or "No specific training goal provided."
+    format_before, format_after = _QA_USER_FORMAT[structured]
+    if packed:
+        system_prompt += _QA_PACKED_INSTRUCTIONS
+    if packed or use_prompt_caching(cacheable):
+        system_prompt += f"""
+
+The text chunks you will receive were provided in order to train an AI on this goal: "{effective_system_content}"
+Based on each text chunk, generate between 2 and 20 question-answer pairs. 
+The answers can be long.
+Each pair should appear as an object with "question" and "answer" fields. 
+""" + format_before + """The style, tone, and vocabulary should precisely match the way it appears in the text (including slang, jokes, unusual grammar, unusual words etc.). 
+Do not add any information not found in the text. 
+""" + format_after
+        if packed:
+            user_prompt = f"""Please read the following text chunks and generate the question-answer pairs of each one:
+
+{chunk_text}"""
+        else:
+            user_prompt = f"""Please read the following text chunk and generate the question-answer pairs:
+
+{chunk_text}"""
+        return system_prompt, user_prompt
+    
+    user_prompt = f"""Please read the following text chunk:
+
+{chunk_text}
+
+This text was provided in order to train an AI on this goal: "{effective_system_content}"
+Based on this text, generate between 2 and 20 question-answer pairs. 
+The answers can be long.
+Each pair should appear as an object with "question" and "answer" fields. 
+""" + format_before + """The style, tone, and vocabulary should precisely match the way it appears in the text (including slang, jokes, unusual grammar, unusual words etc.). 
+Do not add any information not found in the text. 
+""" + format_after
+    return system_prompt, user_prompt
+
+def build_qa_messages(chunk_text: str, system_content: Optional[str] = None, structured: bool = False, cacheable: Optional[bool] = None, packed: bool = False) -> List[Dict]:
+    """Build the chat messages (system + user) asking for QA pairs from a text chunk."""
+    system_prompt, user_prompt = build_qa_prompts(chunk_text, system_content, structured, cacheable, packed)
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def _qa_result(payload: Any, structured: bool, source: str, packed_chunks: int = 0) -> Dict[str, Any]:
+    """
+    Parse a provider response into {"pairs", "parse_ok", "structured"}, plus
+    "pairs_by_chunk" for a response covering `packed_chunks` packed chunks.
+    """
+    if packed_chunks:
+        pairs_by_chunk, parse_ok = parse_packed_qa_pairs(payload, packed_chunks, source)
+        pairs = [pair for group in pairs_by_chunk for pair in group]
+        return {"pairs": pairs, "pairs_by_chunk": pairs_by_chunk, "parse_ok": parse_ok, "structured": True}
+    if structured:
+        pairs, parse_ok = parse_structured_qa_pairs(payload, source)
+    else:
+        pairs = parse_qa_pairs(payload, source)
+        parse_ok = bool(pairs)
+    return {"pairs": pairs, "parse_ok": parse_ok, "structured": structured}
 
 class AIProviderBase:
     """Base class for AI providers."""
     
+    # Le provider sait-il générer des paires QA via une API batch asynchrone ?
+    supports_qa_batch = False
+    # Nom du provider, clé des budgets de PROVIDER_RATE_LIMITS
+    name: str = ""
+    default_model: Optional[str] = None
+    
     def __init__(self, api_key: str):
         self.api_key = api_key
     
+    @staticmethod
+    def _estimate_request_tokens(texts: Iterable[str], max_output_tokens: Optional[int] = None) -> int:
+        """Tokens reserved for a request: estimated prompt tokens plus the expected completion."""
+        prompt_tokens = sum(estimate_tokens(text) for text in texts if isinstance(text, str))
+        return prompt_tokens + (max_output_tokens or settings.RATE_LIMIT_DEFAULT_COMPLETION_TOKENS)
+    
+    @staticmethod
+    def _rate_limit_delay(error: Exception, attempt: int) -> Optional[float]:
+        """Delay before retrying a rate-limited (429) call, None for any other error."""
+        status, headers = get_error_status(error)
+        if status != 429:
+            return None
+        delay = retry_after_seconds(headers)
+        if delay is None:
+            delay = min(60.0, 2 ** attempt) * random.uniform(1.0, 1.5)
+        return delay
+    
+    def _record_usage(self, stats: Dict[str, Any], usage: Optional[Tuple[int, int, Optional[int]]], latency: float, estimated_tokens: int) -> Optional[int]:
+        """Store the token usage and latency of a successful call in `stats`; returns the total tokens used."""
+        prompt_tokens, completion_tokens, cached_tokens = usage or (None, None, None)
+        stats.update({
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "latency": latency,
+        })
+        logger.debug(
+            f"{self.name} call: {prompt_tokens} prompt ({cached_tokens} cached) / {completion_tokens} completion tokens "
+            f"(estimated {estimated_tokens}), {latency:.2f}s, {stats['retries']} retries"
+        )
+        return prompt_tokens + completion_tokens if usage else None
+    
+    def _call_with_rate_limit(self, send: Callable[[], Tuple[Any, Any, Optional[Tuple[int, int, Optional[int]]]]], estimated_tokens: int) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Run a provider call under the rate limiter shared by all workers.
+        
+        `send` performs the call and returns (result, response headers, usage), usage being
+        (prompt tokens, completion tokens, prompt tokens read from the provider's prompt
+        cache) or None. A 429 pauses every caller of the same
+        API key for the delay announced by the provider, then the call is retried (up to
+        RATE_LIMIT_MAX_RETRIES times).
+        
+        Returns:
+            (result, {"retries", "throttled", "waited": seconds spent waiting for budget,
+            "prompt_tokens", "completion_tokens", "cached_tokens",
+            "latency": seconds of the successful attempt})
+        """
+        stats = {"retries": 0, "throttled": 0, "waited": 0.0}
+        while True:
+            stats["waited"] += rate_limiter.acquire(self.name, self.api_key, estimated_tokens)
+            started = time.perf_counter()
+            try:
+                result, headers, usage = send()
+            except Exception as e:
+                delay = self._rate_limit_delay(e, stats["retries"])
+                if delay is None or stats["retries"] >= settings.RATE_LIMIT_MAX_RETRIES:
+                    raise
+                stats["retries"] += 1
+                stats["throttled"] += 1
+                rate_limiter.settle(self.name, self.api_key, estimated_tokens, 0)
+                rate_limiter.block(self.name, self.api_key, delay)
+                if not rate_limiter.available:
+                    # Sans Redis, l'attente ne peut être que locale
+                    time.sleep(delay)
+                continue
+            used_tokens = self._record_usage(stats, usage, time.perf_counter() - started, estimated_tokens)
+            rate_limiter.observe(self.name, self.api_key, headers)
+            rate_limiter.settle(self.name, self.api_key, estimated_tokens, used_tokens)
+            return result, stats
+    
+    async def _call_with_rate_limit_async(self, send: Callable[[], Awaitable[Tuple[Any, Any, Optional[Tuple[int, int, Optional[int]]]]]], estimated_tokens: int) -> Tuple[Any, Dict[str, Any]]:
+        """Same as _call_with_rate_limit for a coroutine; the limiter waits outside the event loop."""
+        stats = {"retries": 0, "throttled": 0, "waited": 0.0}
+        while True:
+            stats["waited"] += await asyncio.to_thread(rate_limiter.acquire, self.name, self.api_key, estimated_tokens)
+            started = time.perf_counter()
+            try:
+                result, headers, usage = await send()
+            except Exception as e:
+                delay = self._rate_limit_delay(e, stats["retries"])
+                if delay is None or stats["retries"] >= settings.RATE_LIMIT_MAX_RETRIES:
+                    raise
+                stats["retries"] += 1
+                stats["throttled"] += 1
+                await asyncio.to_thread(rate_limiter.settle, self.name, self.api_key, estimated_tokens, 0)
+                await asyncio.to_thread(rate_limiter.block, self.name, self.api_key, delay)
+                if not rate_limiter.available:
+                    await asyncio.sleep(delay)
+                continue
+            used_tokens = self._record_usage(stats, usage, time.perf_counter() - started, estimated_tokens)
+            await asyncio.to_thread(rate_limiter.observe, self.name, self.api_key, headers)
+            await asyncio.to_thread(rate_limiter.settle, self.name, self.api_key, estimated_tokens, used_tokens)
+            return result, stats
+    
     def validate_key(self) -> bool:
         """Validate the API key."""
         raise NotImplementedError
@@ -30,16 +295,66 @@ class AIProviderBase:
         """Cancel a fine-tuning job."""
         raise NotImplementedError
     
-    async def generate_completion(self, prompt: str, model: str) -> str:
-        """Generate a completion for a prompt."""
+    def generate_completion(self, prompt: str, model: Optional[str] = None, system_prompt: Optional[str] = None) -> str:
+        """Generate a completion for a prompt (blocking, for Celery tasks)."""
+        raise NotImplementedError
+    
+    async def generate_completion_async(self, prompt: str, model: Optional[str] = None, system_prompt: Optional[str] = None) -> str:
+        """Generate a completion for a prompt without blocking the event loop (FastAPI endpoints)."""
+        raise NotImplementedError
+    
+    def generate_qa_pairs_detailed(self, chunk_text: str, model: Optional[str] = None, system_content: Optional[str] = None, structured: Optional[bool] = None, packed_chunks: int = 0) -> Dict[str, Any]:
+        """
+        Generate question-answer pairs from a text chunk.
+        
+        API errors are raised, so that the caller can tell them apart from a response
+        that could not be parsed. With `packed_chunks`, `chunk_text` holds that many chunks
+        joined by pack_qa_chunks (see generate_packed_qa_pairs_detailed).
+        
+        Returns:
+            {"pairs": [...], "parse_ok": bool, "structured": bool, "model": str,
+            "prompt_tokens": int, "completion_tokens": int, "cached_tokens": int, "latency": float,
+            "retries": int, "throttled": int, "waited": float}
+            (token counts are None when the provider does not report usage)
+        """
         raise NotImplementedError
+    
+    def generate_packed_qa_pairs_detailed(self, chunk_texts: List[str], model: Optional[str] = None, system_content: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Generate the question-answer pairs of several small chunks in a single request.
+        
+        The chunks are delimited by their id and the pairs are asked with their source
+        chunk, in structured output. The result is shaped like generate_qa_pairs_detailed,
+        with "pairs_by_chunk" holding the pairs of each chunk in order; a chunk left
+        without pairs (unreadable response, ignored chunk) should be generated on its own.
+        """
+        return self.generate_qa_pairs_detailed(
+            pack_qa_chunks(chunk_texts), model, system_content, structured=True, packed_chunks=len(chunk_texts)
+        )
+    
+    def generate_qa_pairs(self, chunk_text: str, model: Optional[str] = None, system_content: Optional[str] = None) -> List[Dict]:
+        """Generate question-answer pairs from a text chunk (empty list on error)."""
+        try:
+            return self.generate_qa_pairs_detailed(chunk_text, model, system_content)["pairs"]
+        except Exception as e:
+            logger.error(f"Error generating QA pairs with {type(self).__name__}: {str(e)}")
+            logger.error(f"Chunk text (truncated): {chunk_text[:100]}...")
+            return []
 
 class OpenAIProvider(AIProviderBase):
     """OpenAI provider implementation."""
     
+    supports_qa_batch = True
+    name = "openai"
+    default_model = "gpt-4.1"
+    
+    # Statuts d'un batch OpenAI qui ne sont pas encore définitifs
+    BATCH_PENDING_STATUSES = ("validating", "in_progress", "finalizing", "cancelling")
+    
     def __init__(self, api_key: str):
         super().__init__(api_key)
-        self.client = OpenAI(api_key=api_key)
+        # Client partagé (pool de connexions) ; OPENAI_BASE_URL permet de viser un serveur compatible
+        self.client = provider_clients.openai(api_key)
     
     def validate_key(self) -> bool:
         """Validate the OpenAI API key."""
@@ -156,202 +471,196 @@ class OpenAIProvider(AIProviderBase):
             logger.error(f"Error cancelling OpenAI fine-tuning: {str(e)}")
             raise e
     
-    async def generate_completion(self, prompt: str, model: str = "gpt-4.1", system_prompt: Optional[str] = None) -> str:
+    def _completion_request(self, prompt: str, model: Optional[str], system_prompt: Optional[str]) -> Dict[str, Any]:
+        effective_system_prompt = system_prompt if system_prompt else "You are a helpful assistant."
+        return {
+            "model": model or self.default_model,
+            "messages": [
+                {"role": "system", "content": effective_system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.1,
+            # "max_tokens": 1024
+        }
+    
+    @staticmethod
+    def _request_tokens(request: Dict[str, Any]) -> int:
+        return AIProviderBase._estimate_request_tokens(
+            (message["content"] for message in request["messages"]), request.get("max_tokens")
+        )
+    
+    @staticmethod
+    def _usage_tokens(response) -> Optional[Tuple[int, int, Optional[int]]]:
+        # Le cache de préfixe d'OpenAI est automatique (prompts d'au moins 1024 tokens) ;
+        # les tokens lus dans le cache sont inclus dans prompt_tokens
+        usage = getattr(response, "usage", None)
+        if not usage:
+            return None
+        details = getattr(usage, "prompt_tokens_details", None)
+        return usage.prompt_tokens, usage.completion_tokens, getattr(details, "cached_tokens", None)
+    
+    def _create_chat_completion(self, request: Dict[str, Any]) -> Tuple[Any, Dict[str, Any]]:
+        """Rate-limited chat completion; the SDK's own retries are disabled in favour of the shared limiter."""
+        def send():
+            raw = self.client.with_options(max_retries=0).chat.completions.with_raw_response.create(**request)
+            response = raw.parse()
+            return response, raw.headers, self._usage_tokens(response)
+        return self._call_with_rate_limit(send, self._request_tokens(request))
+    
+    def _async_client(self):
+        return provider_clients.async_openai(self.api_key)
+    
+    async def _create_chat_completion_async(self, request: Dict[str, Any]) -> Tuple[Any, Dict[str, Any]]:
+        client = self._async_client().with_options(max_retries=0)
+        async def send():
+            raw = await client.chat.completions.with_raw_response.create(**request)
+            response = raw.parse()
+            return response, raw.headers, self._usage_tokens(response)
+        return await self._call_with_rate_limit_async(send, self._request_tokens(request))
+    
+    def generate_completion(self, prompt: str, model: Optional[str] = None, system_prompt: Optional[str] = None) -> str:
         """Generate a completion for a prompt using OpenAI."""
         try:
-            effective_system_prompt = system_prompt if system_prompt else "You are a helpful assistant."
-            
-            # Supprimer `await` car self.client.chat.completions.create est synchrone
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": effective_system_prompt},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1, 
-                # max_tokens=1024 
-            )
+            response, _ = self._create_chat_completion(self._completion_request(prompt, model, system_prompt))
             return response.choices[0].message.content
         except Exception as e:
             logger.error(f"Error generating completion with OpenAI: {str(e)}")
             raise e
     
-    def generate_qa_pairs(self, chunk_text: str, model: str = "gpt-4.1", system_content: Optional[str] = None) -> List[Dict]:
-        """Generate question-answer pairs from a text chunk using OpenAI."""
+    async def generate_completion_async(self, prompt: str, model: Optional[str] = None, system_prompt: Optional[str] = None) -> str:
+        """Generate a completion for a prompt using OpenAI, without blocking the event loop."""
         try:
-            system_prompt = """You are a training data creation assistant. 
-Your task is to read a given text chunk and produce high-quality question-answer pairs that replicate 
-the original style, tone, slang, vocabulary, and even spelling quirks. 
-
-Important rules:
-1. Do NOT sanitize or correct anything: if the text says "No biggi" or "Gimme a sec", keep it exactly like that.
-2. Do NOT introduce any facts not present in the text.
-4. If the texte use words that you don't know about, keep it
-5. If the texte does not mean anything, keep it
-6. If the text uses casual or "incorrect" grammar, keep it. If it uses comedic or childish language, keep it.
-7. Return the result strictly as valid JSONl (an array of objects, each with "question" and "answer").
-8. Include no extra commentary, explanation, or text outside the JSON.
-9. You must produce between 2 and 20 Q&A pairs, no fewer and no more.
-10. All the informations from text need to be in the Q&A pairs.
-11. The Q&A pairs can be long.
-12. Use the language of the text to generate the Q&A pairs.
-
-Each entry MUST follow this exact format:
-   {"messages": [{"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": "QUESTION"}, {"role": "assistant", "content": "ANSWER"}]}
-
-Here is an EXAMPLE of the desired style output (fictional sample to illustrate how to preserve style):
-
-EXAMPLE Q&A:
-
-{"messages": [{"role": "system", "content": ""}, {"role": "user", "content": "Yo, did you see that giant robot stomping around the city? "}, {"role": "assistant", "content": "It was crashin' through buildings like a bulldozer on steroids, man! "}]},
-
-Notice how we kept the casual/familiar language exactly as is, with no corrections."""
-            
-            effective_system_content = system_content or "No specific training goal provided."
-
-            user_prompt = f"""Please read the following text chunk:
-
-{chunk_text}
-
-This text was provided in order to train an AI on this goal: "{effective_system_content}"
-Based on this text, generate between 2 and 20 question-answer pairs. 
-The answers can be long.
-Each pair should appear as an object with "question" and "answer" fields. 
-Each entry MUST follow this exact format: {{"messages": [{{"role": "system", "content": ""}}, {{"role": "user", "content": "QUESTION"}}, {{"role": "assistant", "content": "ANSWER"}}]}} The style, tone, and vocabulary should precisely match the way it appears in the text (including slang, jokes, unusual grammar, unusual words etc.). 
-Do not add any information not found in the text. 
-Your response must be a valid JSONl array (with no additional text outside of it).
-IMPORTANT: Each JSON object must be on its own line, and each line must be a complete, valid JSON object."""
-            
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7
-            )
-            
-            # Extraire le contenu de la réponse
-            content = response.choices[0].message.content
-            
-            # Ajouter un log pour voir la réponse brute
-            logger.debug(f"Raw response from OpenAI: {content[:500]}...")
-            
-            # Nettoyer le contenu avant traitement
-            # 1. Supprimer les délimiteurs de bloc de code
-            if "```json" in content or "```" in content:
-                import re
-                json_content = re.search(r'```(?:json)?\n([\s\S]*?)\n```', content)
-                if json_content:
-                    content = json_content.group(1)
-                    logger.debug(f"Extracted JSON content: {content[:500]}...")
-            
-            # 2. Supprimer tout texte explicatif avant/après le JSON
-            if content.strip().startswith('[') and ']' in content:
-                array_end = content.rindex(']')
-                content = content[:array_end+1]
-            
-            # 3. Essayer plusieurs approches de parsing
-            qa_pairs = []
-            
-            # Approche 1: Parser comme un tableau JSON complet
-            if content.strip().startswith('[') and content.strip().endswith(']'):
-                try:
-                    array_data = json.loads(content)
-                    logger.info(f"Successfully parsed content as a JSON array with {len(array_data)} items")
-                    
-                    for item in array_data:
-                        if isinstance(item, dict):
-                            if 'messages' in item:
-                                # Format ChatML
-                                messages = item['messages']
-                                user_msg = next((m for m in messages if m['role'] == 'user'), None)
-                                assistant_msg = next((m for m in messages if m['role'] == 'assistant'), None)
-                                
-                                if user_msg and assistant_msg:
-                                    qa_pairs.append({
-                                        'question': user_msg['content'],
-                                        'answer': assistant_msg['content']
-                                    })
-                            elif 'question' in item and 'answer' in item:
-                                # Format direct Q&A
-                                qa_pairs.append({
-                                    'question': item['question'],
-                                    'answer': item['answer']
-                                })
-                    
-                    if qa_pairs:
-                        logger.info(f"Successfully extracted {len(qa_pairs)} QA pairs from JSON array")
-                        return qa_pairs
-                except json.JSONDecodeError as e:
-                    logger.warning(f"Failed to parse response as JSON array: {str(e)}")
-            
-            # Approche 2: Parser ligne par ligne pour JSONL
-            lines = [line.strip() for line in content.split('\n') if line.strip() 
-                    and not line.strip().startswith('```') 
-                    and not line.strip().startswith('#')]
+            response, _ = await self._create_chat_completion_async(self._completion_request(prompt, model, system_prompt))
+            return response.choices[0].message.content
+        except Exception as e:
+            logger.error(f"Error generating completion with OpenAI: {str(e)}")
+            raise e
+    
+    def _qa_request(self, chunk_text: str, model: str, system_content: Optional[str], structured: bool, packed: bool = False) -> Dict[str, Any]:
+        """Build the chat completion request body asking for QA pairs from a text chunk."""
+        request = {
+            "model": model,
+            "messages": build_qa_messages(chunk_text, system_content, structured, packed=packed),
+            "temperature": 0.7
+        }
+        if structured:
+            request["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "packed_qa_pairs" if packed else "qa_pairs",
+                    "strict": True,
+                    "schema": QA_PACKED_PAIRS_SCHEMA if packed else QA_PAIRS_SCHEMA
+                }
+            }
+        return request
+    
+    def generate_qa_pairs_detailed(self, chunk_text: str, model: Optional[str] = None, system_content: Optional[str] = None, structured: Optional[bool] = None, packed_chunks: int = 0) -> Dict[str, Any]:
+        """Generate question-answer pairs from a text chunk using OpenAI."""
+        structured = use_structured_output(structured)
+        model = model or self.default_model
+        response, call_stats = self._create_chat_completion(
+            self._qa_request(chunk_text, model, system_content, structured, packed=bool(packed_chunks))
+        )
+        
+        # Extraire le contenu de la réponse
+        message = response.choices[0].message
+        if getattr(message, "refusal", None):
+            logger.warning(f"OpenAI refused to generate QA pairs: {message.refusal}")
+        result = _qa_result(message.content, structured, "OpenAI", packed_chunks)
+        result.update(call_stats, model=model)
+        return result
+            
+    def submit_qa_batch(self, chunks: Iterable[Tuple[str, str]], model: str = "gpt-4.1", system_content: Optional[str] = None, metadata: Optional[Dict[str, str]] = None, structured: Optional[bool] = None) -> str:
+        """
+        Submit QA generation for many chunks as a single OpenAI batch job.
+        
+        Args:
+            chunks: (custom_id, chunk_text) couples, one batch request each
+            model: Model used for every request
+            system_content: Training goal of the dataset
+            metadata: Optional metadata attached to the batch
+            structured: Use structured output (defaults to QA_STRUCTURED_OUTPUT)
+            
+        Returns:
+            The batch ID
+        """
+        structured = use_structured_output(structured)
+        # Le JSONL est écrit dans un fichier temporaire : la taille du corpus ne pèse pas en mémoire
+        with tempfile.TemporaryFile() as batch_file:
+            request_count = 0
+            for custom_id, chunk_text in chunks:
+                request = {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": self._qa_request(chunk_text, model, system_content, structured)
+                }
+                batch_file.write(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+                request_count += 1
+            if not request_count:
+                raise ValueError("Cannot submit an empty QA batch")
             
-            for line in lines:
-                # Essayer de trouver un objet JSON valide dans cette ligne
-                try:
-                    # Rechercher des accolades de début et de fin dans la ligne
-                    start_idx = line.find('{')
-                    end_idx = line.rfind('}')
-                    
-                    if start_idx != -1 and end_idx != -1 and start_idx < end_idx:
-                        json_obj = line[start_idx:end_idx+1]
-                        data = json.loads(json_obj)
-                        
-                        # Vérifier le format
-                        if 'messages' in data:
-                            messages = data['messages']
-                            user_msg = next((m for m in messages if m['role'] == 'user'), None)
-                            assistant_msg = next((m for m in messages if m['role'] == 'assistant'), None)
-                            
-                            if user_msg and assistant_msg:
-                                qa_pairs.append({
-                                    'question': user_msg['content'],
-                                    'answer': assistant_msg['content']
-                                })
-                        elif 'question' in data and 'answer' in data:
-                            qa_pairs.append({
-                                'question': data['question'],
-                                'answer': data['answer']
-                            })
-                except (json.JSONDecodeError, ValueError) as e:
-                    # Ignorer les lignes qui ne sont pas du JSON valide
-                    logger.debug(f"Failed to parse line as JSON: {line[:50]}...")
+            batch_file.seek(0)
+            input_file = self.client.files.create(file=("qa_batch.jsonl", batch_file), purpose="batch")
+        
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+            metadata=metadata
+        )
+        logger.info(f"Submitted OpenAI batch {batch.id} with {request_count} QA requests")
+        return batch.id
+    
+    def get_qa_batch(self, batch_id: str) -> Dict[str, Any]:
+        """Get the status and result files of a QA batch job."""
+        batch = self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {
+            "status": batch.status,
+            "output_file_id": batch.output_file_id,
+            "error_file_id": batch.error_file_id,
+            "request_counts": {
+                "total": counts.total if counts else 0,
+                "completed": counts.completed if counts else 0,
+                "failed": counts.failed if counts else 0
+            }
+        }
+    
+    def iter_qa_batch_results(self, output_file_id: str, structured: Optional[bool] = None) -> Iterator[Tuple[str, Optional[Dict[str, Any]]]]:
+        """
+        Stream the results of a QA batch job.
+        
+        Yields:
+            (custom_id, result) couples, result being shaped like the return value of
+            generate_qa_pairs_detailed, or None when the request failed.
+        """
+        structured = use_structured_output(structured)
+        with self.client.files.with_streaming_response.content(output_file_id) as response:
+            for line in response.iter_lines():
+                if not line.strip():
                     continue
-            
-            # Approche 3: Parser en dernier recours avec des expressions régulières
-            if not qa_pairs:
-                logger.warning("Trying to extract Q&A pairs with regex as last resort")
-                import re
-                # Rechercher des objets messages avec question/réponse
-                message_pattern = r'"messages"\s*:\s*\[\s*{.*?"role"\s*:\s*"user".*?"content"\s*:\s*"(.*?)".*?},\s*{.*?"role"\s*:\s*"assistant".*?"content"\s*:\s*"(.*?)".*?}\s*\]'
-                matches = re.finditer(message_pattern, content, re.DOTALL)
-                
-                for match in matches:
-                    question, answer = match.groups()
-                    # Nettoyer les caractères d'échappement JSON
-                    question = question.replace('\\"', '"').replace('\\\\', '\\')
-                    answer = answer.replace('\\"', '"').replace('\\\\', '\\')
-                    qa_pairs.append({
-                        'question': question,
-                        'answer': answer
-                    })
-            
-            if not qa_pairs:
-                logger.warning(f"No valid QA pairs found in response despite multiple parsing attempts. Content sample: {content[:200]}...")
-            else:
-                logger.info(f"Successfully extracted {len(qa_pairs)} QA pairs after multiple parsing attempts")
-            
-            return qa_pairs
-                
-        except Exception as e:
-            logger.error(f"Error generating QA pairs with OpenAI: {str(e)}")
-            logger.error(f"Chunk text (truncated): {chunk_text[:100]}...")
-            return []
+                record = json.loads(line)
+                custom_id = record.get("custom_id")
+                result = record.get("response") or {}
+                if result.get("status_code") != 200:
+                    logger.warning(f"Batch request {custom_id} failed: {record.get('error') or result.get('status_code')}")
+                    yield custom_id, None
+                    continue
+                try:
+                    body = result["body"]
+                    qa_result = _qa_result(body["choices"][0]["message"]["content"], structured, "OpenAI")
+                    usage = body.get("usage") or {}
+                    qa_result.update(
+                        prompt_tokens=usage.get("prompt_tokens"),
+                        completion_tokens=usage.get("completion_tokens"),
+                        cached_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens"),
+                        model=body.get("model"),
+                    )
+                    yield custom_id, qa_result
+                except Exception as e:
+                    logger.error(f"Error parsing batch result {custom_id}: {str(e)}")
+                    yield custom_id, {"pairs": [], "parse_ok": False, "structured": structured}
             
     def upload_training_file(self, file_path: str) -> str:
         """
@@ -398,9 +707,30 @@ IMPORTANT: Each JSON object must be on its own line, and each line must be a com
 class AnthropicProvider(AIProviderBase):
     """Anthropic provider implementation."""
     
+    name = "anthropic"
+    default_model = "claude-3-sonnet-20240229"
+    # Outil imposé au modèle en mode structuré : ses arguments sont les paires QA
+    QA_TOOL_NAME = "record_qa_pairs"
+    # Modèles pris en charge par le cache de prompt (bêta prompt-caching-2024-07-31) et taille
+    # minimale du préfixe mis en cache : en dessous, l'API ignore le point de cache
+    PROMPT_CACHE_MIN_TOKENS = {"claude-3-5-sonnet": 1024, "claude-3-opus": 1024, "claude-3-haiku": 2048}
+    
     def __init__(self, api_key: str):
         super().__init__(api_key)
-        self.client = anthropic.Anthropic(api_key=api_key)
+        self.client = provider_clients.anthropic(api_key)
+    
+    @classmethod
+    def can_cache_prefix(cls, model: str, system_prompt: str, tools: Optional[List[Dict]] = None) -> bool:
+        """
+        True if the model supports prompt caching and the cached prefix (tools, then system
+        prompt) is estimated above its minimum size; otherwise a cache breakpoint would only
+        route the call to the beta endpoint for no saving.
+        """
+        min_tokens = next((tokens for prefix, tokens in cls.PROMPT_CACHE_MIN_TOKENS.items() if model.startswith(prefix)), None)
+        if min_tokens is None:
+            return False
+        prefix_tokens = estimate_tokens(system_prompt) + sum(estimate_tokens(json.dumps(tool)) for tool in tools or [])
+        return prefix_tokens >= min_tokens
     
     def validate_key(self) -> bool:
         """Validate the Anthropic API key."""
@@ -496,200 +826,127 @@ class AnthropicProvider(AIProviderBase):
             logger.error(f"Error cancelling Anthropic fine-tuning: {str(e)}")
             raise e
     
-    def generate_completion(self, prompt: str, model: str = "claude-3-sonnet-20240229") -> str:
+    def _completion_request(self, prompt: str, model: Optional[str], system_prompt: Optional[str]) -> Dict[str, Any]:
+        request = {
+            "model": model or self.default_model,
+            "max_tokens": 1024,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.7,
+        }
+        if system_prompt:
+            request["system"] = system_prompt
+        return request
+    
+    @staticmethod
+    def _request_tokens(request: Dict[str, Any]) -> int:
+        texts = [message["content"] for message in request["messages"]]
+        system = request.get("system")
+        if isinstance(system, list):
+            texts.extend(block["text"] for block in system)
+        else:
+            texts.append(system)
+        return AIProviderBase._estimate_request_tokens(texts, request.get("max_tokens"))
+    
+    @staticmethod
+    def _usage_tokens(response) -> Optional[Tuple[int, int, Optional[int]]]:
+        # input_tokens ne compte que la partie hors cache : le prompt complet comprend aussi
+        # les tokens écrits dans le cache et ceux qui y ont été lus
+        usage = getattr(response, "usage", None)
+        if not usage:
+            return None
+        cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+        cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+        return usage.input_tokens + cache_write + cache_read, usage.output_tokens, cache_read
+    
+    @staticmethod
+    def _messages_api(client, request: Dict[str, Any]):
+        """
+        Messages resource for a request: with the pinned SDK (anthropic 0.34) prompt caching
+        is still a beta, so requests carrying cache_control blocks go through
+        client.beta.prompt_caching.messages, which sends the prompt-caching beta header.
+        """
+        if isinstance(request.get("system"), list):
+            return client.beta.prompt_caching.messages
+        return client.messages
+    
+    def _create_message(self, request: Dict[str, Any]) -> Tuple[Any, Dict[str, Any]]:
+        """Rate-limited Messages API call; the SDK's own retries are disabled in favour of the shared limiter."""
+        def send():
+            messages = self._messages_api(self.client.with_options(max_retries=0), request)
+            raw = messages.with_raw_response.create(**request)
+            response = raw.parse()
+            return response, raw.headers, self._usage_tokens(response)
+        return self._call_with_rate_limit(send, self._request_tokens(request))
+    
+    async def _create_message_async(self, request: Dict[str, Any]) -> Tuple[Any, Dict[str, Any]]:
+        client = provider_clients.async_anthropic(self.api_key).with_options(max_retries=0)
+        async def send():
+            raw = await self._messages_api(client, request).with_raw_response.create(**request)
+            response = raw.parse()
+            return response, raw.headers, self._usage_tokens(response)
+        return await self._call_with_rate_limit_async(send, self._request_tokens(request))
+    
+    def generate_completion(self, prompt: str, model: Optional[str] = None, system_prompt: Optional[str] = None) -> str:
         """Generate a completion for a prompt using Anthropic."""
         try:
-            response = self.client.messages.create(
-                model=model,
-                max_tokens=1024,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-            )
+            response, _ = self._create_message(self._completion_request(prompt, model, system_prompt))
+            return response.content[0].text
+        except Exception as e:
+            logger.error(f"Error generating completion with Anthropic: {str(e)}")
+            raise e
+    
+    async def generate_completion_async(self, prompt: str, model: Optional[str] = None, system_prompt: Optional[str] = None) -> str:
+        """Generate a completion for a prompt using Anthropic, without blocking the event loop."""
+        try:
+            response, _ = await self._create_message_async(self._completion_request(prompt, model, system_prompt))
             return response.content[0].text
         except Exception as e:
             logger.error(f"Error generating completion with Anthropic: {str(e)}")
             raise e
     
-    def generate_qa_pairs(self, chunk_text: str, model: str = "claude-3-sonnet-20240229", system_content: Optional[str] = None) -> List[Dict]:
+    def generate_qa_pairs_detailed(self, chunk_text: str, model: Optional[str] = None, system_content: Optional[str] = None, structured: Optional[bool] = None, packed_chunks: int = 0) -> Dict[str, Any]:
         """
         Generates question-answer pairs from a text chunk using Anthropic.
+        
+        In structured mode the model is forced to call a tool whose input schema is
+        the QA pairs schema, and the tool input is read instead of the text.
         """
-        try:
-            system_prompt = """You are a training data creation assistant. 
-Your task is to read a given text chunk and produce high-quality question-answer pairs that replicate 
-the original style, tone, slang, vocabulary, and even spelling quirks. 
-
-Important rules:
-1. Do NOT sanitize or correct anything: if the text says "No biggi" or "Gimme a sec", keep it exactly like that.
-2. Do NOT introduce any facts not present in the text.
-4. If the texte use words that you don't know about, keep it
-5. If the texte does not mean anything, keep it
-6. If the text uses casual or "incorrect" grammar, keep it. If it uses comedic or childish language, keep it.
-7. Return the result strictly as valid JSONl (an array of objects, each with "question" and "answer").
-8. Include no extra commentary, explanation, or text outside the JSON.
-9. You must produce between 2 and 20 Q&A pairs, no fewer and no more.
-10. All the informations from text need to be in the Q&A pairs.
-11. The Q&A pairs can be long.
-12. Use the language of the text to generate the Q&A pairs.
-
-Each entry MUST follow this exact format:
-   {"messages": [{"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": "QUESTION"}, {"role": "assistant", "content": "ANSWER"}]}
-
-Here is an EXAMPLE of the desired style output (fictional sample to illustrate how to preserve style):
-
-EXAMPLE Q&A:
-
-{"messages": [{"role": "system", "content": ""}, {"role": "user", "content": "Yo, did you see that giant robot stomping around the city? "}, {"role": "assistant", "content": "It was crashin' through buildings like a bulldozer on steroids, man! "}]},
-
-Notice how we kept the casual/familiar language exactly as is, with no corrections."""
-            
-            effective_system_content = system_content or "No specific training goal provided."
-
-            user_prompt = f"""Please read the following text chunk:
-
-{chunk_text}
-
-This text was provided in order to train an AI on this goal: "{effective_system_content}"
-Based on this text, generate between 2 and 20 question-answer pairs. 
-Each pair should appear as an object with "question" and "answer" fields. 
-Each entry MUST follow this exact format: {{"messages": [{{"role": "system", "content": ""}}, {{"role": "user", "content": "QUESTION"}}, {{"role": "assistant", "content": "ANSWER"}}]}} The style, tone, and vocabulary should precisely match the way it appears in the text (including slang, jokes, unusual grammar, unusual words etc.). 
-Do not add any information not found in the text. 
-Your response must be a valid JSONl array (with no additional text outside of it).
-IMPORTANT: Each JSON object must be on its own line, and each line must be a complete, valid JSON object."""
-            
-            response = self.client.messages.create(
-                model=model,
-                max_tokens=3000,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7,
-            )
-            
-            # Extraire le contenu de la réponse
-            content = response.content[0].text
-            
-            # Ajouter un log pour voir la réponse brute
-            logger.debug(f"Raw response from Anthropic: {content[:500]}...")
-            
-            # Nettoyer le contenu avant traitement
-            # 1. Supprimer les délimiteurs de bloc de code
-            if "```json" in content or "```" in content:
-                import re
-                json_content = re.search(r'```(?:json)?\n([\s\S]*?)\n```', content)
-                if json_content:
-                    content = json_content.group(1)
-                    logger.debug(f"Extracted JSON content: {content[:500]}...")
-            
-            # 2. Supprimer tout texte explicatif avant/après le JSON
-            if content.strip().startswith('[') and ']' in content:
-                array_end = content.rindex(']')
-                content = content[:array_end+1]
-            
-            # 3. Essayer plusieurs approches de parsing
-            qa_pairs = []
-            
-            # Approche 1: Parser comme un tableau JSON complet
-            if content.strip().startswith('[') and content.strip().endswith(']'):
-                try:
-                    array_data = json.loads(content)
-                    logger.info(f"Successfully parsed content as a JSON array with {len(array_data)} items")
-                    
-                    for item in array_data:
-                        if isinstance(item, dict):
-                            if 'messages' in item:
-                                # Format ChatML
-                                messages = item['messages']
-                                user_msg = next((m for m in messages if m['role'] == 'user'), None)
-                                assistant_msg = next((m for m in messages if m['role'] == 'assistant'), None)
-                                
-                                if user_msg and assistant_msg:
-                                    qa_pairs.append({
-                                        'question': user_msg['content'],
-                                        'answer': assistant_msg['content']
-                                    })
-                            elif 'question' in item and 'answer' in item:
-                                # Format direct Q&A
-                                qa_pairs.append({
-                                    'question': item['question'],
-                                    'answer': item['answer']
-                                })
-                    
-                    if qa_pairs:
-                        logger.info(f"Successfully extracted {len(qa_pairs)} QA pairs from JSON array")
-                        return qa_pairs
-                except json.JSONDecodeError as e:
-                    logger.warning(f"Failed to parse response as JSON array: {str(e)}")
-            
-            # Approche 2: Parser ligne par ligne pour JSONL
-            lines = [line.strip() for line in content.split('\n') if line.strip() 
-                    and not line.strip().startswith('```') 
-                    and not line.strip().startswith('#')]
-            
-            for line in lines:
-                # Essayer de trouver un objet JSON valide dans cette ligne
-                try:
-                    # Rechercher des accolades de début et de fin dans la ligne
-                    start_idx = line.find('{')
-                    end_idx = line.rfind('}')
-                    
-                    if start_idx != -1 and end_idx != -1 and start_idx < end_idx:
-                        json_obj = line[start_idx:end_idx+1]
-                        data = json.loads(json_obj)
-                        
-                        # Vérifier le format
-                        if 'messages' in data:
-                            messages = data['messages']
-                            user_msg = next((m for m in messages if m['role'] == 'user'), None)
-                            assistant_msg = next((m for m in messages if m['role'] == 'assistant'), None)
-                            
-                            if user_msg and assistant_msg:
-                                qa_pairs.append({
-                                    'question': user_msg['content'],
-                                    'answer': assistant_msg['content']
-                                })
-                        elif 'question' in data and 'answer' in data:
-                            qa_pairs.append({
-                                'question': data['question'],
-                                'answer': data['answer']
-                            })
-                except (json.JSONDecodeError, ValueError) as e:
-                    # Ignorer les lignes qui ne sont pas du JSON valide
-                    logger.debug(f"Failed to parse line as JSON: {line[:50]}...")
-                    continue
-            
-            # Approche 3: Parser en dernier recours avec des expressions régulières
-            if not qa_pairs:
-                logger.warning("Trying to extract Q&A pairs with regex as last resort")
-                import re
-                # Rechercher des objets messages avec question/réponse
-                message_pattern = r'"messages"\s*:\s*\[\s*{.*?"role"\s*:\s*"user".*?"content"\s*:\s*"(.*?)".*?},\s*{.*?"role"\s*:\s*"assistant".*?"content"\s*:\s*"(.*?)".*?}\s*\]'
-                matches = re.finditer(message_pattern, content, re.DOTALL)
-                
-                for match in matches:
-                    question, answer = match.groups()
-                    # Nettoyer les caractères d'échappement JSON
-                    question = question.replace('\\"', '"').replace('\\\\', '\\')
-                    answer = answer.replace('\\"', '"').replace('\\\\', '\\')
-                    qa_pairs.append({
-                        'question': question,
-                        'answer': answer
-                    })
-            
-            if not qa_pairs:
-                logger.warning(f"No valid QA pairs found in response despite multiple parsing attempts. Content sample: {content[:200]}...")
-            else:
-                logger.info(f"Successfully extracted {len(qa_pairs)} QA pairs after multiple parsing attempts")
-            
-            return qa_pairs
-                
-        except Exception as e:
-            logger.error(f"Error generating QA pairs with Anthropic: {str(e)}")
-            logger.error(f"Chunk text (truncated): {chunk_text[:100]}...")
-            return []
+        structured = use_structured_output(structured)
+        cacheable = use_prompt_caching() or bool(packed_chunks)
+        system_prompt, user_prompt = build_qa_prompts(chunk_text, system_content, structured, cacheable, bool(packed_chunks))
+        request = {
+            "model": model or self.default_model,
+            # Plusieurs chunks regroupés donnent plus de paires : plafond de sortie des modèles Claude 3
+            "max_tokens": 4096 if packed_chunks else 3000,
+            "system": system_prompt,
+            "messages": [{"role": "user", "content": user_prompt}],
+            "temperature": 0.7,
+        }
+        if structured:
+            request["tools"] = [{
+                "name": self.QA_TOOL_NAME,
+                "description": "Record the question-answer pairs generated from the text chunk.",
+                "input_schema": QA_PACKED_PAIRS_SCHEMA if packed_chunks else QA_PAIRS_SCHEMA
+            }]
+            request["tool_choice"] = {"type": "tool", "name": self.QA_TOOL_NAME}
+        if cacheable and self.can_cache_prefix(request["model"], system_prompt, request.get("tools")):
+            # Point de cache explicite en fin de prompt système : l'outil et le prompt système,
+            # identiques pour tous les chunks du dataset, sont relus depuis le cache
+            request["system"] = [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+        
+        response, call_stats = self._create_message(request)
+        
+        # Extraire le contenu de la réponse
+        if structured:
+            payload = next((block.input for block in response.content if block.type == "tool_use"), None)
+            result = _qa_result(payload, True, "Anthropic", packed_chunks)
+        else:
+            content = "".join(block.text for block in response.content if block.type == "text")
+            result = _qa_result(content, False, "Anthropic")
+        result.update(call_stats, model=request["model"])
+        return result
             
     def upload_training_file(self, file_path: str) -> str:
         """
@@ -737,21 +994,20 @@ IMPORTANT: Each JSON object must be on its own line, and each line must be a com
 class MistralProvider(AIProviderBase):
     """Mistral AI provider implementation."""
     
+    name = "mistral"
+    default_model = "mistral-large-latest"
+    
     def __init__(self, api_key: str):
         super().__init__(api_key)
-        self.base_url = "https://api.mistral.ai/v1"
-        self.headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
+        # Client httpx partagé, authentifié et relatif à MISTRAL_BASE_URL
+        self.client = provider_clients.mistral(api_key)
     
     def validate_key(self) -> bool:
         """Validate the Mistral API key."""
         try:
             # Make a test API call
-            response = requests.get(
-                f"{self.base_url}/models",
-                headers=self.headers
+            response = self.client.get(
+                "/models"
             )
             response.raise_for_status()
             return True
@@ -774,9 +1030,8 @@ class MistralProvider(AIProviderBase):
                 payload["suffix"] = suffix
                 logger.info(f"Using model suffix: {suffix}")
             
-            response = requests.post(
-                f"{self.base_url}/fine-tuning",
-                headers=self.headers,
+            response = self.client.post(
+                "/fine-tuning",
                 json=payload
             )
             response.raise_for_status()
@@ -800,9 +1055,8 @@ class MistralProvider(AIProviderBase):
         """Get the status of a Mistral fine-tuning job."""
         try:
             # Retrieve the fine-tuning job
-            response = requests.get(
-                f"{self.base_url}/fine-tuning/{job_id}",
-                headers=self.headers
+            response = self.client.get(
+                f"/fine-tuning/{job_id}"
             )
             response.raise_for_status()
             response_data = response.json()
@@ -835,9 +1089,8 @@ class MistralProvider(AIProviderBase):
         """Cancel a Mistral fine-tuning job."""
         try:
             # Cancel the fine-tuning job
-            response = requests.post(
-                f"{self.base_url}/fine-tuning/{job_id}/cancel",
-                headers=self.headers
+            response = self.client.post(
+                f"/fine-tuning/{job_id}/cancel"
             )
             response.raise_for_status()
             response_data = response.json()
@@ -851,218 +1104,78 @@ class MistralProvider(AIProviderBase):
             logger.error(f"Error cancelling Mistral fine-tuning: {str(e)}")
             raise e
     
-    def generate_completion(self, prompt: str, model: str = "mistral-large-latest") -> str:
+    def _completion_payload(self, prompt: str, model: Optional[str], system_prompt: Optional[str]) -> Dict[str, Any]:
+        messages = [{"role": "user", "content": prompt}]
+        if system_prompt:
+            messages.insert(0, {"role": "system", "content": system_prompt})
+        return {
+            "model": model or self.default_model,
+            "messages": messages,
+            "temperature": 0.7
+        }
+    
+    @staticmethod
+    def _read_chat_response(response) -> Tuple[Dict[str, Any], Any, Optional[Tuple[int, int, Optional[int]]]]:
+        response.raise_for_status()
+        response_data = response.json()
+        usage = response_data.get("usage")
+        return response_data, response.headers, (usage["prompt_tokens"], usage["completion_tokens"], None) if usage else None
+    
+    def _post_chat(self, payload: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Rate-limited chat completion through the shared client."""
+        def send():
+            return self._read_chat_response(self.client.post("/chat/completions", json=payload))
+        return self._call_with_rate_limit(send, self._estimate_request_tokens(m["content"] for m in payload["messages"]))
+    
+    async def _post_chat_async(self, payload: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        client = provider_clients.async_mistral(self.api_key)
+        async def send():
+            return self._read_chat_response(await client.post("/chat/completions", json=payload))
+        return await self._call_with_rate_limit_async(send, self._estimate_request_tokens(m["content"] for m in payload["messages"]))
+    
+    def generate_completion(self, prompt: str, model: Optional[str] = None, system_prompt: Optional[str] = None) -> str:
         """Generate a completion for a prompt using Mistral."""
         try:
-            payload = {
-                "model": model,
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.7
-            }
-            
-            # Appel synchrone avec requests
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json=payload
-            )
-            response.raise_for_status()
-            response_data = response.json()
+            response_data, _ = self._post_chat(self._completion_payload(prompt, model, system_prompt))
+            return response_data["choices"][0]["message"]["content"]
             
+        except Exception as e:
+            logger.error(f"Error generating completion with Mistral: {str(e)}")
+            raise e
+    
+    async def generate_completion_async(self, prompt: str, model: Optional[str] = None, system_prompt: Optional[str] = None) -> str:
+        """Generate a completion for a prompt using Mistral, without blocking the event loop."""
+        try:
+            response_data, _ = await self._post_chat_async(self._completion_payload(prompt, model, system_prompt))
             return response_data["choices"][0]["message"]["content"]
             
         except Exception as e:
             logger.error(f"Error generating completion with Mistral: {str(e)}")
             raise e
     
-    def generate_qa_pairs(self, chunk_text: str, model: str = "mistral-large-latest", system_content: Optional[str] = None) -> List[Dict]:
+    def generate_qa_pairs_detailed(self, chunk_text: str, model: Optional[str] = None, system_content: Optional[str] = None, structured: Optional[bool] = None, packed_chunks: int = 0) -> Dict[str, Any]:
         """
         Generates question-answer pairs from a text chunk using Mistral.
+        
+        In structured mode the JSON mode of the API guarantees a single JSON object,
+        which is then validated against the QA pairs schema.
         """
-        try:
-            system_prompt = """You are a training data creation assistant. 
-Your task is to read a given text chunk and produce high-quality question-answer pairs that replicate 
-the original style, tone, slang, vocabulary, and even spelling quirks. 
-
-Important rules:
-1. Do NOT sanitize or correct anything: if the text says "No biggi" or "Gimme a sec", keep it exactly like that.
-2. Do NOT introduce any facts not present in the text.
-4. If the texte use words that you don't know about, keep it
-5. If the texte does not mean anything, keep it
-6. If the text uses casual or "incorrect" grammar, keep it. If it uses comedic or childish language, keep it.
-7. Return the result strictly as valid JSONl (an array of objects, each with "question" and "answer").
-8. Include no extra commentary, explanation, or text outside the JSON.
-9. You must produce between 2 and 20 Q&A pairs, no fewer and no more.
-10. All the informations from text need to be in the Q&A pairs.
-11. The Q&A pairs can be long.
-12. Use the language of the text to generate the Q&A pairs.
-
-Each entry MUST follow this exact format:
-   {"messages": [{"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": "QUESTION"}, {"role": "assistant", "content": "ANSWER"}]}
-
-Here is an EXAMPLE of the desired style output (fictional sample to illustrate how to preserve style):
-
-EXAMPLE Q&A:
-
-{"messages": [{"role": "system", "content": ""}, {"role": "user", "content": "Yo, did you see that giant robot stomping around the city? "}, {"role": "assistant", "content": "It was crashin' through buildings like a bulldozer on steroids, man! "}]},
-
-Notice how we kept the casual/familiar language exactly as is, with no corrections."""
-            
-            effective_system_content = system_content or "No specific training goal provided."
-
-            user_prompt = f"""Please read the following text chunk:
-
-{chunk_text}
-
-This text was provided in order to train an AI on this goal: "{effective_system_content}"
-Based on this text, generate between 2 and 20 question-answer pairs. 
-Each pair should appear as an object with "question" and "answer" fields. 
-Each entry MUST follow this exact format: {{"messages": [{{"role": "system", "content": ""}}, {{"role": "user", "content": "QUESTION"}}, {{"role": "assistant", "content": "ANSWER"}}]}} The style, tone, and vocabulary should precisely match the way it appears in the text (including slang, jokes, unusual grammar, unusual words etc.). 
-Do not add any information not found in the text. 
-Your response must be a valid JSONl array (with no additional text outside of it).
-IMPORTANT: Each JSON object must be on its own line, and each line must be a complete, valid JSON object."""
-            
-            payload = {
-                "model": model,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                "temperature": 0.7
-            }
-            
-            # Appel synchrone avec requests
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json=payload
-            )
-            response.raise_for_status()
-            response_data = response.json()
-            
-            # Extraire le contenu de la réponse
-            content = response_data["choices"][0]["message"]["content"]
-            
-            # Ajouter un log pour voir la réponse brute
-            logger.debug(f"Raw response from Mistral: {content[:500]}...")
-            
-            # Nettoyer le contenu avant traitement
-            # 1. Supprimer les délimiteurs de bloc de code
-            if "```json" in content or "```" in content:
-                import re
-                json_content = re.search(r'```(?:json)?\n([\s\S]*?)\n```', content)
-                if json_content:
-                    content = json_content.group(1)
-                    logger.debug(f"Extracted JSON content: {content[:500]}...")
-            
-            # 2. Supprimer tout texte explicatif avant/après le JSON
-            if content.strip().startswith('[') and ']' in content:
-                array_end = content.rindex(']')
-                content = content[:array_end+1]
-            
-            # 3. Essayer plusieurs approches de parsing
-            qa_pairs = []
-            
-            # Approche 1: Parser comme un tableau JSON complet
-            if content.strip().startswith('[') and content.strip().endswith(']'):
-                try:
-                    array_data = json.loads(content)
-                    logger.info(f"Successfully parsed content as a JSON array with {len(array_data)} items")
-                    
-                    for item in array_data:
-                        if isinstance(item, dict):
-                            if 'messages' in item:
-                                # Format ChatML
-                                messages = item['messages']
-                                user_msg = next((m for m in messages if m['role'] == 'user'), None)
-                                assistant_msg = next((m for m in messages if m['role'] == 'assistant'), None)
-                                
-                                if user_msg and assistant_msg:
-                                    qa_pairs.append({
-                                        'question': user_msg['content'],
-                                        'answer': assistant_msg['content']
-                                    })
-                            elif 'question' in item and 'answer' in item:
-                                # Format direct Q&A
-                                qa_pairs.append({
-                                    'question': item['question'],
-                                    'answer': item['answer']
-                                })
-                    
-                    if qa_pairs:
-                        logger.info(f"Successfully extracted {len(qa_pairs)} QA pairs from JSON array")
-                        return qa_pairs
-                except json.JSONDecodeError as e:
-                    logger.warning(f"Failed to parse response as JSON array: {str(e)}")
-            
-            # Approche 2: Parser ligne par ligne pour JSONL
-            lines = [line.strip() for line in content.split('\n') if line.strip() 
-                    and not line.strip().startswith('```') 
-                    and not line.strip().startswith('#')]
-            
-            for line in lines:
-                # Essayer de trouver un objet JSON valide dans cette ligne
-                try:
-                    # Rechercher des accolades de début et de fin dans la ligne
-                    start_idx = line.find('{')
-                    end_idx = line.rfind('}')
-                    
-                    if start_idx != -1 and end_idx != -1 and start_idx < end_idx:
-                        json_obj = line[start_idx:end_idx+1]
-                        data = json.loads(json_obj)
-                        
-                        # Vérifier le format
-                        if 'messages' in data:
-                            messages = data['messages']
-                            user_msg = next((m for m in messages if m['role'] == 'user'), None)
-                            assistant_msg = next((m for m in messages if m['role'] == 'assistant'), None)
-                            
-                            if user_msg and assistant_msg:
-                                qa_pairs.append({
-                                    'question': user_msg['content'],
-                                    'answer': assistant_msg['content']
-                                })
-                        elif 'question' in data and 'answer' in data:
-                            qa_pairs.append({
-                                'question': data['question'],
-                                'answer': data['answer']
-                            })
-                except (json.JSONDecodeError, ValueError) as e:
-                    # Ignorer les lignes qui ne sont pas du JSON valide
-                    logger.debug(f"Failed to parse line as JSON: {line[:50]}...")
-                    continue
-            
-            # Approche 3: Parser en dernier recours avec des expressions régulières
-            if not qa_pairs:
-                logger.warning("Trying to extract Q&A pairs with regex as last resort")
-                import re
-                # Rechercher des objets messages avec question/réponse
-                message_pattern = r'"messages"\s*:\s*\[\s*{.*?"role"\s*:\s*"user".*?"content"\s*:\s*"(.*?)".*?},\s*{.*?"role"\s*:\s*"assistant".*?"content"\s*:\s*"(.*?)".*?}\s*\]'
-                matches = re.finditer(message_pattern, content, re.DOTALL)
-                
-                for match in matches:
-                    question, answer = match.groups()
-                    # Nettoyer les caractères d'échappement JSON
-                    question = question.replace('\\"', '"').replace('\\\\', '\\')
-                    answer = answer.replace('\\"', '"').replace('\\\\', '\\')
-                    qa_pairs.append({
-                        'question': question,
-                        'answer': answer
-                    })
-            
-            if not qa_pairs:
-                logger.warning(f"No valid QA pairs found in response despite multiple parsing attempts. Content sample: {content[:200]}...")
-            else:
-                logger.info(f"Successfully extracted {len(qa_pairs)} QA pairs after multiple parsing attempts")
-            
-            return qa_pairs
-                
-        except Exception as e:
-            logger.error(f"Error generating QA pairs with Mistral: {str(e)}")
-            logger.error(f"Chunk text (truncated): {chunk_text[:100]}...")
-            return []
+        structured = use_structured_output(structured)
+        payload = {
+            "model": model or self.default_model,
+            "messages": build_qa_messages(chunk_text, system_content, structured, packed=bool(packed_chunks)),
+            "temperature": 0.7
+        }
+        if structured:
+            payload["response_format"] = {"type": "json_object"}
+        
+        response_data, call_stats = self._post_chat(payload)
+        
+        # Extraire le contenu de la réponse
+        content = response_data["choices"][0]["message"]["content"]
+        result = _qa_result(content, structured, "Mistral", packed_chunks)
+        result.update(call_stats, model=payload["model"])
+        return result
             
     def upload_training_file(self, file_path: str) -> str:
         """
@@ -1070,15 +1183,10 @@ IMPORTANT: Each JSON object must be on its own line, and each line must be a com
         """
         try:
             with open(file_path, 'rb') as file:
-                files = {
-                    'file': file,
-                    'purpose': (None, 'fine-tune')
-                }
-                
-                response = requests.post(
-                    f"{self.base_url}/files",
-                    headers={"Authorization": f"Bearer {self.api_key}"},
-                    files=files
+                response = self.client.post(
+                    "/files",
+                    data={'purpose': 'fine-tune'},
+                    files={'file': file}
                 )
                 response.raise_for_status()
                 response_data = response.json()
@@ -1114,12 +1222,81 @@ IMPORTANT: Each JSON object must be on its own line, and each line must be a com
             logger.error(f"Error preparing training file for Mistral: {str(e)}")
             raise e
 
+class LocalProvider(OpenAIProvider):
+    """
+    Local model provider, for generation without external quotas or network access.
+    
+    With LOCAL_LLM_BASE_URL, requests go to an OpenAI-compatible server (llama.cpp server,
+    vLLM, Ollama), which batches concurrent requests itself. Otherwise the model is loaded
+    in the worker process with transformers, and the concurrent calls of a dataset
+    generation are generated together in batches (see app.services.local_llm).
+    
+    There is no batch API and no fine-tuning; the token usage has no cost.
+    """
+    
+    supports_qa_batch = False
+    name = "local"
+    
+    def __init__(self, api_key: Optional[str] = None):
+        AIProviderBase.__init__(self, api_key or settings.LOCAL_LLM_API_KEY)
+        self.default_model = settings.LOCAL_LLM_MODEL
+        # Sans serveur, le modèle est exécuté dans le processus
+        self.client = provider_clients.local(self.api_key) if settings.LOCAL_LLM_BASE_URL else None
+    
+    @property
+    def in_process(self) -> bool:
+        return self.client is None
+    
+    def validate_key(self) -> bool:
+        """Check that the local server answers, or that the in-process model can be loaded."""
+        if self.in_process:
+            return TRANSFORMERS_AVAILABLE
+        return super().validate_key()
+    
+    def start_fine_tuning(self, dataset_path: str, model: str, hyperparameters: Dict[str, Any], suffix: str = None) -> Dict[str, Any]:
+        raise NotImplementedError("Local models cannot be fine-tuned through the platform")
+    
+    def get_fine_tuning_status(self, job_id: str) -> Dict[str, Any]:
+        raise NotImplementedError("Local models cannot be fine-tuned through the platform")
+    
+    def cancel_fine_tuning(self, job_id: str) -> Dict[str, Any]:
+        raise NotImplementedError("Local models cannot be fine-tuned through the platform")
+    
+    def _async_client(self):
+        return provider_clients.async_local(self.api_key)
+    
+    def _generate_in_process(self, request: Dict[str, Any]) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Chat completion by the in-process model, shaped like an OpenAI response. The
+        response format cannot be enforced: structured outputs go through the schema
+        validation and its text fallback.
+        """
+        stats = {"retries": 0, "throttled": 0, "waited": 0.0}
+        started = time.perf_counter()
+        content, prompt_tokens, completion_tokens = get_local_runner(request["model"]).chat(request["messages"])
+        self._record_usage(stats, (prompt_tokens, completion_tokens, None), time.perf_counter() - started, self._request_tokens(request))
+        response = SimpleNamespace(
+            model=request["model"],
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content, refusal=None))],
+        )
+        return response, stats
+    
+    def _create_chat_completion(self, request: Dict[str, Any]) -> Tuple[Any, Dict[str, Any]]:
+        if self.in_process:
+            return self._generate_in_process(request)
+        return super()._create_chat_completion(request)
+    
+    async def _create_chat_completion_async(self, request: Dict[str, Any]) -> Tuple[Any, Dict[str, Any]]:
+        if self.in_process:
+            return await asyncio.to_thread(self._generate_in_process, request)
+        return await super()._create_chat_completion_async(request)
+
 def get_ai_provider(provider_name: str, api_key: str = None) -> AIProviderBase:
     """
     Get an AI provider implementation based on the provider name.
     
     Args:
-        provider_name: Name of the provider (openai, anthropic, mistral)
+        provider_name: Name of the provider (openai, anthropic, mistral, local)
         api_key: Optional API key to use (if not provided, the key from settings will be used)
         
     Returns:
@@ -1131,5 +1308,7 @@ def get_ai_provider(provider_name: str, api_key: str = None) -> AIProviderBase:
         return AnthropicProvider(api_key or settings.ANTHROPIC_API_KEY)
     elif provider_name == "mistral":
         return MistralProvider(api_key or settings.MISTRAL_API_KEY)
+    elif provider_name == "local":
+        return LocalProvider(api_key or settings.LOCAL_LLM_API_KEY)
     else:
         raise ValueError(f"Unsupported AI provider: {provider_name}") 
\ No newline at end of file
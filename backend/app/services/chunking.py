@@ -0,0 +1,254 @@
+import re
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+
+# Taille historique des chunks du découpage fixe, en caractères
+CHUNK_SIZE = 3000
+# Nombre moyen de caractères par token, utilisé pour découper les segments trop longs
+CHARS_PER_TOKEN = 4
+
+# Force des frontières qui terminent un segment : on coupe de préférence sur la plus forte
+BOUNDARY_LINE = 0
+BOUNDARY_SENTENCE = 1
+BOUNDARY_PARAGRAPH = 2
+BOUNDARY_DOCUMENT = 3
+
+# Saut de paragraphe, saut de ligne, ou fin de phrase (ponctuation, guillemets fermants, espaces)
+_BOUNDARY_RE = re.compile(r"\n[ \t]*\n\s*|\n|(?<=[.!?…])[\"'»”’)\]]*\s+")
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_LONG_WORD_RE = re.compile(r"\w{6}(?=\w)")
+_NON_ASCII_RE = re.compile(r"[^\x00-\x7f]")
+_WORD_RE = re.compile(r"\S+\s*")
+
+def split_text_into_chunks(text, chunk_size=CHUNK_SIZE):
+    """
+    Découpe le texte en chunks d'une taille fixe de 3000 caractères.
+    """
+    if not text:
+        return []
+    return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+
+def iter_text_chunks(pieces: Iterable[str], chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Découpe un flux de morceaux de texte en chunks de `chunk_size` caractères, à la volée.
+
+    Produit exactement les mêmes chunks que split_text_into_chunks sur la concaténation
+    des morceaux, sans jamais construire cette concaténation : seul le chunk en cours
+    est gardé en mémoire.
+    """
+    buffer: List[str] = []
+    buffered = 0
+    for piece in pieces:
+        start = 0
+        while start < len(piece):
+            take = min(chunk_size - buffered, len(piece) - start)
+            buffer.append(piece[start:start + take])
+            buffered += take
+            start += take
+            if buffered == chunk_size:
+                yield "".join(buffer)
+                buffer = []
+                buffered = 0
+    if buffered:
+        yield "".join(buffer)
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estime le nombre de tokens d'un texte sans tokenizer.
+
+    Chaque mot et chaque signe de ponctuation compte pour un token, plus un token par
+    tranche de six caractères au-delà des six premiers d'un mot, plus un demi-token par
+    caractère non ASCII (les tokenizers BPE découpent ces textes plus finement).
+    Le comptage se fait entièrement dans le moteur d'expressions régulières.
+    """
+    return (
+        len(_TOKEN_RE.findall(text))
+        + len(_LONG_WORD_RE.findall(text))
+        + (len(_NON_ASCII_RE.findall(text)) + 1) // 2
+    )
+
+class FixedSizeChunker:
+    """
+    Découpage historique : des chunks de `chunk_size` caractères, sans tenir compte du texte.
+    """
+
+    name = "fixed"
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    def chunk_documents(self, documents: Iterable[Sequence[str]]) -> Iterator[str]:
+        return iter_text_chunks((piece for document in documents for piece in document), self.chunk_size)
+
+class SemanticChunker:
+    """
+    Découpage sur les frontières du texte, dimensionné en tokens estimés.
+
+    Le texte est lu segment par segment (phrase ou ligne) et les segments sont empilés
+    tant que le chunk reste sous `max_tokens`. Au dépassement, le chunk est coupé sur la
+    frontière la plus forte (document, paragraphe, puis phrase) située dans sa seconde
+    moitié ; le reste est reporté sur le chunk suivant. Les `overlap_tokens` derniers
+    tokens d'un chunk sont répétés en tête du suivant, sauf entre deux documents.
+
+    Chaque segment n'est traité qu'un nombre borné de fois : le coût reste linéaire
+    en la taille du texte.
+    """
+
+    name = "semantic"
+
+    def __init__(self, max_tokens: int, overlap_tokens: int = 0, min_fill: float = 0.5):
+        self.max_tokens = max(1, int(max_tokens))
+        # Un recouvrement d'au moins la moitié du chunk empêcherait d'avancer
+        self.overlap_tokens = max(0, min(int(overlap_tokens), self.max_tokens // 2))
+        self.min_fill = min_fill
+
+    def chunk_documents(self, documents: Iterable[Sequence[str]]) -> Iterator[str]:
+        """
+        Découpe une suite de documents, chacun donné comme une suite de morceaux de texte.
+
+        Un document n'est joint qu'au moment d'être découpé : au plus un document est
+        entièrement en mémoire.
+        """
+        current: List[Tuple[str, int, int]] = []
+        current_tokens = 0
+        # Nombre de segments de tête répétés depuis le chunk précédent
+        overlap_count = 0
+
+        for segment in self._iter_segments(documents):
+            while current and current_tokens + segment[1] > self.max_tokens:
+                if overlap_count >= len(current):
+                    # Rien de nouveau depuis le dernier chunk : abandonner le recouvrement
+                    current, current_tokens, overlap_count = [], 0, 0
+                    break
+                cut, strength = self._find_cut(current, overlap_count)
+                chunk = "".join(text for text, _, _ in current[:cut]).strip()
+                if chunk:
+                    yield chunk
+                overlap = self._overlap_tail(current[:cut]) if strength < BOUNDARY_DOCUMENT else []
+                current = overlap + current[cut:]
+                current_tokens = sum(tokens for _, tokens, _ in current)
+                overlap_count = len(overlap)
+            current.append(segment)
+            current_tokens += segment[1]
+
+        if len(current) > overlap_count:
+            chunk = "".join(text for text, _, _ in current).strip()
+            if chunk:
+                yield chunk
+
+    def chunk_text(self, text: str) -> Iterator[str]:
+        return self.chunk_documents([[text]])
+
+    def _find_cut(self, current: List[Tuple[str, int, int]], overlap_count: int) -> Tuple[int, int]:
+        """
+        Position de coupe dans le chunk en cours et force de la frontière retenue.
+        """
+        min_tokens = self.max_tokens * self.min_fill
+        best = {}
+        cumulative = 0
+        for index, (_, tokens, strength) in enumerate(current):
+            cumulative += tokens
+            if index >= overlap_count and cumulative >= min_tokens:
+                best[strength] = index + 1
+        for strength in (BOUNDARY_DOCUMENT, BOUNDARY_PARAGRAPH, BOUNDARY_SENTENCE):
+            if strength in best:
+                return best[strength], strength
+        return len(current), current[-1][2]
+
+    def _overlap_tail(self, segments: List[Tuple[str, int, int]]) -> List[Tuple[str, int, int]]:
+        if not self.overlap_tokens:
+            return []
+        tail = []
+        total = 0
+        for segment in reversed(segments):
+            if total + segment[1] > self.overlap_tokens:
+                break
+            tail.append(segment)
+            total += segment[1]
+        tail.reverse()
+        return tail
+
+    def _iter_segments(self, documents: Iterable[Sequence[str]]) -> Iterator[Tuple[str, int, int]]:
+        """
+        Rend les segments (texte, tokens estimés, force de la frontière qui les termine).
+        """
+        previous = None
+        for document in documents:
+            text = "".join(document)
+            if not text:
+                continue
+            if previous is not None:
+                # La fin d'un document est la frontière la plus forte
+                yield previous[0], previous[1], BOUNDARY_DOCUMENT
+                previous = None
+            position = 0
+            for match in _BOUNDARY_RE.finditer(text):
+                boundary = match.group()
+                if boundary.count("\n") >= 2:
+                    strength = BOUNDARY_PARAGRAPH
+                elif boundary.startswith("\n"):
+                    strength = BOUNDARY_LINE
+                else:
+                    strength = BOUNDARY_SENTENCE
+                for segment in self._split_oversized(text[position:match.end()], strength):
+                    if previous is not None:
+                        yield previous
+                    previous = segment
+                position = match.end()
+            if position < len(text):
+                for segment in self._split_oversized(text[position:], BOUNDARY_LINE):
+                    if previous is not None:
+                        yield previous
+                    previous = segment
+        if previous is not None:
+            yield previous[0], previous[1], BOUNDARY_DOCUMENT
+
+    def _split_oversized(self, segment: str, strength: int) -> Iterator[Tuple[str, int, int]]:
+        """
+        Redécoupe par mots, puis par caractères, un segment plus long que `max_tokens`.
+        """
+        tokens = estimate_tokens(segment)
+        if tokens <= self.max_tokens:
+            yield segment, tokens, strength
+            return
+
+        max_chars = self.max_tokens * CHARS_PER_TOKEN
+        pieces: List[Tuple[str, int]] = []
+        for match in _WORD_RE.finditer(segment):
+            word = match.group()
+            word_tokens = estimate_tokens(word)
+            if word_tokens <= self.max_tokens:
+                pieces.append((word, word_tokens))
+                continue
+            for start in range(0, len(word), max_chars):
+                piece = word[start:start + max_chars]
+                pieces.append((piece, estimate_tokens(piece)))
+        # Espaces de tête éventuels, non couverts par _WORD_RE
+        leading = segment[:len(segment) - len(segment.lstrip())]
+
+        buffer: List[str] = [leading] if leading else []
+        buffered = 0
+        for piece, piece_tokens in pieces:
+            if buffered and buffered + piece_tokens > self.max_tokens:
+                yield "".join(buffer), buffered, BOUNDARY_LINE
+                buffer, buffered = [], 0
+            buffer.append(piece)
+            buffered += piece_tokens
+        if buffer:
+            yield "".join(buffer), buffered, strength
+
+def get_chunker(name: Optional[str] = None):
+    """
+    Chunker configuré pour la génération de datasets.
+
+    Args:
+        name: "fixed" ou "semantic" (par défaut settings.DATASET_CHUNKER)
+    """
+    name = name or settings.DATASET_CHUNKER
+    if name == "fixed":
+        return FixedSizeChunker(CHUNK_SIZE)
+    elif name == "semantic":
+        return SemanticChunker(settings.DATASET_CHUNK_TOKENS, settings.DATASET_CHUNK_OVERLAP_TOKENS)
+    else:
+        raise ValueError(f"Unsupported chunker: {name}")
@@ -0,0 +1,132 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from loguru import logger
+
+from app.core.config import settings
+from app.services.rate_limiter import RateLimitTimeout, get_error_status
+
+# Poids d'un nouvel appel dans la moyenne mobile de la latence
+LATENCY_SMOOTHING = 0.1
+
+class AdaptiveConcurrencyController:
+    """
+    Nombre d'appels LLM en vol ajusté par AIMD (additive increase, multiplicative decrease).
+
+    Chaque appel réussi ajoute 1 / fenêtre à la fenêtre (soit +1 par fenêtre complète
+    d'appels réussis) ; un signe de saturation la multiplie par `decrease_factor` :
+    erreur 429 ou 5xx, réponse obtenue après un 429 (champ "throttled" du résultat) ou
+    latence supérieure à `latency_tolerance` fois la latence habituelle. Seuls les appels
+    commencés après la dernière réduction peuvent en provoquer une nouvelle, pour qu'une
+    rafale d'erreurs simultanées ne compte qu'une fois.
+
+    Un appel qui a dû attendre le limiteur de débit (champ "waited") ne fait pas grandir la
+    fenêtre : le quota est déjà atteint, plus de requêtes en vol n'y changerait rien.
+
+    `clock` permet de simuler le temps dans les tests.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_window: int = 1,
+        max_window: int = settings.DATASET_GENERATION_MAX_CONCURRENCY,
+        decrease_factor: float = settings.DATASET_GENERATION_DECREASE_FACTOR,
+        latency_tolerance: float = settings.DATASET_GENERATION_LATENCY_TOLERANCE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.min_window = max(1, min_window)
+        self.max_window = max(self.min_window, max_window)
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.clock = clock
+        self._window = float(min(self.max_window, max(self.min_window, initial)))
+        self._in_flight = 0
+        self._latency: Optional[float] = None
+        self._last_decrease = float("-inf")
+        self._stats = {"calls": 0, "decreases": 0, "peak_window": int(self._window)}
+        self._condition = threading.Condition()
+
+    @property
+    def window(self) -> int:
+        """Nombre d'appels autorisés en vol actuellement."""
+        with self._condition:
+            return int(self._window)
+
+    @property
+    def in_flight(self) -> int:
+        with self._condition:
+            return self._in_flight
+
+    def acquire(self) -> float:
+        """Attend une place dans la fenêtre ; renvoie l'heure de début de l'appel."""
+        with self._condition:
+            while self._in_flight >= int(self._window):
+                self._condition.wait()
+            self._in_flight += 1
+            return self.clock()
+
+    def release(self, started: float, congested: bool = False, grow: bool = True, latency: Optional[float] = None):
+        """
+        Libère la place d'un appel commencé à `started` et ajuste la fenêtre.
+
+        Args:
+            congested: le provider a signalé une saturation (429, 5xx)
+            grow: l'appel peut faire grandir la fenêtre s'il s'est bien passé
+            latency: durée de l'appel, comparée à la latence habituelle (None : ignorée)
+        """
+        with self._condition:
+            self._in_flight -= 1
+            self._stats["calls"] += 1
+            if latency is not None and not congested:
+                if self._latency is not None and latency > self._latency * self.latency_tolerance:
+                    congested = True
+                else:
+                    self._latency = latency if self._latency is None else (
+                        self._latency + LATENCY_SMOOTHING * (latency - self._latency)
+                    )
+
+            if congested:
+                if started >= self._last_decrease:
+                    self._window = max(float(self.min_window), self._window * self.decrease_factor)
+                    self._last_decrease = self.clock()
+                    self._stats["decreases"] += 1
+                    logger.info(f"Provider saturated, concurrency window reduced to {int(self._window)}")
+            elif grow and self._window < self.max_window:
+                self._window = min(float(self.max_window), self._window + 1 / self._window)
+                self._stats["peak_window"] = max(self._stats["peak_window"], int(self._window))
+            self._condition.notify_all()
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Appelle `fn` dans la fenêtre et ajuste celle-ci selon l'issue de l'appel.
+        Les exceptions de `fn` sont propagées.
+        """
+        started = self.acquire()
+        try:
+            result = fn(*args, **kwargs)
+        except RateLimitTimeout:
+            self.release(started, congested=True)
+            raise
+        except Exception as e:
+            status, _ = get_error_status(e)
+            self.release(started, congested=status is not None and (status == 429 or status >= 500), grow=False)
+            raise
+        details = result if isinstance(result, dict) else {}
+        self.release(
+            started,
+            congested=bool(details.get("throttled")),
+            grow=not details.get("waited"),
+            latency=self.clock() - started,
+        )
+        return result
+
+    def generate_qa_pairs_detailed(self, provider, chunk_text: str, model: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        """provider.generate_qa_pairs_detailed appelé sous le contrôle de la fenêtre."""
+        return self.call(provider.generate_qa_pairs_detailed, chunk_text, model, **kwargs)
+
+    def summary(self) -> Dict[str, int]:
+        """Fenêtre finale et ajustements, pour le résultat des tâches."""
+        with self._condition:
+            return {"window": int(self._window), **self._stats}
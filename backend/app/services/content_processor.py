@@ -1,11 +1,11 @@
 import os
 import re
 import tempfile
-import PyPDF2
 import logging
 from typing import Optional, Dict, Any, Tuple
 from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
 
+from app.services.pdf_extraction import extract_pdf_text
 from app.services.storage import storage_service
 
 logger = logging.getLogger(__name__)
@@ -182,12 +182,7 @@ class ContentProcessor:
     def _extract_text_from_pdf(self, file_path: str) -> Optional[str]:
         """Extract text from a PDF file."""
         try:
-            text = ""
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    text += page.extract_text() + "\n"
+            text, _ = extract_pdf_text(file_path)
             return text
         except Exception as e:
             logger.error(f"Error extracting text from PDF {file_path}: {str(e)}")
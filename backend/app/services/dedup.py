@@ -0,0 +1,232 @@
+import hashlib
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.dataset import Dataset, DatasetPair
+
+# Taille des lots de suppression des doublons
+DELETE_BATCH_SIZE = 500
+# Au-delà, un bucket LSH n'accueille plus de nouvelles entrées : il contient déjà des
+# textes quasi identiques et le comparer à chaque ajout rendrait le coût quadratique
+MAX_BUCKET_SIZE = 64
+# pair_metadata["source"] des paires écrites par la génération : seules celles-ci peuvent
+# être supprimées par le dédoublonnage
+GENERATED_PAIR_SOURCE = "generated"
+
+_NON_WORD_RE = re.compile(r"[\W_]+", re.UNICODE)
+_EMPTY_BIN = (1 << 64) - 1
+
+def normalize_text(text: str) -> str:
+    """
+    Normalise un texte pour la comparaison : NFKC, casse, ponctuation et espaces.
+    """
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    return _NON_WORD_RE.sub(" ", text).strip()
+
+def pair_text(question: str, answer: str) -> str:
+    return f"{question or ''}\n{answer or ''}"
+
+class NearDuplicateIndex:
+    """
+    Index MinHash/LSH des paires déjà retenues.
+
+    La signature d'un texte est une MinHash à une seule permutation (chaque shingle de
+    mots est haché une fois puis réparti dans `num_perm` cases), densifiée pour les
+    textes courts. Les signatures sont découpées en `bands` bandes : deux textes qui
+    partagent une bande deviennent candidats, et un candidat est un doublon si la part
+    de cases égales (estimation de la similarité de Jaccard) atteint `threshold`.
+
+    Ajouter n textes coûte O(n) hachages et comparaisons bornées : le coût reste
+    quasi linéaire sur des dizaines de milliers de paires.
+    """
+
+    def __init__(
+        self,
+        threshold: float = settings.DEDUP_THRESHOLD,
+        num_perm: int = settings.DEDUP_NUM_PERM,
+        bands: int = settings.DEDUP_BANDS,
+        shingle_size: int = 3,
+    ):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self._signatures: List[Tuple[int, ...]] = []
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        words = normalize_text(text).split()
+        size = self.shingle_size
+        if len(words) <= size:
+            shingles = {" ".join(words)}
+        else:
+            shingles = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+        num_perm = self.num_perm
+        bins = [_EMPTY_BIN] * num_perm
+        for shingle in shingles:
+            value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+            index = value % num_perm
+            value //= num_perm
+            if value < bins[index]:
+                bins[index] = value
+
+        # Densification : une case vide reprend la valeur de la suivante non vide (en
+        # boucle), décalée de la distance parcourue pour ne pas créer de fausses égalités
+        if _EMPTY_BIN in bins and len(set(bins)) > 1:
+            original = bins[:]
+            following = None
+            distance = 0
+            for step in range(2 * num_perm - 1, -1, -1):
+                index = step % num_perm
+                if original[index] != _EMPTY_BIN:
+                    following = original[index]
+                    distance = 0
+                    continue
+                distance += 1
+                if step < num_perm and following is not None:
+                    bins[index] = (following + distance * 0x9E3779B97F4A7C15) & _EMPTY_BIN
+        return tuple(bins)
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def similarity(self, first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+        return sum(1 for a, b in zip(first, second) if a == b) / self.num_perm
+
+    def add(self, text: str) -> bool:
+        """
+        Ajoute un texte s'il n'est pas quasi identique à un texte déjà retenu.
+
+        Returns:
+            True si le texte est retenu, False si c'est un doublon.
+        """
+        signature = self.signature(text)
+        band_keys = [
+            (band, signature[band * self.rows:(band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+        checked = set()
+        for key in band_keys:
+            for entry in self._buckets.get(key, ()):
+                if entry in checked:
+                    continue
+                checked.add(entry)
+                if self.similarity(signature, self._signatures[entry]) >= self.threshold:
+                    return False
+
+        entry = len(self._signatures)
+        self._signatures.append(signature)
+        for key in band_keys:
+            bucket = self._buckets.setdefault(key, [])
+            if len(bucket) < MAX_BUCKET_SIZE:
+                bucket.append(entry)
+        return True
+
+def clean_user_pair_metadata(metadata: Optional[Dict]) -> Optional[Dict]:
+    """
+    Retire des métadonnées d'une paire envoyée par l'utilisateur (export réimporté, par
+    exemple) les marques réservées aux paires générées : chunk_hash et source "generated".
+    """
+    if not metadata:
+        return metadata
+    return {
+        key: value for key, value in metadata.items()
+        if key != "chunk_hash" and not (key == "source" and value == GENERATED_PAIR_SOURCE)
+    }
+
+def record_dedup_stats(dataset: Dataset, pairs_checked: int, pairs_dropped: int, threshold: float, manual_pairs_skipped: int = 0):
+    """
+    Enregistre sur le dataset le résultat d'une passe de dédoublonnage (le total des
+    paires écartées est cumulé d'une passe à l'autre).
+    """
+    previous = dataset.dedup_stats or {}
+    dataset.dedup_stats = {
+        "pairs_checked": pairs_checked,
+        "pairs_dropped": pairs_dropped,
+        "manual_pairs_skipped": manual_pairs_skipped,
+        "total_dropped": previous.get("total_dropped", 0) + pairs_dropped,
+        "threshold": threshold,
+    }
+
+def build_dataset_index(db: Session, dataset_id: int, index: NearDuplicateIndex) -> Tuple[List[int], int]:
+    """
+    Indexe les paires d'un dataset : d'abord les paires ajoutées par l'utilisateur, puis
+    les paires générées (pair_metadata["source"] == "generated"), chacune dans l'ordre
+    d'insertion. Une paire sans cette marque est traitée comme une paire de l'utilisateur.
+
+    Returns:
+        (identifiants des paires générées qui sont des doublons de paires déjà indexées,
+        nombre de paires de l'utilisateur qui sont des doublons : elles ne sont jamais supprimées)
+    """
+    duplicate_ids = []
+    manual_duplicates = 0
+    source = DatasetPair.pair_metadata["source"].as_string()
+    is_generated = source == GENERATED_PAIR_SOURCE
+    for generated in (False, True):
+        rows = (
+            db.query(DatasetPair.id, DatasetPair.question, DatasetPair.answer)
+            .filter(DatasetPair.dataset_id == dataset_id, is_generated if generated else (source.is_(None) | ~is_generated))
+            .order_by(DatasetPair.id)
+            .yield_per(1000)
+        )
+        for pair_id, question, answer in rows:
+            if index.add(pair_text(question, answer)):
+                continue
+            if generated:
+                duplicate_ids.append(pair_id)
+            else:
+                manual_duplicates += 1
+    return duplicate_ids, manual_duplicates
+
+def deduplicate_dataset_pairs(db: Session, dataset: Dataset) -> Optional[Dict]:
+    """
+    Supprime les paires générées quasi identiques à une paire de l'utilisateur ou à une
+    paire générée plus ancienne, et enregistre les statistiques sur le dataset. Les paires
+    ajoutées par l'utilisateur ne sont jamais supprimées.
+
+    Returns:
+        Les statistiques enregistrées, ou None si le dédoublonnage est désactivé.
+    """
+    if not settings.DEDUP_ENABLED:
+        return None
+
+    index = NearDuplicateIndex()
+    duplicate_ids, manual_duplicates = build_dataset_index(db, dataset.id, index)
+    for start in range(0, len(duplicate_ids), DELETE_BATCH_SIZE):
+        db.execute(
+            delete(DatasetPair)
+            .where(DatasetPair.id.in_(duplicate_ids[start:start + DELETE_BATCH_SIZE]))
+            .execution_options(synchronize_session=False)
+        )
+    record_dedup_stats(dataset, len(index) + len(duplicate_ids) + manual_duplicates, len(duplicate_ids), index.threshold, manual_duplicates)
+    db.commit()
+
+    if duplicate_ids:
+        logger.info(f"Dataset {dataset.id}: removed {len(duplicate_ids)} near-duplicate pairs")
+    return dataset.dedup_stats
+
+def filter_new_pairs(db: Session, dataset: Dataset, pairs: Iterable) -> List:
+    """
+    Écarte des paires à ajouter (objets avec question/answer) celles qui sont quasi
+    identiques à une paire du dataset ou à une paire précédente du lot. Le nombre de
+    paires écartées est len(pairs) - len(résultat).
+    """
+    pairs = list(pairs)
+    if not settings.DEDUP_ENABLED:
+        return pairs
+
+    index = NearDuplicateIndex()
+    build_dataset_index(db, dataset.id, index)
+    kept = [pair for pair in pairs if index.add(pair_text(pair.question, pair.answer))]
+    record_dedup_stats(dataset, len(pairs), len(pairs) - len(kept), index.threshold)
+    return kept
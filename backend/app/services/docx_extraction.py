@@ -0,0 +1,113 @@
+import re
+import zipfile
+from typing import Any, Dict, IO, List, Tuple
+
+from lxml import etree
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+MC = "{http://schemas.openxmlformats.org/markup-compatibility/2006}"
+
+# Éléments suivis pendant la lecture : paragraphes, cellules, lignes et tableaux, et le
+# contenu de repli (mc:Fallback) qui duplique les zones de texte des versions récentes
+_TRACKED_TAGS = (f"{W}p", f"{W}tc", f"{W}tr", f"{W}tbl", f"{MC}Fallback")
+_RUN_TEXT = {f"{W}t": None, f"{W}tab": "\t", f"{W}br": "\n", f"{W}cr": "\n"}
+_NOTE_PARTS = ("word/footnotes.xml", "word/endnotes.xml")
+_HEADER_FOOTER_RE = re.compile(r"^word/(header|footer)(\d*)\.xml$")
+
+def _paragraph_text(paragraph: etree._Element) -> str:
+    parts = []
+    for node in paragraph.iter(*_RUN_TEXT):
+        replacement = _RUN_TEXT[node.tag]
+        parts.append(node.text or "" if replacement is None else replacement)
+    return "".join(parts)
+
+def _release(element: etree._Element):
+    """Libère un élément traité et ses frères précédents : l'arbre reste de taille bornée."""
+    element.clear()
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+def _read_part(stream: IO[bytes], lines: List[str], keep_empty: bool) -> Tuple[int, int]:
+    """
+    Ajoute à `lines` le texte d'une partie XML du document lue en flux : une ligne par
+    paragraphe, une ligne par ligne de tableau (cellules séparées par " | "). Renvoie le
+    nombre de paragraphes et de tableaux lus.
+    """
+    # Contenu des cellules et lignes de tableau en cours ; vide hors tableau
+    containers: List[List[str]] = []
+    fallback_depth = 0
+    paragraph_count = table_count = 0
+    for event, element in etree.iterparse(stream, events=("start", "end"), tag=_TRACKED_TAGS, huge_tree=True):
+        tag = element.tag
+        if tag == f"{MC}Fallback":
+            fallback_depth += 1 if event == "start" else -1
+            if event == "end":
+                _release(element)
+            continue
+        if event == "start":
+            if tag in (f"{W}tc", f"{W}tr"):
+                containers.append([])
+            continue
+        if fallback_depth:
+            continue
+
+        if tag == f"{W}p":
+            text = _paragraph_text(element)
+            paragraph_count += 1
+            if containers:
+                containers[-1].append(text)
+            elif text or keep_empty:
+                lines.append(text)
+        elif tag == f"{W}tc":
+            cell = " ".join(text for text in containers.pop() if text)
+            containers[-1].append(cell)
+        elif tag == f"{W}tr":
+            cells = containers.pop()
+            row = " | ".join(cells) if any(cells) else ""
+            if containers:
+                containers[-1].append(row)
+            elif row:
+                lines.append(row)
+        elif tag == f"{W}tbl":
+            table_count += 1
+        # Les paragraphes d'une zone de texte sont libérés avant la fin du paragraphe qui
+        # la contient, qui n'en reprend donc pas le texte
+        _release(element)
+    return paragraph_count, table_count
+
+def extract_docx_text(file_path: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Texte d'un DOCX lu en flux avec lxml.iterparse, sans charger le modèle objet de
+    python-docx : corps du document (paragraphes et tableaux), notes de bas de page et de
+    fin, puis en-têtes et pieds de page (chaque texte distinct une seule fois). La mémoire
+    utilisée dépend de la taille du texte et non de celle du XML.
+    """
+    lines: List[str] = []
+    paragraph_count = table_count = 0
+    with zipfile.ZipFile(file_path) as archive:
+        names = set(archive.namelist())
+        header_footer_parts = sorted(
+            (match.group(1) == "footer", int(match.group(2) or 0), name)
+            for name in names if (match := _HEADER_FOOTER_RE.match(name))
+        )
+        parts = [("word/document.xml", True)]
+        parts += [(name, False) for name in _NOTE_PARTS if name in names]
+        for part_name, keep_empty in parts:
+            with archive.open(part_name) as stream:
+                paragraphs, tables = _read_part(stream, lines, keep_empty)
+            paragraph_count += paragraphs
+            table_count += tables
+
+        # Les en-têtes et pieds de page (première page, pages paires...) se répètent souvent
+        header_footer_lines: Dict[str, None] = {}
+        for _, _, part_name in header_footer_parts:
+            part_lines: List[str] = []
+            with archive.open(part_name) as stream:
+                _read_part(stream, part_lines, keep_empty=False)
+            header_footer_lines.update(dict.fromkeys(part_lines))
+        lines.extend(header_footer_lines)
+
+    metadata = {"paragraph_count": paragraph_count, "table_count": table_count}
+    return "\n".join(lines), metadata
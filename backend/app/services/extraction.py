@@ -0,0 +1,329 @@
+import csv
+import io
+import os
+import posixpath
+import re
+import zipfile
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+from loguru import logger
+from lxml import etree
+from sqlalchemy.orm import Session
+
+from app.models.content import Content
+from app.models.stored_blob import StoredBlob
+from app.services.content_processor import content_processor
+from app.services.docx_extraction import extract_docx_text
+from app.services.pdf_extraction import extract_pdf_text
+from app.services.storage import storage_service
+
+# Un extracteur reçoit le contenu et renvoie (texte, métadonnées propres au format)
+Extractor = Callable[[Content], Tuple[str, Dict[str, Any]]]
+
+class ExtractionError(Exception):
+    """Le contenu ne peut pas être extrait ; le message est enregistré comme erreur du contenu."""
+
+class ExtractorRegistry:
+    """
+    Extracteurs de texte par type de contenu (type déclaré à l'envoi ou type MIME) et par
+    extension de fichier. L'extension prime : le type envoyé par le frontend est souvent
+    générique ("text" pour un .docx, sous-type MIME...).
+    """
+
+    def __init__(self):
+        self._by_type: Dict[str, Tuple[str, Extractor]] = {}
+        self._by_extension: Dict[str, Tuple[str, Extractor]] = {}
+
+    def register(self, name: str, types: Iterable[str] = (), extensions: Iterable[str] = ()) -> Callable[[Extractor], Extractor]:
+        """Décorateur enregistrant un extracteur sous le nom `name` pour ces types et extensions."""
+        def decorator(extract: Extractor) -> Extractor:
+            for content_type in types:
+                self._by_type[content_type.lower()] = (name, extract)
+            for extension in extensions:
+                self._by_extension[extension.lower()] = (name, extract)
+            return extract
+        return decorator
+
+    def resolve(self, content_type: Optional[str], file_path: Optional[str] = None) -> Optional[Tuple[str, Extractor]]:
+        """(nom, extracteur) d'un contenu, ou None si ni son extension ni son type ne sont pris en charge."""
+        extension = os.path.splitext(file_path)[1].lower() if file_path else ""
+        return self._by_extension.get(extension) or self._by_type.get((content_type or "").lower())
+
+# Create a singleton instance
+extractor_registry = ExtractorRegistry()
+
+def _clean_lines(lines: Iterable[str]) -> str:
+    """Lignes sans espaces superflus, au plus une ligne vide entre deux blocs de texte."""
+    cleaned: List[str] = []
+    for line in lines:
+        line = " ".join(line.split())
+        if line or (cleaned and cleaned[-1]):
+            cleaned.append(line)
+    return "\n".join(cleaned).strip()
+
+def _read_text_file(content: Content) -> str:
+    text = storage_service.get_file_content(content.file_path)
+    if text is None:
+        raise ExtractionError(f"Could not read the content of file {content.file_path}")
+    return text
+
+def _html_to_text(html: str) -> str:
+    soup = BeautifulSoup(html, "html.parser")
+    for element in soup(["script", "style", "noscript", "template", "head"]):
+        element.decompose()
+    return _clean_lines(soup.get_text("\n").splitlines())
+
+# Nombre de messages d'avancement consignés pendant l'extraction d'un PDF
+PDF_PROGRESS_STEPS = 10
+
+def _pdf_progress_logger(content: Content) -> Callable[[int, int, str], None]:
+    """
+    Rappel on_page de extract_pdf_text : consigne l'avancement de l'extraction d'un PDF
+    par dixièmes de ses pages, pour suivre les gros documents dans les logs du worker.
+    """
+    extracted_characters = 0
+
+    def on_page(page_number: int, page_count: int, text: str):
+        nonlocal extracted_characters
+        extracted_characters += len(text)
+        if page_count >= PDF_PROGRESS_STEPS and page_number % (page_count // PDF_PROGRESS_STEPS) == 0:
+            logger.info(f"Content {content.id}: {page_number}/{page_count} PDF pages extracted ({extracted_characters} characters)")
+    return on_page
+
+@extractor_registry.register("pdf", types=["pdf", "application/pdf"], extensions=[".pdf"])
+def extract_pdf(content: Content) -> Tuple[str, Dict[str, Any]]:
+    return extract_pdf_text(content.file_path, on_page=_pdf_progress_logger(content))
+
+@extractor_registry.register(
+    "docx",
+    types=["docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document", "vnd.openxmlformats-officedocument.wordprocessingml.document"],
+    extensions=[".docx"],
+)
+def extract_docx(content: Content) -> Tuple[str, Dict[str, Any]]:
+    return extract_docx_text(content.file_path)
+
+@extractor_registry.register("doc", types=["application/msword", "msword"], extensions=[".doc"])
+def reject_doc(content: Content) -> Tuple[str, Dict[str, Any]]:
+    raise ExtractionError("Le format .doc n'est pas supporté. Veuillez convertir en .docx ou .pdf.")
+
+@extractor_registry.register(
+    "text",
+    types=["text", "txt", "md", "markdown", "plain", "text/plain", "text/markdown"],
+    extensions=[".txt", ".md", ".markdown"],
+)
+def extract_text(content: Content) -> Tuple[str, Dict[str, Any]]:
+    return _read_text_file(content), {}
+
+@extractor_registry.register("html", types=["html", "text/html"], extensions=[".html", ".htm", ".xhtml"])
+def extract_html(content: Content) -> Tuple[str, Dict[str, Any]]:
+    return _html_to_text(_read_text_file(content)), {}
+
+@extractor_registry.register("csv", types=["csv", "text/csv"], extensions=[".csv", ".tsv"])
+def extract_csv(content: Content) -> Tuple[str, Dict[str, Any]]:
+    """Une ligne de texte par enregistrement, chaque valeur précédée de sa colonne."""
+    data = _read_text_file(content)
+    try:
+        dialect = csv.Sniffer().sniff(data[:8192], delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    rows = csv.reader(io.StringIO(data), dialect)
+    header = [column.strip() for column in next(rows, [])]
+    lines = []
+    for row in rows:
+        cells = [
+            f"{header[index]}: {value.strip()}" if index < len(header) and header[index] else value.strip()
+            for index, value in enumerate(row) if value.strip()
+        ]
+        if cells:
+            lines.append(", ".join(cells))
+    return "\n".join(lines), {"row_count": len(lines), "columns": header}
+
+_SUBTITLE_TIMING_RE = re.compile(r"^(\d+:)?\d+:\d+[.,]\d+\s*-->")
+_SUBTITLE_TAG_RE = re.compile(r"<[^>]+>|\{\\[^}]*\}")
+
+@extractor_registry.register(
+    "subtitles",
+    types=["srt", "vtt", "subtitles", "text/vtt", "application/x-subrip", "x-subrip"],
+    extensions=[".srt", ".vtt"],
+)
+def extract_subtitles(content: Content) -> Tuple[str, Dict[str, Any]]:
+    """
+    Texte des sous-titres SRT / WebVTT, sans numéros, minutages, balises ni blocs NOTE /
+    STYLE ; une ligne répétée d'un sous-titre au suivant n'est gardée qu'une fois.
+    """
+    lines: List[str] = []
+    cue_count = 0
+    in_cue = False
+    skipping_block = False
+    for raw_line in _read_text_file(content).splitlines():
+        line = raw_line.strip().lstrip("﻿")
+        if not line:
+            in_cue = skipping_block = False
+            continue
+        if skipping_block or line.startswith("WEBVTT"):
+            continue
+        if line.startswith(("NOTE", "STYLE", "REGION")) and not in_cue:
+            skipping_block = True
+            continue
+        if _SUBTITLE_TIMING_RE.match(line):
+            in_cue = True
+            cue_count += 1
+            continue
+        if not in_cue:
+            # Numéro ou identifiant du sous-titre suivant
+            continue
+        text = " ".join(_SUBTITLE_TAG_RE.sub("", line).split())
+        if text and (not lines or lines[-1] != text):
+            lines.append(text)
+    return "\n".join(lines), {"cue_count": cue_count}
+
+_DRAWING_NS = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+_SLIDE_RE = re.compile(r"^ppt/slides/slide(\d+)\.xml$")
+
+def _drawing_paragraphs(xml: bytes) -> List[str]:
+    root = etree.fromstring(xml)
+    return ["".join(node.text or "" for node in paragraph.iter(f"{_DRAWING_NS}t")) for paragraph in root.iter(f"{_DRAWING_NS}p")]
+
+@extractor_registry.register(
+    "pptx",
+    types=["pptx", "application/vnd.openxmlformats-officedocument.presentationml.presentation", "vnd.openxmlformats-officedocument.presentationml.presentation"],
+    extensions=[".pptx"],
+)
+def extract_pptx(content: Content) -> Tuple[str, Dict[str, Any]]:
+    """Texte des diapositives dans l'ordre, suivi de leurs notes, une ligne par paragraphe."""
+    with zipfile.ZipFile(content.file_path) as archive:
+        slides = sorted(
+            (int(match.group(1)), name) for name in archive.namelist() if (match := _SLIDE_RE.match(name))
+        )
+        blocks = []
+        for number, name in slides:
+            lines = _drawing_paragraphs(archive.read(name))
+            notes_name = f"ppt/notesSlides/notesSlide{number}.xml"
+            if notes_name in archive.namelist():
+                lines += _drawing_paragraphs(archive.read(notes_name))
+            blocks.append(_clean_lines(lines))
+    return "\n\n".join(block for block in blocks if block), {"slide_count": len(slides)}
+
+_CONTAINER_NS = {"container": "urn:oasis:names:tc:opendocument:xmlns:container"}
+_OPF_NS = {"opf": "http://www.idpf.org/2007/opf"}
+
+def _epub_documents(archive: zipfile.ZipFile) -> List[str]:
+    """Documents XHTML d'un EPUB dans l'ordre de lecture (spine), ou par nom sans manifeste lisible."""
+    try:
+        container = etree.fromstring(archive.read("META-INF/container.xml"))
+        opf_path = container.find(".//container:rootfile", _CONTAINER_NS).get("full-path")
+        opf = etree.fromstring(archive.read(opf_path))
+        base = posixpath.dirname(opf_path)
+        manifest = {item.get("id"): item.get("href") for item in opf.iterfind(".//opf:manifest/opf:item", _OPF_NS)}
+        return [
+            posixpath.normpath(posixpath.join(base, manifest[itemref.get("idref")]))
+            for itemref in opf.iterfind(".//opf:spine/opf:itemref", _OPF_NS)
+            if itemref.get("idref") in manifest
+        ]
+    except (KeyError, AttributeError, etree.XMLSyntaxError) as e:
+        logger.warning(f"EPUB without a readable spine, reading its documents by name: {str(e)}")
+        return sorted(name for name in archive.namelist() if name.lower().endswith((".xhtml", ".html", ".htm")))
+
+@extractor_registry.register("epub", types=["epub", "application/epub+zip", "epub+zip"], extensions=[".epub"])
+def extract_epub(content: Content) -> Tuple[str, Dict[str, Any]]:
+    with zipfile.ZipFile(content.file_path) as archive:
+        names = set(archive.namelist())
+        documents = [name for name in _epub_documents(archive) if name in names]
+        chapters = [_html_to_text(archive.read(name).decode("utf-8", errors="replace")) for name in documents]
+    return "\n\n".join(chapter for chapter in chapters if chapter), {"chapter_count": len(documents)}
+
+@extractor_registry.register("youtube", types=["youtube"])
+def extract_youtube(content: Content) -> Tuple[str, Dict[str, Any]]:
+    transcript, metadata = content_processor.process_youtube_content(content.url)
+    if transcript is None:
+        raise ExtractionError(f"Could not extract transcript from YouTube video {content.url}")
+    return transcript, metadata or {}
+
+@extractor_registry.register("website", types=["website"])
+def extract_website(content: Content) -> Tuple[str, Dict[str, Any]]:
+    # Le texte d'une page web est extrait par le frontend et enregistré à la création du contenu
+    text = content.content_text or content.description or ""
+    if not text:
+        raise ExtractionError("Website content has no text to process")
+    return text, {}
+
+def resolve_content_extractor(content: Content) -> Optional[Tuple[str, Extractor]]:
+    """
+    (nom, extracteur) d'un contenu. Les fichiers stockés sous leur SHA-256 n'ont pas
+    d'extension : celle du nom d'origine du fichier est alors utilisée.
+    """
+    file_name = content.file_path
+    if file_name and not os.path.splitext(file_name)[1]:
+        file_name = (content.content_metadata or {}).get("original_name") or file_name
+    return extractor_registry.resolve(content.type, file_name)
+
+def complete_content(content: Content, extractor_name: str, text: str, metadata: Dict[str, Any]) -> int:
+    """Enregistre le texte extrait, les métadonnées et le statut "completed" ; renvoie le nombre de caractères."""
+    character_count = len(text)
+    content.content_text = text
+    content.content_metadata = {
+        **(content.content_metadata or {}),
+        **metadata,
+        "character_count": character_count,
+        "is_exact_count": True,
+        "extractor": extractor_name,
+    }
+    content.status = "completed"
+    content.error_message = None
+    return character_count
+
+def reuse_blob_extraction(content: Content, blob: Optional[StoredBlob]) -> bool:
+    """
+    Complète le contenu avec le texte déjà extrait de son fichier (même SHA-256) par le
+    même extracteur, sans relire le fichier. Renvoie False s'il n'y en a pas.
+    """
+    resolved = resolve_content_extractor(content)
+    if blob is None or resolved is None or blob.extracted_text is None or blob.extractor != resolved[0]:
+        return False
+    metadata = {**(blob.extraction_metadata or {}), "reused_extraction": True}
+    complete_content(content, resolved[0], blob.extracted_text, metadata)
+    return True
+
+def extract_content(db: Session, content_id: int) -> Dict[str, Any]:
+    """
+    Extrait le texte d'un contenu avec l'extracteur de son extension ou de son type, en une
+    lecture et une écriture : le contenu est lu une fois, puis son texte, ses métadonnées et
+    son statut ("completed" ou "error") sont écrits par un seul UPDATE. Pour un fichier
+    stocké par SHA-256, le texte déjà extrait du même fichier est réutilisé, et sinon le
+    texte extrait est gardé avec le fichier pour les envois suivants.
+    """
+    content = db.query(Content).filter(Content.id == content_id).first()
+    if not content:
+        logger.error(f"Content {content_id} not found")
+        return {"status": "error", "message": "Content not found"}
+
+    sha256 = (content.content_metadata or {}).get("sha256")
+    blob = db.get(StoredBlob, sha256) if sha256 else None
+    if reuse_blob_extraction(content, blob):
+        db.commit()
+        logger.info(f"Content {content_id} reused the text already extracted from blob {sha256[:12]}")
+        return {"status": "success", "content_id": content_id, "character_count": len(content.content_text)}
+
+    resolved = resolve_content_extractor(content)
+    try:
+        if resolved is None:
+            raise ExtractionError(f"Unsupported content type: {content.type}")
+        extractor_name, extract = resolved
+        logger.info(f"Extracting content {content_id} ({content.type}) with the {extractor_name} extractor")
+        text, metadata = extract(content)
+    except Exception as e:
+        logger.error(f"Error extracting content {content_id}: {str(e)}")
+        content.status = "error"
+        content.error_message = str(e)
+        db.commit()
+        return {"status": "error", "message": str(e)}
+
+    character_count = complete_content(content, extractor_name, text, metadata)
+    if blob is not None:
+        blob.extractor = extractor_name
+        blob.extracted_text = text
+        blob.extraction_metadata = metadata
+    db.commit()
+    logger.info(f"Content {content_id} processed successfully with {character_count} characters")
+    return {"status": "success", "content_id": content_id, "character_count": character_count}
@@ -0,0 +1,85 @@
+import threading
+from typing import Dict, Optional
+
+from loguru import logger
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.qa_generation_stat import QAGenerationStat
+
+class GenerationOutcomes:
+    """
+    Compteurs des réponses de génération QA d'un provider et d'un modèle (appels, échecs
+    de parsing, paires) par mode de sortie, alimentés depuis plusieurs threads et reportés
+    dans la table qa_generation_stats par flush().
+    """
+    
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+        self._lock = threading.Lock()
+        self._counts: Dict[bool, Dict[str, int]] = {}
+    
+    def add(self, result: Optional[Dict]):
+        """
+        Compte une réponse de generate_qa_pairs_detailed (None : requête échouée, non comptée).
+        """
+        if result is None:
+            return
+        key = bool(result.get("structured"))
+        with self._lock:
+            counts = self._counts.setdefault(key, {"calls": 0, "parse_failures": 0, "pairs": 0})
+            counts["calls"] += 1
+            counts["parse_failures"] += 0 if result.get("parse_ok") else 1
+            counts["pairs"] += len(result.get("pairs") or [])
+    
+    def summary(self) -> Dict[str, int]:
+        """Totaux tous providers confondus, pour le résultat des tâches."""
+        with self._lock:
+            totals = {"calls": 0, "parse_failures": 0, "pairs": 0}
+            for counts in self._counts.values():
+                for name, value in counts.items():
+                    totals[name] += value
+        return totals
+    
+    def flush(self, db: Session):
+        """
+        Ajoute les compteurs accumulés aux lignes de qa_generation_stats puis les remet à zéro.
+        Un échec d'écriture est journalisé sans interrompre la génération.
+        """
+        with self._lock:
+            pending, self._counts = self._counts, {}
+        
+        provider, model = self.provider, self.model
+        for structured, counts in pending.items():
+            try:
+                try:
+                    if not self._increment(db, provider, model, structured, counts):
+                        db.add(QAGenerationStat(provider=provider, model=model, structured=structured, **counts))
+                    db.commit()
+                except IntegrityError:
+                    # Ligne créée entre-temps par un autre worker : elle existe désormais
+                    db.rollback()
+                    self._increment(db, provider, model, structured, counts)
+                    db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error recording QA generation stats for {provider}/{model}: {str(e)}")
+    
+    @staticmethod
+    def _increment(db: Session, provider: str, model: str, structured: bool, counts: Dict[str, int]) -> bool:
+        """Incrémente la ligne existante ; renvoie False si elle n'existe pas encore."""
+        return db.execute(
+            update(QAGenerationStat)
+            .where(
+                QAGenerationStat.provider == provider,
+                QAGenerationStat.model == model,
+                QAGenerationStat.structured == structured,
+            )
+            .values(
+                calls=QAGenerationStat.calls + counts["calls"],
+                parse_failures=QAGenerationStat.parse_failures + counts["parse_failures"],
+                pairs=QAGenerationStat.pairs + counts["pairs"],
+            )
+        ).rowcount > 0
@@ -0,0 +1,156 @@
+import importlib.util
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Tuple
+
+from loguru import logger
+
+from app.core.config import settings
+
+# Le modèle en processus n'est disponible que si transformers (et torch) sont installés
+TRANSFORMERS_AVAILABLE = importlib.util.find_spec("transformers") is not None
+
+# Réponse d'un modèle local : (texte, tokens du prompt, tokens générés)
+LocalCompletion = Tuple[str, int, int]
+
+class MicroBatcher:
+    """
+    Regroupe en lots les requêtes soumises depuis plusieurs threads et les traite dans un
+    thread dédié avec `run_batch` (liste de requêtes -> liste de résultats, dans l'ordre).
+
+    Un lot part dès qu'il atteint `max_batch_size` requêtes, ou `max_wait` secondes après
+    sa première requête. Sur CPU, générer N prompts ensemble coûte bien moins que N
+    générations successives : les threads de génération du dataset alimentent ainsi les lots.
+    """
+
+    def __init__(self, run_batch: Callable[[List[Any]], List[Any]], max_batch_size: int, max_wait: float):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self._pending: "deque[Tuple[Any, Future]]" = deque()
+        self._condition = threading.Condition()
+        self._worker = None
+        self._stats = {"batches": 0, "requests": 0, "peak_batch": 0}
+
+    def submit(self, item: Any) -> Any:
+        """Ajoute une requête au lot en cours et attend son résultat (les erreurs du lot sont propagées)."""
+        future = Future()
+        with self._condition:
+            self._pending.append((item, future))
+            # Le thread est (re)lancé à la demande, y compris dans un processus issu d'un fork
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="local-llm-batch", daemon=True)
+                self._worker.start()
+            self._condition.notify_all()
+        return future.result()
+
+    def _next_batch(self) -> List[Tuple[Any, Future]]:
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            deadline = time.monotonic() + self.max_wait
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            size = min(self.max_batch_size, len(self._pending))
+            batch = [self._pending.popleft() for _ in range(size)]
+            self._stats["batches"] += 1
+            self._stats["requests"] += size
+            self._stats["peak_batch"] = max(self._stats["peak_batch"], size)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                results = self.run_batch([item for item, _ in batch])
+            except Exception as e:
+                logger.error(f"Local model batch of {len(batch)} requests failed: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def summary(self) -> Dict[str, int]:
+        with self._condition:
+            return dict(self._stats)
+
+class TransformersChatModel:
+    """
+    Modèle de chat Hugging Face exécuté dans le processus (CPU par défaut) : un lot de
+    conversations est généré en un seul appel à generate(), prompts alignés à gauche.
+    """
+
+    def __init__(self, model_name: str, device: str = settings.LOCAL_LLM_DEVICE, max_new_tokens: int = settings.LOCAL_LLM_MAX_NEW_TOKENS, temperature: float = 0.7):
+        if not TRANSFORMERS_AVAILABLE:
+            raise RuntimeError("The in-process local model requires the transformers and torch packages (or set LOCAL_LLM_BASE_URL)")
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        self.torch = torch
+        self.device = device
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, padding_side="left")
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.model = AutoModelForCausalLM.from_pretrained(model_name).to(device)
+        self.model.eval()
+
+    def generate(self, conversations: List[List[Dict[str, str]]]) -> List[LocalCompletion]:
+        """Génère la réponse de chaque conversation (liste de messages role / content)."""
+        prompts = [
+            self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+            for messages in conversations
+        ]
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True, add_special_tokens=False).to(self.device)
+        sampling = {"do_sample": True, "temperature": self.temperature} if self.temperature > 0 else {"do_sample": False}
+        with self.torch.inference_mode():
+            outputs = self.model.generate(
+                **inputs, max_new_tokens=self.max_new_tokens, pad_token_id=self.tokenizer.pad_token_id, **sampling
+            )
+        prompt_length = inputs["input_ids"].shape[1]
+        completions = []
+        for output, attention_mask in zip(outputs, inputs["attention_mask"]):
+            generated = output[prompt_length:]
+            completions.append((
+                self.tokenizer.decode(generated, skip_special_tokens=True),
+                int(attention_mask.sum()),
+                int((generated != self.tokenizer.pad_token_id).sum()),
+            ))
+        return completions
+
+class LocalModelRunner:
+    """Modèle local derrière un MicroBatcher : chaque conversation rejoint le lot en cours."""
+
+    def __init__(self, model, max_batch_size: int = settings.LOCAL_LLM_BATCH_SIZE, max_wait: float = settings.LOCAL_LLM_BATCH_WAIT_MS / 1000):
+        self.model = model
+        self.batcher = MicroBatcher(model.generate, max_batch_size, max_wait)
+
+    def chat(self, messages: List[Dict[str, str]]) -> LocalCompletion:
+        return self.batcher.submit(messages)
+
+_runners: Dict[str, LocalModelRunner] = {}
+_runners_lock = threading.Lock()
+
+def get_local_runner(model_name: str) -> LocalModelRunner:
+    """
+    Runner du modèle `model_name` (nom Hugging Face ou chemin local), chargé une seule
+    fois par processus : le chargement prend plusieurs secondes et la mémoire du modèle.
+    """
+    with _runners_lock:
+        runner = _runners.get(model_name)
+        if runner is None:
+            logger.info(f"Loading local model {model_name} on {settings.LOCAL_LLM_DEVICE}")
+            runner = _runners[model_name] = LocalModelRunner(TransformersChatModel(model_name))
+        return runner
+
+# Un modèle chargé avant un fork n'est pas réutilisé par l'enfant (threads torch, thread de lots)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_runners.clear)
@@ -0,0 +1,209 @@
+import atexit
+import io
+import math
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import PyPDF2
+from loguru import logger
+
+from app.core.config import settings
+
+# Plages de pages par processus : des plages plus petites que page_count / workers
+# équilibrent la charge quand quelques pages (tableaux, scans vectorisés) sont lourdes
+RANGES_PER_WORKER = 4
+# Erreur associée à une page dont l'extraction a dépassé le délai
+PAGE_TIMEOUT_ERROR = "timeout"
+
+class PageTimeout(Exception):
+    """L'extraction d'une page a dépassé PDF_PAGE_TIMEOUT_SECONDS."""
+
+def _raise_page_timeout(signum, frame):
+    raise PageTimeout()
+
+def _page_timer_available() -> bool:
+    # SIGALRM n'existe pas sous Windows et ne peut être armé que depuis le thread principal
+    return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+def _iter_page_texts(reader: PyPDF2.PdfReader, start: int, end: int, page_timeout: float) -> Iterator[Tuple[str, Optional[str]]]:
+    """
+    (texte, erreur) des pages [start, end) ; une page en erreur ou hors délai donne un
+    texte vide, sans interrompre les suivantes.
+    """
+    timer = page_timeout > 0 and _page_timer_available()
+    previous_handler = signal.signal(signal.SIGALRM, _raise_page_timeout) if timer else None
+    try:
+        for page_number in range(start, end):
+            try:
+                if timer:
+                    signal.setitimer(signal.ITIMER_REAL, page_timeout)
+                try:
+                    text = reader.pages[page_number].extract_text() or ""
+                finally:
+                    if timer:
+                        signal.setitimer(signal.ITIMER_REAL, 0)
+            except PageTimeout:
+                yield "", PAGE_TIMEOUT_ERROR
+            except Exception as e:
+                yield "", str(e) or type(e).__name__
+            else:
+                yield text, None
+    finally:
+        if timer:
+            signal.signal(signal.SIGALRM, previous_handler)
+
+# Dernier PDF ouvert par un processus du pool : (chemin, date de modification, fichier, lecteur)
+_worker_pdf: Optional[Tuple[str, int, Any, PyPDF2.PdfReader]] = None
+
+def _get_worker_reader(file_path: str) -> PyPDF2.PdfReader:
+    """
+    Lecteur du PDF dans un processus du pool : le fichier est ouvert et sa table des objets
+    lue une seule fois pour toutes les plages qu'il y extrait ; seuls le chemin et les textes
+    transitent entre processus.
+    """
+    global _worker_pdf
+    modified = os.stat(file_path).st_mtime_ns
+    if _worker_pdf is None or _worker_pdf[:2] != (file_path, modified):
+        if _worker_pdf is not None:
+            _worker_pdf[2].close()
+        file = open(file_path, "rb")
+        _worker_pdf = (file_path, modified, file, PyPDF2.PdfReader(file))
+    return _worker_pdf[3]
+
+def extract_page_range(file_path: str, start: int, end: int, page_timeout: float) -> List[Tuple[str, Optional[str]]]:
+    """Extrait les pages [start, end) du PDF, depuis un processus du pool."""
+    return list(_iter_page_texts(_get_worker_reader(file_path), start, end, page_timeout))
+
+# Pool de processus d'extraction du processus courant (voir get_extraction_pool)
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    """
+    Pool de processus d'extraction, créé au premier PDF extrait en parallèle avec
+    PDF_EXTRACTION_WORKERS processus (par défaut un par cœur), puis réutilisé pour tous
+    les PDF du processus : le démarrage des processus n'est payé qu'une fois.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=settings.PDF_EXTRACTION_WORKERS or os.cpu_count() or 1)
+        return _pool
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """Oublie un pool dont un processus est mort : le prochain PDF en recrée un."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def shutdown_extraction_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def _reset_pool_after_fork():
+    # Le pool et ses processus appartiennent au parent ; le verrou, peut-être détenu par
+    # un thread du parent au moment du fork, est remplacé sans être pris
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+atexit.register(shutdown_extraction_pool)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+def get_extraction_workers(page_count: int) -> int:
+    """
+    Nombre de processus d'extraction pour un PDF de `page_count` pages : 1 (extraction dans
+    le processus courant) pour les petits PDF, ou depuis un processus démon (workers Celery
+    prefork) qui ne peut pas créer de processus enfants.
+    """
+    if page_count < max(2, settings.PDF_PARALLEL_MIN_PAGES):
+        return 1
+    if multiprocessing.current_process().daemon:
+        logger.warning("PDF pages extracted sequentially: daemon processes cannot start an extraction pool")
+        return 1
+    workers = settings.PDF_EXTRACTION_WORKERS or os.cpu_count() or 1
+    return max(1, min(workers, page_count))
+
+def get_page_ranges(page_count: int, workers: int) -> List[Tuple[int, int]]:
+    """Découpe [0, page_count) en plages consécutives, environ RANGES_PER_WORKER par processus."""
+    size = max(1, math.ceil(page_count / (workers * RANGES_PER_WORKER)))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+def iter_pdf_pages(file_path: str, page_count: int, workers: int = 1, page_timeout: float = settings.PDF_PAGE_TIMEOUT_SECONDS) -> Iterator[Tuple[int, str, Optional[str]]]:
+    """
+    Rend (index de page, texte, erreur) dans l'ordre des pages, au fur et à mesure : avec
+    plusieurs `workers`, les plages de pages sont extraites en parallèle par le pool de
+    processus partagé (voir get_extraction_pool) et chacune est rendue dès que les
+    précédentes le sont.
+    """
+    if workers <= 1:
+        with open(file_path, "rb") as file:
+            reader = PyPDF2.PdfReader(file)
+            for page_index, (text, error) in enumerate(_iter_page_texts(reader, 0, page_count, page_timeout)):
+                yield page_index, text, error
+        return
+
+    pool = get_extraction_pool()
+    futures = []
+    try:
+        for start, end in get_page_ranges(page_count, workers):
+            futures.append((start, pool.submit(extract_page_range, file_path, start, end, page_timeout)))
+        for start, future in futures:
+            for offset, (text, error) in enumerate(future.result()):
+                yield start + offset, text, error
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
+    finally:
+        # Extraction interrompue : les plages pas encore commencées sont abandonnées
+        for _, future in futures:
+            future.cancel()
+
+def extract_pdf_text(file_path: str, on_page: Optional[Callable[[int, int, str], None]] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Texte d'un PDF, chaque page suivie d'un saut de ligne, et métadonnées de l'extraction
+    (page_count, extraction_workers, et les numéros des pages laissées vides sur délai
+    dépassé ou erreur). `on_page(numéro de page, nombre de pages, texte)` reçoit chaque
+    page dans l'ordre dès qu'elle est extraite.
+
+    Raises:
+        Les erreurs d'ouverture du PDF ; celles d'une page sont seulement consignées.
+    """
+    with open(file_path, "rb") as file:
+        page_count = len(PyPDF2.PdfReader(file).pages)
+    workers = get_extraction_workers(page_count)
+    logger.info(f"Extracting {page_count} PDF pages from {file_path} with {workers} process(es)")
+
+    buffer = io.StringIO()
+    timed_out_pages: List[int] = []
+    failed_pages: List[int] = []
+    for page_index, text, error in iter_pdf_pages(file_path, page_count, workers, settings.PDF_PAGE_TIMEOUT_SECONDS):
+        page_number = page_index + 1
+        buffer.write(text)
+        buffer.write("\n")
+        if error == PAGE_TIMEOUT_ERROR:
+            logger.warning(f"PDF page {page_number} of {file_path} skipped after {settings.PDF_PAGE_TIMEOUT_SECONDS}s")
+            timed_out_pages.append(page_number)
+        elif error:
+            logger.warning(f"Error extracting PDF page {page_number} of {file_path}: {error}")
+            failed_pages.append(page_number)
+        if on_page is not None:
+            on_page(page_number, page_count, text)
+
+    metadata = {"page_count": page_count, "extraction_workers": workers}
+    if timed_out_pages:
+        metadata["timed_out_pages"] = timed_out_pages
+    if failed_pages:
+        metadata["failed_pages"] = failed_pages
+    return buffer.getvalue(), metadata
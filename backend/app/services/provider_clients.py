@@ -0,0 +1,214 @@
+import asyncio
+import hashlib
+import importlib.util
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+import httpx
+from anthropic import Anthropic, AsyncAnthropic
+from loguru import logger
+from openai import AsyncOpenAI, OpenAI
+
+from app.core.config import settings
+
+# HTTP/2 n'est activé que si le paquet h2 (extra httpx[http2]) est installé
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+def _http_client_options() -> Dict[str, Any]:
+    return {
+        "limits": httpx.Limits(
+            max_connections=settings.PROVIDER_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.PROVIDER_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.PROVIDER_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(settings.PROVIDER_HTTP_TIMEOUT, connect=settings.PROVIDER_HTTP_CONNECT_TIMEOUT),
+        "http2": settings.PROVIDER_HTTP2 and HTTP2_AVAILABLE,
+    }
+
+def build_http_client(**kwargs) -> httpx.Client:
+    """
+    Client httpx avec pool de connexions keep-alive, paramétré par les settings PROVIDER_HTTP_*.
+    """
+    return httpx.Client(**_http_client_options(), **kwargs)
+
+def build_async_http_client(**kwargs) -> httpx.AsyncClient:
+    """Équivalent asynchrone de build_http_client, pour les endpoints FastAPI."""
+    return httpx.AsyncClient(**_http_client_options(), **kwargs)
+
+class ProviderClientRegistry:
+    """
+    Clients des providers IA partagés dans le processus, par (provider, empreinte de la
+    clé API, URL de base) ; les clients asynchrones le sont en plus par boucle d'événements.
+
+    Chaque client garde son pool de connexions : les milliers d'appels d'une génération de
+    dataset réutilisent les mêmes connexions TCP/TLS au lieu d'en ouvrir une par requête.
+    Les clients httpx, OpenAI et Anthropic sont utilisables depuis plusieurs threads ; le
+    registre est vidé dans les processus enfants après un fork (workers Celery prefork),
+    les connexions ne devant pas être partagées entre processus.
+    """
+
+    def __init__(self, max_size: int = settings.PROVIDER_CLIENT_CACHE_SIZE):
+        self.max_size = max_size
+        self._clients: "OrderedDict[Tuple[str, str, str], Any]" = OrderedDict()
+        # Les connexions d'un client asynchrone appartiennent à la boucle qui les a ouvertes :
+        # ces clients sont rangés par boucle et oubliés avec elle
+        self._loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, OrderedDict]" = weakref.WeakKeyDictionary()
+        self._closing_tasks: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_fingerprint(api_key: Optional[str]) -> str:
+        """Empreinte de la clé API : la clé elle-même n'est jamais gardée comme clé du registre."""
+        return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:32]
+
+    def get(self, provider: str, api_key: Optional[str], base_url: Optional[str], factory: Callable[[], Any]) -> Any:
+        """
+        Renvoie le client en cache, ou le crée avec `factory`. Au-delà de `max_size` clients,
+        le moins récemment utilisé est oublié et fermé, ce qui libère ses connexions.
+        """
+        key = (provider, self.key_fingerprint(api_key), base_url or "")
+        evicted = None
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                return client
+            client = factory()
+            self._clients[key] = client
+            if len(self._clients) > self.max_size:
+                evicted = self._clients.popitem(last=False)[1]
+            logger.debug(f"Created pooled {provider} client ({len(self._clients)} cached)")
+        # Fermeture hors du verrou : elle peut attendre la fin des connexions
+        if evicted is not None:
+            self._close(evicted)
+        return client
+
+    def get_async(self, provider: str, api_key: Optional[str], base_url: Optional[str], factory: Callable[[], Any]) -> Any:
+        """
+        Comme get(), pour un client asynchrone lié à la boucle d'événements en cours
+        (à appeler depuis une coroutine). Un client oublié est fermé par une tâche de cette boucle.
+        """
+        loop = asyncio.get_running_loop()
+        key = (provider, self.key_fingerprint(api_key), base_url or "")
+        evicted = None
+        with self._lock:
+            clients = self._loop_clients.setdefault(loop, OrderedDict())
+            client = clients.get(key)
+            if client is not None:
+                clients.move_to_end(key)
+                return client
+            client = clients[key] = factory()
+            if len(clients) > self.max_size:
+                evicted = clients.popitem(last=False)[1]
+        if evicted is not None:
+            self._close_async(evicted, loop)
+        return client
+
+    @staticmethod
+    def _close(client: Any):
+        close = getattr(client, "close", None)
+        if close is None:
+            return
+        try:
+            close()
+        except Exception as e:
+            logger.warning(f"Failed to close evicted provider client: {e}")
+
+    def _close_async(self, client: Any, loop: asyncio.AbstractEventLoop):
+        # httpx.AsyncClient expose aclose(), les SDK OpenAI et Anthropic une coroutine close()
+        close = getattr(client, "aclose", None) or getattr(client, "close", None)
+        if close is None:
+            return
+        try:
+            closing = close()
+        except Exception as e:
+            logger.warning(f"Failed to close evicted provider client: {e}")
+            return
+        if asyncio.iscoroutine(closing):
+            # La boucle ne garde qu'une référence faible à ses tâches
+            task = loop.create_task(closing)
+            self._closing_tasks.add(task)
+            task.add_done_callback(self._closing_tasks.discard)
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+            self._loop_clients = weakref.WeakKeyDictionary()
+
+    def reset_after_fork(self):
+        """
+        Vide le registre dans un processus enfant juste après un fork, sans prendre le verrou :
+        un thread du parent pouvait le détenir au moment du fork, et ce thread n'existe pas
+        dans l'enfant pour le relâcher. Le verrou est remplacé par un verrou neuf.
+        """
+        self._lock = threading.Lock()
+        self._clients = OrderedDict()
+        self._loop_clients = weakref.WeakKeyDictionary()
+        self._closing_tasks = set()
+
+    def openai(self, api_key: str) -> OpenAI:
+        base_url = settings.OPENAI_BASE_URL or None
+        return self.get(
+            "openai", api_key, base_url,
+            lambda: OpenAI(api_key=api_key, base_url=base_url, http_client=build_http_client())
+        )
+
+    def anthropic(self, api_key: str) -> Anthropic:
+        base_url = settings.ANTHROPIC_BASE_URL or None
+        return self.get(
+            "anthropic", api_key, base_url,
+            lambda: Anthropic(api_key=api_key, base_url=base_url, http_client=build_http_client())
+        )
+
+    def mistral(self, api_key: str) -> httpx.Client:
+        base_url = settings.MISTRAL_BASE_URL
+        return self.get(
+            "mistral", api_key, base_url,
+            lambda: build_http_client(base_url=base_url, headers={"Authorization": f"Bearer {api_key}"})
+        )
+
+    def local(self, api_key: str) -> OpenAI:
+        """Client du serveur local compatible OpenAI (LOCAL_LLM_BASE_URL)."""
+        base_url = settings.LOCAL_LLM_BASE_URL
+        return self.get(
+            "local", api_key, base_url,
+            lambda: OpenAI(api_key=api_key, base_url=base_url, http_client=build_http_client())
+        )
+
+    def async_openai(self, api_key: str) -> AsyncOpenAI:
+        """Client asynchrone, à demander depuis la boucle d'événements qui l'utilisera."""
+        base_url = settings.OPENAI_BASE_URL or None
+        return self.get_async(
+            "openai", api_key, base_url,
+            lambda: AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=build_async_http_client())
+        )
+
+    def async_anthropic(self, api_key: str) -> AsyncAnthropic:
+        base_url = settings.ANTHROPIC_BASE_URL or None
+        return self.get_async(
+            "anthropic", api_key, base_url,
+            lambda: AsyncAnthropic(api_key=api_key, base_url=base_url, http_client=build_async_http_client())
+        )
+
+    def async_mistral(self, api_key: str) -> httpx.AsyncClient:
+        base_url = settings.MISTRAL_BASE_URL
+        return self.get_async(
+            "mistral", api_key, base_url,
+            lambda: build_async_http_client(base_url=base_url, headers={"Authorization": f"Bearer {api_key}"})
+        )
+
+    def async_local(self, api_key: str) -> AsyncOpenAI:
+        base_url = settings.LOCAL_LLM_BASE_URL
+        return self.get_async(
+            "local", api_key, base_url,
+            lambda: AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=build_async_http_client())
+        )
+
+# Create a singleton instance
+provider_clients = ProviderClientRegistry()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=provider_clients.reset_after_fork)
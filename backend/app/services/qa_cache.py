@@ -0,0 +1,168 @@
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Iterable
+
+from loguru import logger
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.qa_pair_cache import QAPairCacheEntry
+
+class QAPairCache:
+    """
+    Cache des paires QA générées, adressé par le contenu du chunk et les paramètres de génération.
+    
+    Deux datasets construits à partir des mêmes contenus, avec le même system_content,
+    le même modèle et la même version de prompt réutilisent les paires déjà payées.
+    """
+    
+    # Nombre maximum de clés par requête IN
+    LOOKUP_BATCH_SIZE = 500
+    
+    def __init__(self, enabled: bool = settings.QA_CACHE_ENABLED):
+        self.enabled = enabled
+    
+    def make_key(self, chunk_text: str, model: str, provider: str, system_content: str, prompt_version: str) -> str:
+        """
+        Calcule la clé de cache d'un chunk.
+        
+        Returns:
+            Empreinte SHA-256 hexadécimale.
+        """
+        digest = hashlib.sha256()
+        for part in (prompt_version, provider, model, system_content or "", chunk_text):
+            encoded = part.encode("utf-8")
+            # Préfixer la longueur évite les collisions par concaténation
+            digest.update(len(encoded).to_bytes(8, "big"))
+            digest.update(encoded)
+        return digest.hexdigest()
+    
+    def get_many(self, db: Session, keys: Iterable[str]) -> Dict[str, List[Dict]]:
+        """
+        Récupère les paires en cache pour plusieurs clés et met à jour leur date d'utilisation.
+        
+        Returns:
+            Dictionnaire clé -> liste de paires, limité aux clés présentes.
+        """
+        if not self.enabled:
+            return {}
+        
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, List[Dict]] = {}
+        try:
+            for start in range(0, len(keys), self.LOOKUP_BATCH_SIZE):
+                batch = keys[start:start + self.LOOKUP_BATCH_SIZE]
+                rows = db.query(QAPairCacheEntry.cache_key, QAPairCacheEntry.pairs).filter(
+                    QAPairCacheEntry.cache_key.in_(batch)
+                ).all()
+                for cache_key, pairs in rows:
+                    found[cache_key] = pairs
+            
+            if found:
+                hit_keys = list(found)
+                for start in range(0, len(hit_keys), self.LOOKUP_BATCH_SIZE):
+                    db.query(QAPairCacheEntry).filter(
+                        QAPairCacheEntry.cache_key.in_(hit_keys[start:start + self.LOOKUP_BATCH_SIZE])
+                    ).update(
+                        {
+                            QAPairCacheEntry.last_used_at: func.now(),
+                            QAPairCacheEntry.hit_count: QAPairCacheEntry.hit_count + 1,
+                        },
+                        synchronize_session=False,
+                    )
+                db.commit()
+        except Exception as e:
+            logger.error(f"Error reading QA pair cache: {str(e)}")
+            db.rollback()
+            return {}
+        
+        return found
+    
+    def get(self, db: Session, key: str) -> Optional[List[Dict]]:
+        """
+        Récupère les paires en cache pour une clé, ou None.
+        """
+        return self.get_many(db, [key]).get(key)
+    
+    def store(self, db: Session, key: str, pairs: List[Dict], provider: str, model: str, prompt_version: str) -> bool:
+        """
+        Enregistre les paires d'un chunk. Les listes vides ne sont pas mises en cache.
+        
+        Returns:
+            True si l'entrée a été créée.
+        """
+        if not self.enabled or not pairs:
+            return False
+        
+        stored_pairs = [{"question": p["question"], "answer": p["answer"]} for p in pairs]
+        db.add(QAPairCacheEntry(
+            cache_key=key,
+            provider=provider,
+            model=model,
+            prompt_version=prompt_version,
+            pairs=stored_pairs,
+            size_bytes=len(json.dumps(stored_pairs, ensure_ascii=False).encode("utf-8")),
+        ))
+        try:
+            db.commit()
+            return True
+        except IntegrityError:
+            # Une autre génération a déjà mis ce chunk en cache
+            db.rollback()
+            return False
+        except Exception as e:
+            logger.error(f"Error writing QA pair cache entry {key[:12]}: {str(e)}")
+            db.rollback()
+            return False
+    
+    def evict(self, db: Session) -> int:
+        """
+        Supprime les entrées plus anciennes que QA_CACHE_TTL_DAYS, puis les moins
+        récemment utilisées tant que la taille totale dépasse QA_CACHE_MAX_BYTES.
+        
+        Returns:
+            Nombre d'entrées supprimées.
+        """
+        if not self.enabled:
+            return 0
+        
+        try:
+            cutoff = datetime.now(timezone.utc) - timedelta(days=settings.QA_CACHE_TTL_DAYS)
+            removed = db.query(QAPairCacheEntry).filter(
+                QAPairCacheEntry.last_used_at < cutoff
+            ).delete(synchronize_session=False)
+            db.commit()
+            
+            total_size = db.query(func.coalesce(func.sum(QAPairCacheEntry.size_bytes), 0)).scalar() or 0
+            excess = total_size - settings.QA_CACHE_MAX_BYTES
+            if excess > 0:
+                to_delete = []
+                freed = 0
+                lru_entries = db.query(QAPairCacheEntry.cache_key, QAPairCacheEntry.size_bytes).order_by(
+                    QAPairCacheEntry.last_used_at.asc()
+                ).yield_per(1000)
+                for cache_key, size_bytes in lru_entries:
+                    to_delete.append(cache_key)
+                    freed += size_bytes or 0
+                    if freed >= excess:
+                        break
+                for start in range(0, len(to_delete), self.LOOKUP_BATCH_SIZE):
+                    removed += db.query(QAPairCacheEntry).filter(
+                        QAPairCacheEntry.cache_key.in_(to_delete[start:start + self.LOOKUP_BATCH_SIZE])
+                    ).delete(synchronize_session=False)
+                db.commit()
+            
+            if removed:
+                logger.info(f"Evicted {removed} QA pair cache entries")
+            return removed
+        
+        except Exception as e:
+            logger.error(f"Error evicting QA pair cache: {str(e)}")
+            db.rollback()
+            return 0
+
+# Create a singleton instance
+qa_pair_cache = QAPairCache()
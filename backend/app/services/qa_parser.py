@@ -0,0 +1,213 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import jsonschema
+from loguru import logger
+
+# Schéma des sorties structurées (JSON schema OpenAI, outil Anthropic, json_object Mistral)
+QA_PAIRS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "pairs": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "question": {"type": "string"},
+                    "answer": {"type": "string"}
+                },
+                "required": ["question", "answer"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["pairs"],
+    "additionalProperties": False
+}
+# Sortie d'une requête regroupant plusieurs chunks : chaque paire indique son chunk source
+QA_PACKED_PAIRS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "pairs": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "chunk": {"type": "integer"},
+                    "question": {"type": "string"},
+                    "answer": {"type": "string"}
+                },
+                "required": ["chunk", "question", "answer"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["pairs"],
+    "additionalProperties": False
+}
+_VALIDATOR = jsonschema.Draft7Validator(QA_PAIRS_SCHEMA)
+_PACKED_VALIDATOR = jsonschema.Draft7Validator(QA_PACKED_PAIRS_SCHEMA)
+
+# strict=False accepte les retours à la ligne bruts dans les chaînes, fréquents dans
+# les réponses des modèles
+_DECODER = json.JSONDecoder(strict=False)
+
+def _pair_from_object(obj: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    """
+    Convertit un objet au format ChatML (`messages`) ou plat (`question` / `answer`)
+    en paire QA, ou None si l'objet n'a aucun de ces formats.
+    """
+    messages = obj.get("messages")
+    if isinstance(messages, list):
+        question = answer = None
+        for message in messages:
+            if not isinstance(message, dict):
+                continue
+            if question is None and message.get("role") == "user":
+                question = message.get("content")
+            elif answer is None and message.get("role") == "assistant":
+                answer = message.get("content")
+        if isinstance(question, str) and isinstance(answer, str):
+            return {"question": question, "answer": answer}
+        return None
+
+    question = obj.get("question")
+    answer = obj.get("answer")
+    if isinstance(question, str) and isinstance(answer, str):
+        return {"question": question, "answer": answer}
+    return None
+
+def _collect_pairs(value: Any, pairs: List[Dict[str, str]]) -> bool:
+    """
+    Ajoute à `pairs` les paires trouvées dans une valeur JSON décodée (objet QA,
+    tableau d'objets, ou objet enveloppe comme {"pairs": [...]}).
+
+    Returns:
+        True si la valeur contenait au moins une paire.
+    """
+    if isinstance(value, dict):
+        pair = _pair_from_object(value)
+        if pair is not None:
+            pairs.append(pair)
+            return True
+        found = False
+        for item in value.values():
+            if isinstance(item, (dict, list)):
+                found = _collect_pairs(item, pairs) or found
+        return found
+    if isinstance(value, list):
+        found = False
+        for item in value:
+            found = _collect_pairs(item, pairs) or found
+        return found
+    return False
+
+def parse_qa_pairs(content: Optional[str], source: str = "LLM") -> List[Dict[str, str]]:
+    """
+    Extrait les paires QA d'une réponse de modèle, en un seul passage.
+
+    Le texte est parcouru d'accolade ouvrante en accolade ouvrante : à chacune,
+    JSONDecoder.raw_decode tente de décoder un objet complet. Un objet décodé fait
+    avancer le curseur jusqu'à sa fin ; un échec ne fait avancer que d'un caractère,
+    si bien que les objets valides contenus dans un tableau tronqué, un bloc de code
+    ```json, du JSONL ou du texte explicatif sont tous récupérés.
+
+    Chaque caractère n'est relu qu'autant de fois que d'objets invalides l'englobent, et
+    le parcours s'arrête à une chaîne jamais refermée (réponse tronquée) : le coût reste
+    linéaire en pratique, sans regex à retour arrière.
+
+    Args:
+        content: Réponse brute du modèle
+        source: Nom du provider, pour les logs
+
+    Returns:
+        Liste de {"question": ..., "answer": ...}
+    """
+    if not content:
+        return []
+
+    logger.debug(f"Raw response from {source}: {content[:500]}...")
+
+    pairs: List[Dict[str, str]] = []
+    # Au-delà d'une chaîne jamais refermée, aucun objet avec une clé ne peut être décodé
+    limit = len(content)
+    position = content.find("{", 0, limit)
+    while position != -1:
+        try:
+            value, end = _DECODER.raw_decode(content, position)
+        except json.JSONDecodeError as e:
+            if e.msg.startswith("Unterminated string"):
+                limit = min(limit, e.pos)
+            position = content.find("{", position + 1, limit)
+            continue
+        if _collect_pairs(value, pairs):
+            position = content.find("{", end, limit)
+        else:
+            # Objet sans paire (message isolé, métadonnées) : chercher dans son contenu
+            position = content.find("{", position + 1, limit)
+
+    if pairs:
+        logger.info(f"Successfully extracted {len(pairs)} QA pairs from {source} response")
+    else:
+        logger.warning(f"No valid QA pairs found in {source} response. Content sample: {content[:200]}...")
+    return pairs
+
+def parse_structured_qa_pairs(payload: Union[str, Dict, None], source: str = "LLM") -> Tuple[List[Dict[str, str]], bool]:
+    """
+    Lit une sortie structurée (texte JSON ou objet déjà décodé) validée par QA_PAIRS_SCHEMA.
+
+    Si la sortie ne respecte pas le schéma, le texte est repassé à parse_qa_pairs.
+
+    Returns:
+        (paires, parse_ok) : parse_ok est faux si la réponse n'a donné aucune paire
+        exploitable, ou seulement via l'extraction de secours.
+    """
+    data = payload
+    if isinstance(payload, str):
+        try:
+            data = json.loads(payload, strict=False)
+        except ValueError:
+            data = None
+
+    if data is not None and _VALIDATOR.is_valid(data):
+        pairs = [{"question": item["question"], "answer": item["answer"]} for item in data["pairs"]]
+        logger.info(f"Extracted {len(pairs)} schema-validated QA pairs from {source} response")
+        return pairs, bool(pairs)
+
+    logger.warning(f"{source} structured output does not match the QA schema, falling back to text parsing")
+    text = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+    return parse_qa_pairs(text, source), False
+
+def parse_packed_qa_pairs(payload: Union[str, Dict, None], chunk_count: int, source: str = "LLM") -> Tuple[List[List[Dict[str, str]]], bool]:
+    """
+    Répartit par chunk source les paires d'une requête regroupant `chunk_count` chunks
+    (identifiants 1 à chunk_count), validées par QA_PACKED_PAIRS_SCHEMA.
+
+    Sans réponse conforme au schéma, aucune paire ne peut être attribuée à son chunk :
+    toutes les listes sont vides et l'appelant regénère les chunks un par un.
+
+    Returns:
+        (paires de chaque chunk, parse_ok)
+    """
+    groups: List[List[Dict[str, str]]] = [[] for _ in range(chunk_count)]
+    data = payload
+    if isinstance(payload, str):
+        try:
+            data = json.loads(payload, strict=False)
+        except ValueError:
+            data = None
+
+    if data is None or not _PACKED_VALIDATOR.is_valid(data):
+        logger.warning(f"{source} packed output does not match the packed QA schema, chunks will be generated one by one")
+        return groups, False
+
+    misattributed = 0
+    for item in data["pairs"]:
+        if 1 <= item["chunk"] <= chunk_count:
+            groups[item["chunk"] - 1].append({"question": item["question"], "answer": item["answer"]})
+        else:
+            misattributed += 1
+    if misattributed:
+        logger.warning(f"{misattributed} pair(s) from {source} refer to an unknown chunk and were skipped")
+    logger.info(f"Extracted {sum(len(group) for group in groups)} QA pairs for {chunk_count} packed chunks from {source} response")
+    return groups, any(groups)
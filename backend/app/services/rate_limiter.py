@@ -0,0 +1,263 @@
+import hashlib
+import random
+import re
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Mapping, Optional, Tuple
+
+import redis
+from loguru import logger
+
+from app.core.config import settings
+
+# Attente maximale entre deux tentatives d'acquisition : un blocage levé plus tôt par un
+# autre worker (ou un budget rechargé) est ainsi vu rapidement
+MAX_SLEEP_SECONDS = 5.0
+# Durée de vie des compteurs d'un (provider, clé API) inactif
+BUCKET_TTL_SECONDS = 600
+# Après une erreur Redis, les appels passent sans limitation pendant ce délai
+REDIS_RETRY_SECONDS = 30
+
+# Deux seaux à jetons (requêtes et tokens par minute) rechargés en continu, plus une date
+# de blocage posée par un 429 / Retry-After. Débite les deux seaux si tout est disponible,
+# sinon renvoie le temps d'attente en secondes. Les limites apprises des en-têtes du
+# provider (rpm_learned / tpm_learned) plafonnent les budgets configurés.
+_ACQUIRE_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local rpm = tonumber(ARGV[2])
+local tpm = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', key, 'requests', 'tokens', 'updated', 'blocked_until', 'rpm_learned', 'tpm_learned')
+local learned_rpm = tonumber(state[5])
+local learned_tpm = tonumber(state[6])
+if learned_rpm and learned_rpm > 0 and (rpm <= 0 or learned_rpm < rpm) then rpm = learned_rpm end
+if learned_tpm and learned_tpm > 0 and (tpm <= 0 or learned_tpm < tpm) then tpm = learned_tpm end
+local updated = tonumber(state[3]) or now
+local elapsed = math.max(0, now - updated)
+local blocked_until = tonumber(state[4]) or 0
+local wait = math.max(0, blocked_until - now)
+
+local requests = 0
+if rpm > 0 then
+  requests = math.min(rpm, (tonumber(state[1]) or rpm) + elapsed * rpm / 60)
+  if requests < 1 then wait = math.max(wait, (1 - requests) * 60 / rpm) end
+end
+local tokens = 0
+if tpm > 0 then
+  tokens = math.min(tpm, (tonumber(state[2]) or tpm) + elapsed * tpm / 60)
+  -- Une requête plus grosse que le budget attend un seau plein
+  cost = math.min(cost, tpm)
+  if tokens < cost then wait = math.max(wait, (cost - tokens) * 60 / tpm) end
+end
+
+if wait <= 0 then
+  requests = requests - 1
+  tokens = tokens - cost
+end
+redis.call('HSET', key, 'requests', requests, 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', key, tonumber(ARGV[5]))
+return tostring(wait)
+"""
+
+# Repousse la date de blocage (jamais en arrière)
+_BLOCK_SCRIPT = """
+local current = tonumber(redis.call('HGET', KEYS[1], 'blocked_until')) or 0
+local until_ts = tonumber(ARGV[1])
+if until_ts > current then redis.call('HSET', KEYS[1], 'blocked_until', until_ts) end
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+return 1
+"""
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+# En-têtes (restant, réinitialisation, limite) publiés par les providers
+RATE_LIMIT_HEADERS = (
+    ("x-ratelimit-remaining-requests", "x-ratelimit-reset-requests", "x-ratelimit-limit-requests", "rpm_learned"),
+    ("x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens", "x-ratelimit-limit-tokens", "tpm_learned"),
+    ("anthropic-ratelimit-requests-remaining", "anthropic-ratelimit-requests-reset", "anthropic-ratelimit-requests-limit", "rpm_learned"),
+    ("anthropic-ratelimit-tokens-remaining", "anthropic-ratelimit-tokens-reset", "anthropic-ratelimit-tokens-limit", "tpm_learned"),
+)
+
+class RateLimitTimeout(RuntimeError):
+    """Le budget du provider n'a pas pu être obtenu dans RATE_LIMIT_MAX_WAIT_SECONDS."""
+
+def parse_reset_seconds(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """
+    Convertit une échéance de limite en secondes à attendre : durée OpenAI ("6m0s",
+    "1.5s", "20ms"), nombre de secondes, ou date RFC 3339 / HTTP (Anthropic, Retry-After).
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    matches = _DURATION_RE.findall(value)
+    if matches and "".join(number + unit for number, unit in matches) == value:
+        return sum(float(number) * _DURATION_UNITS[unit] for number, unit in matches)
+    now = time.time() if now is None else now
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            reset_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+    if reset_at.tzinfo is None:
+        reset_at = reset_at.replace(tzinfo=timezone.utc)
+    return max(0.0, reset_at.timestamp() - now)
+
+def retry_after_seconds(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Délai demandé par les en-têtes retry-after-ms / Retry-After d'une réponse."""
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+    return parse_reset_seconds(headers.get("retry-after"))
+
+def get_error_status(error: BaseException) -> Tuple[Optional[int], Optional[Mapping[str, str]]]:
+    """
+    Code HTTP et en-têtes d'une erreur de SDK (openai / anthropic APIStatusError) ou
+    d'httpx (HTTPStatusError) ; (None, None) pour les autres erreurs.
+    """
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    return status, getattr(response, "headers", None)
+
+class ProviderRateLimiter:
+    """
+    Limiteur de débit distribué, partagé par tous les workers via Redis, par provider et
+    par clé API (la clé n'est stockée que sous forme d'empreinte).
+
+    Chaque appel réserve une requête et une estimation de ses tokens ; la réservation est
+    corrigée par settle() avec l'usage réel. Un 429 ou un en-tête de limite épuisée bloque
+    le (provider, clé) pour tous les workers jusqu'à l'échéance annoncée. Si Redis est
+    indisponible, les appels passent sans limitation.
+    """
+
+    def __init__(self, redis_url: str = settings.REDIS_URL, enabled: bool = settings.RATE_LIMIT_ENABLED):
+        self.redis_url = redis_url
+        self.enabled = enabled
+        self._client: Optional[redis.Redis] = None
+        self._scripts = {}
+        self._redis_down_until = 0.0
+
+    @property
+    def client(self) -> redis.Redis:
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.redis_url, socket_timeout=2, socket_connect_timeout=2)
+        return self._client
+
+    @property
+    def available(self) -> bool:
+        return self.enabled and time.monotonic() >= self._redis_down_until
+
+    def _run_script(self, source: str, key: str, *args):
+        script = self._scripts.get(source)
+        if script is None:
+            script = self._scripts[source] = self.client.register_script(source)
+        return script(keys=[key], args=list(args))
+
+    @staticmethod
+    def bucket_key(provider: str, api_key: Optional[str]) -> str:
+        fingerprint = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:32]
+        return f"ratelimit:{provider}:{fingerprint}"
+
+    @staticmethod
+    def budget(provider: str) -> Tuple[int, int]:
+        """(requêtes/minute, tokens/minute) configurés pour un provider ; 0 = pas de limite."""
+        limits = settings.PROVIDER_RATE_LIMITS.get(provider, {})
+        return int(limits.get("rpm", 0)), int(limits.get("tpm", 0))
+
+    def _redis_unavailable(self, error: Exception):
+        logger.warning(f"Redis unavailable, provider calls are not rate limited for {REDIS_RETRY_SECONDS}s: {str(error)}")
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+    def acquire(self, provider: str, api_key: Optional[str], tokens: int = 0) -> float:
+        """
+        Attend qu'une requête de `tokens` tokens estimés tienne dans le budget, puis la réserve.
+
+        Returns:
+            Le temps passé à attendre le budget, en secondes (0 si la requête est passée tout de suite).
+
+        Raises:
+            RateLimitTimeout: si l'attente dépasse RATE_LIMIT_MAX_WAIT_SECONDS.
+        """
+        rpm, tpm = self.budget(provider)
+        key = self.bucket_key(provider, api_key)
+        waited = 0.0
+        while self.available:
+            try:
+                wait = float(self._run_script(_ACQUIRE_SCRIPT, key, time.time(), rpm, tpm, tokens, BUCKET_TTL_SECONDS))
+            except redis.RedisError as e:
+                self._redis_unavailable(e)
+                break
+            if wait <= 0:
+                break
+            if waited + wait > settings.RATE_LIMIT_MAX_WAIT_SECONDS:
+                raise RateLimitTimeout(f"{provider} rate limit budget not available within {settings.RATE_LIMIT_MAX_WAIT_SECONDS}s")
+            # Un peu d'aléa évite que tous les workers en attente repartent ensemble
+            delay = min(wait, MAX_SLEEP_SECONDS) * random.uniform(1.0, 1.2)
+            time.sleep(delay)
+            waited += delay
+        return waited
+
+    def block(self, provider: str, api_key: Optional[str], seconds: float):
+        """Suspend les appels à un (provider, clé) pour tous les workers pendant `seconds`."""
+        if not self.available or seconds <= 0:
+            return
+        try:
+            self._run_script(_BLOCK_SCRIPT, self.bucket_key(provider, api_key), time.time() + seconds, BUCKET_TTL_SECONDS)
+            logger.info(f"{provider} rate limited, pausing calls for {seconds:.1f}s")
+        except redis.RedisError as e:
+            self._redis_unavailable(e)
+
+    def settle(self, provider: str, api_key: Optional[str], reserved_tokens: int, used_tokens: Optional[int]):
+        """Corrige la réservation de tokens avec l'usage réel renvoyé par le provider."""
+        if not self.available or used_tokens is None or used_tokens == reserved_tokens:
+            return
+        try:
+            self.client.hincrbyfloat(self.bucket_key(provider, api_key), "tokens", reserved_tokens - used_tokens)
+        except redis.RedisError as e:
+            self._redis_unavailable(e)
+
+    def observe(self, provider: str, api_key: Optional[str], headers: Optional[Mapping[str, Any]]):
+        """
+        Exploite les en-têtes de limite d'une réponse : retient les limites annoncées
+        (diminuées de RATE_LIMIT_HEADROOM) et bloque jusqu'à la réinitialisation d'une
+        limite épuisée.
+        """
+        if not self.available or not headers:
+            return
+        learned = {}
+        block_for = 0.0
+        for remaining_name, reset_name, limit_name, learned_field in RATE_LIMIT_HEADERS:
+            try:
+                limit = headers.get(limit_name)
+                if limit:
+                    learned[learned_field] = max(1, int(int(limit) * settings.RATE_LIMIT_HEADROOM))
+                remaining = headers.get(remaining_name)
+                if remaining is not None and int(remaining) <= 0:
+                    block_for = max(block_for, parse_reset_seconds(headers.get(reset_name)) or 1.0)
+            except ValueError:
+                continue
+        if learned:
+            try:
+                key = self.bucket_key(provider, api_key)
+                self.client.hset(key, mapping=learned)
+                self.client.expire(key, BUCKET_TTL_SECONDS)
+            except redis.RedisError as e:
+                self._redis_unavailable(e)
+        if block_for:
+            self.block(provider, api_key, block_for)
+
+# Create a singleton instance
+rate_limiter = ProviderRateLimiter()
@@ -1,11 +1,120 @@
+import codecs
+import hashlib
+import importlib.util
+import io
+import mmap
 import os
+import re
 import shutil
 from fastapi import UploadFile
 from loguru import logger
 import uuid
-from typing import Optional
+from typing import Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
 
 from app.core.config import settings
+from app.models.stored_blob import StoredBlob
+
+CHARSET_NORMALIZER_AVAILABLE = importlib.util.find_spec("charset_normalizer") is not None
+
+# Taille des blocs décodés à la lecture d'un fichier texte
+TEXT_READ_CHUNK_BYTES = 1024 * 1024
+# Taille des blocs lus et hachés à l'envoi d'un fichier
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# BOM -> encodage ; les BOM UTF-32 commencent comme ceux d'UTF-16 et sont testés avant
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+# Part minimale d'octets nuls aux positions impaires (ou paires) pour reconnaître de
+# l'UTF-16 little-endian (ou big-endian) sans BOM : un texte latin y a un octet nul sur deux
+UTF16_NUL_RATIO = 0.3
+# Caractères de contrôle supprimés du texte (tabulation et saut de ligne conservés)
+_CONTROL_CHARS_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+
+def detect_bomless_utf16(sample: bytes) -> Optional[str]:
+    """
+    "utf-16-le" ou "utf-16-be" si les octets nuls de l'échantillon se concentrent aux
+    positions impaires ou paires, None sinon.
+    """
+    pairs = len(sample) // 2
+    if pairs < 2:
+        return None
+    even_nuls = sample[0:pairs * 2:2].count(0) / pairs
+    odd_nuls = sample[1:pairs * 2:2].count(0) / pairs
+    if odd_nuls >= UTF16_NUL_RATIO and even_nuls < UTF16_NUL_RATIO / 10:
+        return "utf-16-le"
+    if even_nuls >= UTF16_NUL_RATIO and odd_nuls < UTF16_NUL_RATIO / 10:
+        return "utf-16-be"
+    return None
+
+def detect_encoding(sample: bytes) -> str:
+    """
+    Encodage d'un texte d'après ses premiers octets : BOM, puis UTF-16 sans BOM d'après la
+    position des octets nuls (ce texte se décode souvent aussi en UTF-8), puis UTF-8 s'il le
+    décode (un caractère coupé en fin d'échantillon est accepté), puis charset_normalizer en
+    préférant TEXT_PREFERRED_ENCODINGS parmi ses candidats, et à défaut le premier encodage préféré.
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    utf16_encoding = detect_bomless_utf16(sample)
+    if utf16_encoding:
+        return utf16_encoding
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    preferred = [codecs.lookup(encoding).name for encoding in settings.TEXT_PREFERRED_ENCODINGS]
+    if CHARSET_NORMALIZER_AVAILABLE:
+        from charset_normalizer import from_bytes
+        candidates = [codecs.lookup(match.encoding).name for match in from_bytes(sample)]
+        for encoding in preferred:
+            if encoding in candidates:
+                return encoding
+        if candidates:
+            return candidates[0]
+    return preferred[0] if preferred else "cp1252"
+
+def iter_normalized_text(data, encoding: str, chunk_size: int = TEXT_READ_CHUNK_BYTES):
+    """
+    Décode `data` (bytes ou mmap) bloc par bloc et rend le texte normalisé au fur et à
+    mesure : sauts de ligne en "\\n", caractères de contrôle supprimés, espaces de fin de
+    ligne retirés, au plus une ligne vide entre deux paragraphes. Les octets invalides
+    deviennent U+FFFD au lieu de faire échouer la lecture.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    pending = ""  # début de la dernière ligne, pas encore terminée
+    blank_lines = 0
+    offsets = range(0, len(data), chunk_size)
+    for index, offset in enumerate(offsets):
+        final = index == len(offsets) - 1
+        text = pending + decoder.decode(data[offset:offset + chunk_size], final=final)
+        # Un \r en fin de bloc peut être la première moitié d'un \r\n
+        carried_cr = "\r" if text.endswith("\r") and not final else ""
+        if carried_cr:
+            text = text[:-1]
+        lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        pending = "" if final else lines.pop() + carried_cr
+        out = []
+        for position, line in enumerate(lines):
+            line = _CONTROL_CHARS_RE.sub("", line).rstrip()
+            blank_lines = blank_lines + 1 if not line else 0
+            if blank_lines > 1:
+                continue
+            # La dernière ligne n'a de saut de ligne que si le fichier se termine par un saut de ligne
+            out.append(line if final and position == len(lines) - 1 else line + "\n")
+        yield "".join(out)
+
+class FileTooLargeError(Exception):
+    """Le fichier envoyé dépasse la taille maximale autorisée."""
 
 class StorageService:
     """Service for handling file storage.""" 
@@ -55,6 +164,109 @@ class StorageService:
         finally:
             file.file.close()
     
+    def get_blob_path(self, sha256: str) -> str:
+        """Path of the stored file with this SHA-256: <upload_dir>/blobs/<2 first chars>/<sha256>."""
+        return os.path.join(self.upload_dir, "blobs", sha256[:2], sha256)
+    
+    async def _write_hashed_upload(self, file: UploadFile, max_size: int) -> Tuple[str, int, str]:
+        """
+        Stream an upload to a temporary file, computing its SHA-256 and size on the way.
+        
+        Returns:
+            The SHA-256, the size in bytes and the temporary path.
+        
+        Raises:
+            FileTooLargeError: The upload is larger than max_size (nothing is kept).
+        """
+        temp_dir = os.path.join(self.upload_dir, "blobs", "tmp")
+        os.makedirs(temp_dir, exist_ok=True)
+        temp_path = os.path.join(temp_dir, str(uuid.uuid4()))
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(temp_path, "wb") as buffer:
+                while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                    size += len(chunk)
+                    if size > max_size:
+                        raise FileTooLargeError(f"File too large. Maximum size is {max_size / 1024 / 1024}MB")
+                    digest.update(chunk)
+                    buffer.write(chunk)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        finally:
+            await file.close()
+        return digest.hexdigest(), size, temp_path
+    
+    async def store_upload(self, db: Session, file: UploadFile, max_size: int = settings.MAX_UPLOAD_SIZE) -> StoredBlob:
+        """
+        Store an upload by content: identical files are kept once, under their SHA-256,
+        and their reference count is incremented for each content that uses them. The
+        increment is committed here: if the content cannot be saved afterwards, the caller
+        gives the reference back with release_blob.
+        
+        Args:
+            db: The database session (committed by this method).
+            file: The uploaded file.
+            max_size: The maximum size in bytes.
+        
+        Returns:
+            The stored blob, with the text already extracted from it if any.
+        
+        Raises:
+            FileTooLargeError: The upload is larger than max_size.
+        """
+        sha256, size, temp_path = await self._write_hashed_upload(file, max_size)
+        try:
+            for attempt in range(2):
+                blob = db.query(StoredBlob).filter(StoredBlob.sha256 == sha256).with_for_update().first()
+                if blob is None:
+                    blob = StoredBlob(sha256=sha256, file_path=self.get_blob_path(sha256), size=size, ref_count=1)
+                    db.add(blob)
+                else:
+                    blob.ref_count = StoredBlob.ref_count + 1
+                    blob.last_used_at = func.now()
+                if not os.path.exists(blob.file_path):
+                    os.makedirs(os.path.dirname(blob.file_path), exist_ok=True)
+                    os.replace(temp_path, blob.file_path)
+                try:
+                    db.commit()
+                    break
+                except IntegrityError:
+                    # Le même fichier a été enregistré en parallèle : on incrémente sa référence
+                    db.rollback()
+                    if attempt:
+                        raise
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        
+        db.refresh(blob)
+        logger.info(f"Upload stored as blob {sha256[:12]} ({size} bytes, {blob.ref_count} reference(s))")
+        return blob
+    
+    def release_blob(self, db: Session, sha256: str) -> Optional[str]:
+        """
+        Drop one reference to a stored file. The caller commits the session, then deletes
+        the returned file with delete_file: a rolled back deletion never loses the file.
+        
+        Args:
+            db: The database session.
+            sha256: The SHA-256 of the file.
+        
+        Returns:
+            The path of the file to delete once committed, if this was its last reference.
+        """
+        blob = db.query(StoredBlob).filter(StoredBlob.sha256 == sha256).with_for_update().first()
+        if blob is None:
+            logger.warning(f"Blob not found: {sha256}")
+            return None
+        if blob.ref_count > 1:
+            blob.ref_count = StoredBlob.ref_count - 1
+            return None
+        db.delete(blob)
+        return blob.file_path
+    
     def delete_file(self, file_path: str) -> bool:
         """
         Delete a file from storage.
@@ -99,9 +311,33 @@ class StorageService:
             logger.error(f"Error getting file size: {str(e)}")
             return None
     
+    def read_text_file(self, file_path: str) -> Tuple[str, str]:
+        """
+        Read a text file of any size and encoding.
+        
+        The encoding is detected on the first TEXT_ENCODING_SAMPLE_BYTES bytes, then the
+        memory-mapped file is decoded and normalized block by block (see
+        iter_normalized_text), so only the resulting text is held in memory.
+        
+        Args:
+            file_path: The path of the file.
+        
+        Returns:
+            The normalized text and the detected encoding.
+        """
+        with open(file_path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return "", "utf-8"
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                encoding = detect_encoding(data[:settings.TEXT_ENCODING_SAMPLE_BYTES])
+                buffer = io.StringIO()
+                for text in iter_normalized_text(data, encoding):
+                    buffer.write(text)
+        return buffer.getvalue(), encoding
+    
     def get_file_content(self, file_path: str) -> Optional[str]:
         """
-        Read and return the content of a file.
+        Read and return the content of a text file (see read_text_file).
         
         Args:
             file_path: The path of the file.
@@ -114,9 +350,9 @@ class StorageService:
                 logger.warning(f"File not found: {file_path}")
                 return None
                 
-            # Pour les fichiers texte, utiliser la méthode standard
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
+            text, encoding = self.read_text_file(file_path)
+            logger.info(f"Read {len(text)} characters from {file_path} ({encoding})")
+            return text
                 
         except Exception as e:
             logger.error(f"Error reading file {file_path}: {str(e)}")
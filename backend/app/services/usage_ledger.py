@@ -0,0 +1,209 @@
+import threading
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+from sqlalchemy import case, func, insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.dataset import Dataset, DatasetUsage
+
+# Nombre de chunks les moins efficaces (tokens par paire) renvoyés par summarize_dataset_usage
+INEFFICIENT_CHUNKS_LIMIT = 10
+
+def get_model_prices(model: Optional[str]) -> Optional[Dict[str, float]]:
+    """Tarif d'un modèle dans MODEL_TOKEN_PRICES, par nom exact ou plus long préfixe."""
+    if not model:
+        return None
+    prices = settings.MODEL_TOKEN_PRICES
+    if model in prices:
+        return prices[model]
+    matches = [name for name in prices if model.startswith(name)]
+    return prices[max(matches, key=len)] if matches else None
+
+def estimate_cost(model: Optional[str], prompt_tokens: Optional[int], completion_tokens: Optional[int], cached_tokens: Optional[int] = None) -> Optional[float]:
+    """
+    Coût estimé d'un appel en USD, None si le modèle n'a pas de tarif ou l'usage est inconnu.
+    Les `cached_tokens` (inclus dans `prompt_tokens`) sont comptés au tarif cached_prompt.
+    """
+    prices = get_model_prices(model)
+    if prices is None or prompt_tokens is None or completion_tokens is None:
+        return None
+    cached_tokens = min(cached_tokens or 0, prompt_tokens)
+    cached_price = prices.get("cached_prompt", prices["prompt"])
+    return (
+        (prompt_tokens - cached_tokens) * prices["prompt"]
+        + cached_tokens * cached_price
+        + completion_tokens * prices["completion"]
+    ) / 1_000_000
+
+class UsageLedger:
+    """
+    Appels de génération QA d'un dataset (tokens, latence, nouvelles tentatives, issue du
+    parsing), alimentés depuis plusieurs threads et écrits dans la table dataset_usage par
+    flush(), qui met aussi à jour les totaux de Dataset.token_usage.
+    """
+
+    def __init__(self, dataset_id: int, provider: str):
+        self.dataset_id = dataset_id
+        self.provider = provider
+        self._lock = threading.Lock()
+        self._entries: List[Dict[str, Any]] = []
+        # Appels écrits par stage() dont les totaux du dataset restent à recalculer
+        self._totals_stale = False
+
+    def add(self, chunk_index: int, result: Optional[Dict], model: Optional[str] = None):
+        """
+        Enregistre une réponse de generate_qa_pairs_detailed (None : requête échouée, ignorée).
+        `model` sert si le résultat n'indique pas le modèle utilisé.
+        """
+        if result is None:
+            return
+        model = result.get("model") or model or "unknown"
+        prompt_tokens = result.get("prompt_tokens")
+        completion_tokens = result.get("completion_tokens")
+        cached_tokens = result.get("cached_tokens")
+        latency = result.get("latency")
+        entry = {
+            "dataset_id": self.dataset_id,
+            "chunk_index": chunk_index,
+            "provider": self.provider,
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "latency_ms": int(latency * 1000) if latency is not None else None,
+            "retries": result.get("retries") or 0,
+            "parse_ok": bool(result.get("parse_ok")),
+            "pairs_count": len(result.get("pairs") or []),
+            "cost": estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens),
+        }
+        with self._lock:
+            self._entries.append(entry)
+
+    def stage(self, db: Session) -> List[Dict[str, Any]]:
+        """
+        Ajoute les appels accumulés à la transaction en cours, sans commit : ils sont écrits
+        avec le checkpoint du chunk (voir persist_chunk_pairs), et un crash ne perd pas l'usage
+        des chunks déjà enregistrés. Renvoie les appels ajoutés, à rendre avec restore() si
+        la transaction est annulée.
+        """
+        with self._lock:
+            pending, self._entries = self._entries, []
+        if not pending:
+            return pending
+        try:
+            db.execute(insert(DatasetUsage), pending)
+        except Exception:
+            self.restore(pending)
+            raise
+        self._totals_stale = True
+        return pending
+
+    def restore(self, entries: List[Dict[str, Any]]):
+        """Remet en attente des appels de stage() dont la transaction a été annulée."""
+        with self._lock:
+            self._entries[:0] = entries
+
+    def flush(self, db: Session):
+        """
+        Écrit les appels accumulés puis recalcule les totaux du dataset.
+        Un échec d'écriture est journalisé sans interrompre la génération.
+        """
+        with self._lock:
+            pending, self._entries = self._entries, []
+        if not pending and not self._totals_stale:
+            return
+        try:
+            if pending:
+                db.execute(insert(DatasetUsage), pending)
+                db.commit()
+            refresh_dataset_usage(db, self.dataset_id)
+            self._totals_stale = False
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error recording token usage for dataset {self.dataset_id}: {str(e)}")
+
+def _usage_columns():
+    return (
+        func.count(DatasetUsage.id).label("calls"),
+        func.coalesce(func.sum(DatasetUsage.prompt_tokens), 0).label("prompt_tokens"),
+        func.coalesce(func.sum(DatasetUsage.completion_tokens), 0).label("completion_tokens"),
+        func.coalesce(func.sum(DatasetUsage.cached_tokens), 0).label("cached_tokens"),
+        func.coalesce(func.sum(DatasetUsage.retries), 0).label("retries"),
+        func.coalesce(func.sum(case((DatasetUsage.parse_ok.is_(False), 1), else_=0)), 0).label("parse_failures"),
+        func.coalesce(func.sum(DatasetUsage.pairs_count), 0).label("pairs"),
+        func.avg(DatasetUsage.latency_ms).label("avg_latency_ms"),
+        func.sum(DatasetUsage.cost).label("cost"),
+    )
+
+def _usage_totals(row, pairs: Optional[int] = None) -> Dict[str, Any]:
+    """Totaux d'une ligne d'agrégat, avec les ratios par paire (`pairs` : paires retenues)."""
+    total_tokens = int(row.prompt_tokens) + int(row.completion_tokens)
+    pairs = row.pairs if pairs is None else pairs
+    cost = round(float(row.cost), 6) if row.cost is not None else None
+    return {
+        "calls": row.calls,
+        "prompt_tokens": int(row.prompt_tokens),
+        "completion_tokens": int(row.completion_tokens),
+        "total_tokens": total_tokens,
+        "cached_tokens": int(row.cached_tokens),
+        "retries": int(row.retries),
+        "parse_failures": int(row.parse_failures),
+        "pairs": int(pairs),
+        "avg_latency_ms": round(float(row.avg_latency_ms)) if row.avg_latency_ms is not None else None,
+        "estimated_cost": cost,
+        "tokens_per_pair": round(total_tokens / pairs, 1) if pairs else None,
+        "cost_per_pair": round(cost / pairs, 6) if pairs and cost is not None else None,
+    }
+
+def refresh_dataset_usage(db: Session, dataset_id: int) -> Optional[Dict[str, Any]]:
+    """Recalcule Dataset.token_usage à partir du registre (paires générées, avant dédoublonnage)."""
+    row = db.query(*_usage_columns()).filter(DatasetUsage.dataset_id == dataset_id).one()
+    totals = _usage_totals(row) if row.calls else None
+    db.query(Dataset).filter(Dataset.id == dataset_id).update({Dataset.token_usage: totals}, synchronize_session=False)
+    db.commit()
+    return totals
+
+def summarize_dataset_usage(db: Session, dataset: Dataset) -> Dict[str, Any]:
+    """
+    Détail de l'usage d'un dataset : totaux (ratios rapportés aux paires retenues si le
+    dataset est finalisé), répartition par modèle et chunks les plus coûteux par paire.
+    """
+    row = db.query(*_usage_columns()).filter(DatasetUsage.dataset_id == dataset.id).one()
+    by_model = (
+        db.query(DatasetUsage.provider, DatasetUsage.model, *_usage_columns())
+        .filter(DatasetUsage.dataset_id == dataset.id)
+        .group_by(DatasetUsage.provider, DatasetUsage.model)
+        .all()
+    )
+    total_tokens = func.coalesce(DatasetUsage.prompt_tokens, 0) + func.coalesce(DatasetUsage.completion_tokens, 0)
+    tokens_per_pair = total_tokens * 1.0 / case((DatasetUsage.pairs_count > 0, DatasetUsage.pairs_count), else_=1)
+    chunks = (
+        db.query(
+            DatasetUsage.chunk_index, DatasetUsage.model, total_tokens.label("total_tokens"),
+            DatasetUsage.pairs_count, DatasetUsage.parse_ok, DatasetUsage.cost,
+        )
+        .filter(DatasetUsage.dataset_id == dataset.id)
+        .order_by(tokens_per_pair.desc(), DatasetUsage.chunk_index)
+        .limit(INEFFICIENT_CHUNKS_LIMIT)
+        .all()
+    )
+    return {
+        "dataset_id": dataset.id,
+        "totals": _usage_totals(row, dataset.pairs_count if dataset.status == "ready" else None),
+        "by_model": [
+            {"provider": entry.provider, "model": entry.model, **_usage_totals(entry)} for entry in by_model
+        ],
+        "least_efficient_chunks": [
+            {
+                "chunk_index": chunk.chunk_index,
+                "model": chunk.model,
+                "total_tokens": int(chunk.total_tokens),
+                "pairs": chunk.pairs_count,
+                "parse_ok": chunk.parse_ok,
+                "estimated_cost": chunk.cost,
+            }
+            for chunk in chunks
+        ],
+    }
@@ -3,8 +3,6 @@ from loguru import logger
 from sqlalchemy.orm import Session
 import os
 import time
-import PyPDF2
-import docx
 import sys
 import tempfile
 import yt_dlp
@@ -24,335 +22,13 @@ from app.db.session import SessionLocal
 from app.models.content import Content
 from app.models.dataset import Dataset
 from app.models.fine_tuning import FineTuning
-from app.services.content_processor import content_processor
-from app.services.storage import storage_service
-
-@shared_task(name="process_pdf_content")
-def process_pdf_content(content_id: int):
-    """
-    Process a PDF content file.
-    """
-    logger.info(f"Processing PDF content {content_id}")
-    
-    # Create a new database session
-    db = SessionLocal()
-    
-    try:
-        # Get the content from the database
-        content = db.query(Content).filter(Content.id == content_id).first()
-        
-        if not content:
-            logger.error(f"Content {content_id} not found")
-            return {"status": "error", "message": "Content not found"}
-        
-        # Update content status to processing
-        content.status = "processing"
-        db.commit()
-        
-        # Extraire le texte du PDF
-        file_path = content.file_path
-        extracted_text = ""
-        
-        try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    extracted_text += page.extract_text() + "\n"
-        except Exception as extract_error:
-            logger.error(f"Error extracting text from PDF {file_path}: {str(extract_error)}")
-            content.status = "error"
-            content.error_message = f"Error extracting text: {str(extract_error)}"
-            db.commit()
-            return {"status": "error", "message": str(extract_error)}
-        
-        # Compter les caractères - méthode exacte
-        character_count = len(extracted_text)
-        logger.info(f"PDF content {content_id} has {character_count} characters")
-        
-        # --- CORRECTION: Sauvegarder le texte extrait dans la base de données ---
-        content.content_text = extracted_text
-        # --- FIN CORRECTION ---
-        
-        # Mettre à jour les métadonnées
-        if not content.content_metadata:
-            content.content_metadata = {}
-        
-        content.content_metadata["character_count"] = character_count
-        content.content_metadata["is_exact_count"] = True  # Indiquer que ce comptage est exact
-        content.content_metadata["page_count"] = len(pdf_reader.pages)
-        
-        # Update content status to processed
-        content.status = "completed"
-        
-        # --- AJOUT : Marquer explicitement les métadonnées comme modifiées ---
-        flag_modified(content, "content_metadata")
-        # --- FIN AJOUT ---
-        
-        db.commit()
-        logger.info(f"PDF content {content_id} status updated to 'completed'")
-        
-        # Vérifier que le statut a bien été mis à jour
-        updated_content = db.query(Content).filter(Content.id == content_id).first()
-        logger.info(f"PDF content {content_id} final status: {updated_content.status}")
-        logger.info(f"PDF content {content_id} processed successfully with {character_count} characters")
-        return {"status": "success", "content_id": content_id, "character_count": character_count}
-    
-    except Exception as e:
-        logger.error(f"Error processing PDF content {content_id}: {str(e)}")
-        
-        # Update content status to error
-        content = db.query(Content).filter(Content.id == content_id).first()
-        if content:
-            content.status = "error"
-            content.error_message = str(e)
-            db.commit()
-        
-        return {"status": "error", "message": str(e)}
-    
-    finally:
-        db.close()
-
-@shared_task(name="process_text_content")
-def process_text_content(content_id: int):
-    """
-    Process a text content file.
-    """
-    logger.info(f"Processing text content {content_id}")
-    
-    # Create a new database session
-    db = SessionLocal()
-    
-    try:
-        # Get the content from the database
-        content = db.query(Content).filter(Content.id == content_id).first()
-        
-        if not content:
-            logger.error(f"Content {content_id} not found")
-            return {"status": "error", "message": "Content not found"}
-        
-        # Update content status to processing
-        content.status = "processing"
-        db.commit()
-        
-        # Lire le contenu du fichier
-        file_path = content.file_path
-        extracted_text = storage_service.get_file_content(file_path)
-        
-        if extracted_text is None:
-            error_msg = f"Could not read the content of file {file_path}"
-            logger.error(error_msg)
-            content.status = "error"
-            content.error_message = error_msg
-            db.commit()
-            return {"status": "error", "message": error_msg}
-        
-        # --- CORRECTION: Sauvegarder le texte extrait dans la base de données ---
-        content.content_text = extracted_text
-        # --- FIN CORRECTION ---
-        
-        # Compter les caractères - méthode exacte
-        character_count = len(extracted_text)
-        logger.info(f"Text content {content_id} has {character_count} characters")
-        
-        # Mettre à jour les métadonnées
-        if not content.content_metadata:
-            content.content_metadata = {}
-        
-        content.content_metadata["character_count"] = character_count
-        content.content_metadata["is_exact_count"] = True  # Indiquer que ce comptage est exact
-        
-        # --- RETABLISSEMENT : Commiter directement depuis le worker ---
-        content.status = "completed"
-        
-        # --- AJOUT : Marquer explicitement les métadonnées comme modifiées ---
-        flag_modified(content, "content_metadata")
-        # --- FIN AJOUT ---
-        
-        db.commit()
-        logger.info(f"Text content {content_id} status updated to 'completed'")
-        
-        # --- AJOUT LOG DEBUG : Vérifier les métadonnées juste après commit ---
-        try:
-            # Créer une nouvelle session pour éviter les problèmes de cache de session
-            with SessionLocal() as post_commit_db:
-                content_after_commit = post_commit_db.query(Content).filter(Content.id == content_id).first()
-                if content_after_commit:
-                     logger.info(f"WORKER - Content {content_id} metadata APRES commit: {content_after_commit.content_metadata}")
-                else:
-                    logger.warning(f"WORKER - Impossible de relire le contenu {content_id} après commit.")
-        except Exception as log_err:
-            logger.error(f"WORKER - Erreur lors de la relecture post-commit pour {content_id}: {log_err}")
-        # --- FIN AJOUT LOG DEBUG ---
-        
-        # Vérifier que le statut a bien été mis à jour (optionnel mais utile pour debug)
-        updated_content = db.query(Content).filter(Content.id == content_id).first()
-        logger.info(f"Text content {content_id} final status: {updated_content.status}")
-        logger.info(f"Text content {content_id} processed successfully with {character_count} characters")
-        return {"status": "success", "content_id": content_id, "character_count": character_count}
-    
-    except Exception as e:
-        logger.error(f"Error processing text content {content_id}: {str(e)}")
-        
-        # Update content status to error
-        content = db.query(Content).filter(Content.id == content_id).first()
-        if content:
-            content.status = "error"
-            content.error_message = str(e)
-            db.commit()
-        
-        return {"status": "error", "message": str(e)}
-    
-    finally:
-        db.close()
-
-@shared_task(name="process_docx_content")
-def process_docx_content(content_id: int):
-    logger.info(f"Processing DOCX content {content_id}")
-    db = SessionLocal()
-    try:
-        content = db.query(Content).filter(Content.id == content_id).first()
-        if not content:
-            logger.error(f"Content {content_id} not found")
-            return {"status": "error", "message": "Content not found"}
-        content.status = "processing"
-        db.commit()
-        file_path = content.file_path
-        extracted_text = ""
-        try:
-            document = docx.Document(file_path)
-            for para in document.paragraphs:
-                extracted_text += para.text + "\n"
-        except Exception as file_error:
-            logger.error(f"Error processing DOCX file {file_path}: {file_error}")
-            content.status = "error"
-            content.error_message = str(file_error)
-            db.commit()
-            return {"status": "error", "message": str(file_error)}
-            
-        # --- CORRECTION: Sauvegarder le texte extrait dans la base de données ---
-        content.content_text = extracted_text
-        # --- FIN CORRECTION ---
-        
-        character_count = len(extracted_text)
-        logger.info(f"DOCX content {content_id} has {character_count} characters")
-        if not content.content_metadata:
-            content.content_metadata = {}
-        content.content_metadata["character_count"] = character_count
-        content.content_metadata["is_exact_count"] = True  # Indiquer que ce comptage est exact
-        content.status = "completed"
-        
-        # --- AJOUT : Marquer explicitement les métadonnées comme modifiées ---
-        flag_modified(content, "content_metadata")
-        # --- FIN AJOUT ---
-        
-        db.commit()
-        logger.info(f"DOCX content {content_id} status updated to 'completed'")
-        
-        # Vérifier que le statut a bien été mis à jour
-        updated_content = db.query(Content).filter(Content.id == content_id).first()
-        logger.info(f"DOCX content {content_id} final status: {updated_content.status}")
-        logger.info(f"DOCX content {content_id} processed successfully with {character_count} characters")
-        return {"status": "success", "content_id": content_id, "character_count": character_count}
-    except Exception as e:
-        logger.error(f"Error processing DOCX content {content_id}: {str(e)}")
-        content = db.query(Content).filter(Content.id == content_id).first()
-        if content:
-            content.status = "error"
-            content.error_message = str(e)
-            db.commit()
-        return {"status": "error", "message": str(e)}
-    finally:
-        db.close()
-
-@shared_task(name="process_youtube_content")
-def process_youtube_content(content_id: int):
-    """
-    Process YouTube content by extracting transcript and metadata.
-    """
-    logger.info(f"Processing YouTube content {content_id}")
-    
-    # Create a new database session
-    db = SessionLocal()
-    
-    try:
-        # Get the content from the database
-        content = db.query(Content).filter(Content.id == content_id).first()
-        
-        if not content:
-            logger.error(f"Content {content_id} not found")
-            return {"status": "error", "message": "Content not found"}
-        
-        # Update content status to processing
-        content.status = "processing"
-        db.commit()
-        
-        # Extraire la transcription et les métadonnées YouTube
-        youtube_url = content.url
-        # Utiliser la fonction corrigée qui retourne le texte et la source
-        transcript, metadata = content_processor.process_youtube_content(youtube_url)
-        
-        if transcript is None:
-            error_msg = f"Could not extract transcript from YouTube video {youtube_url}"
-            logger.error(error_msg)
-            content.status = "error"
-            content.error_message = error_msg
-            db.commit()
-            return {"status": "error", "message": error_msg}
-        
-        # --- CORRECTION : Sauvegarder le texte extrait ici --- 
-        content.content_text = transcript
-        # --- FIN CORRECTION ---
-        
-        # Compter les caractères
-        character_count = len(transcript)
-        logger.info(f"YouTube content {content_id} has {character_count} characters")
-        
-        # Mettre à jour les métadonnées
-        if not content.content_metadata:
-            content.content_metadata = {}
-        content.content_metadata["character_count"] = character_count
-        if metadata:
-            for key, value in metadata.items():
-                content.content_metadata[key] = value
-            if "duration_seconds" in metadata:
-                duration_min = metadata["duration_seconds"] / 60
-                estimated_chars = round(duration_min * 900)
-                logger.info(f"YouTube video duration: {duration_min:.1f} min, estimated chars at 900/min: {estimated_chars} vs actual: {character_count}")
-        
-        # Update content status to completed
-        content.status = "completed"
-        # Ajouter l'objet à la session avant commit
-        db.add(content)
-        
-        # --- AJOUT : Marquer explicitement les métadonnées comme modifiées ---
-        flag_modified(content, "content_metadata")
-        # --- FIN AJOUT ---
-        
-        db.commit()
-        
-        logger.info(f"YouTube content {content_id} processed successfully")
-        return {"status": "success", "content_id": content_id, "character_count": character_count}
-    
-    except Exception as e:
-        logger.error(f"Error processing YouTube content {content_id}: {str(e)}")
-        
-        # Update content status to error
-        content = db.query(Content).filter(Content.id == content_id).first()
-        if content:
-            content.status = "error"
-            content.error_message = str(e)
-            db.commit()
-        
-        return {"status": "error", "message": str(e)}
-    
-    finally:
-        db.close()
+from app.services.extraction import extract_content
 
 @shared_task(name="process_content")
 def process_content(content_id: int):
     """
-    Process content based on its type.
+    Extrait le texte d'un contenu avec l'extracteur de son format (voir
+    app.services.extraction) et l'enregistre avec son statut en une seule écriture.
     """
     logger.info(f"Processing content {content_id}")
     
@@ -360,79 +36,19 @@ def process_content(content_id: int):
     db = SessionLocal()
     
     try:
-        # Get the content from the database
-        content = db.query(Content).filter(Content.id == content_id).first()
-        
-        if not content:
-            logger.error(f"Content {content_id} not found")
-            return {"status": "error", "message": "Content not found"}
-        
-        # Route to the appropriate processing function based on content type
-        content_type = content.type.lower()
-        file_extension = os.path.splitext(content.file_path)[1].lower() if content.file_path else None
-        
-        logger.info(f"Routing content type: '{content_type}', extension: '{file_extension}'")
-        
-        # Traitement standard basé sur le type de contenu
-        if content_type == 'pdf':
-            return process_pdf_content(content_id)
-        elif content_type == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document' or file_extension == '.docx':
-            return process_docx_content(content_id)
-        # --- AJOUT : Rejeter explicitement .doc --- 
-        elif content_type == 'application/msword' or file_extension == '.doc':
-            error_msg = "Le format .doc n'est pas supporté. Veuillez convertir en .docx ou .pdf."
-            logger.error(f"Contenu {content_id}: {error_msg}")
-            content.status = "error"
-            content.error_message = error_msg
-            db.commit()
-            return {"status": "error", "message": error_msg}
-        # --- FIN AJOUT ---
-        elif content_type in ['text', 'txt', 'md', 'markdown']:
-            # Vérifier à nouveau .docx au cas où le type serait incorrect
-            if file_extension == '.docx':
-                return process_docx_content(content_id)
-            else:
-                return process_text_content(content_id)
-        elif content_type == 'youtube':
-            return process_youtube_content(content_id)
-        elif content_type == 'website':
-            # Website content should already have text stored.
-            text = content.content_text or content.description or ""
-            char_count = len(text)
-            if char_count == 0:
-                error_msg = "Website content has no text to process"
-                logger.error(error_msg)
-                content.status = "error"
-                content.error_message = error_msg
-                db.commit()
-                return {"status": "error", "message": error_msg}
-
-            # Update metadata
-            if not content.content_metadata:
-                content.content_metadata = {}
-            content.content_metadata["character_count"] = char_count
-            content.content_metadata["is_exact_count"] = True
-            content.status = "completed"
-            flag_modified(content, "content_metadata")
-            db.commit()
-            logger.info(f"Website content {content_id} marked completed with {char_count} characters")
-            return {"status": "success", "content_id": content_id, "character_count": char_count}
-
-        else:
-            error_msg = f"Unsupported content type: {content_type}"
-            logger.error(error_msg)
-            content.status = "error"
-            content.error_message = error_msg
-            db.commit()
-            return {"status": "error", "message": error_msg}
+        return extract_content(db, content_id)
     
     except Exception as e:
-        logger.error(f"Error determining content type for {content_id}: {str(e)}")
+        logger.error(f"Error processing content {content_id}: {str(e)}")
         return {"status": "error", "message": str(e)}
     
     finally:
         db.close()
 
+# Anciennes tâches par format : les messages déjà en file d'attente sont traités par le pipeline unique
+for legacy_task_name in ("process_pdf_content", "process_text_content", "process_docx_content", "process_youtube_content"):
+    shared_task(name=legacy_task_name)(process_content.run)
+
 @shared_task(name="transcribe_youtube_video", bind=True, max_retries=3)
 def transcribe_youtube_video(self, content_id: int):
     """
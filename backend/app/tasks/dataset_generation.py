@@ -1,42 +1,585 @@
-from celery import shared_task, Task
+from celery import shared_task, Task, group, chord
 from loguru import logger
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, update, func
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy.exc import IntegrityError
 import os
-import time
 import traceback
 import json
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List, Dict, Iterable, Iterator, Set, Tuple
 
 from app.db.session import SessionLocal
-from app.models.dataset import Dataset, DatasetPair, DatasetContent
+from app.models.dataset import Dataset, DatasetPair, DatasetContent, DatasetChunk
 from app.models.content import Content
-from app.services.ai_providers import get_ai_provider
+from app.services.ai_providers import get_ai_provider, get_qa_prompt_version, use_structured_output
+from app.services.qa_cache import qa_pair_cache
+from app.services.chunking import get_chunker, estimate_tokens
+from app.services.dedup import deduplicate_dataset_pairs, GENERATED_PAIR_SOURCE
+from app.services.generation_stats import GenerationOutcomes
+from app.services.concurrency import AdaptiveConcurrencyController
+from app.services.usage_ledger import UsageLedger
 from app.services.content_processor import content_processor
 from app.services.character_service import character_service
 from app.core.config import settings
 from app.models.fine_tuning import FineTuning
 from app.models.api_key import ApiKey
 
-# Taille de chunk fixée à 3000 caractères (non configurable)
-CHUNK_SIZE = 3000
+# Nombre de content_text chargés par requête lors de l'agrégation
+CONTENT_TEXT_PAGE_SIZE = 8
+# Mode threads : compteurs de parsing et totaux d'usage du dataset mis à jour tous les N chunks
+# (les appels eux-mêmes sont écrits avec le checkpoint de chaque chunk)
+USAGE_REFRESH_CHUNKS = 20
 # Modèle à utiliser (peut être paramétré)
 DEFAULT_MODEL = settings.DEFAULT_AI_MODEL
 
-def split_text_into_chunks(text, chunk_size=CHUNK_SIZE):
+def iter_dataset_documents(db: Session, content_ids: List[int], stats: Optional[Dict] = None) -> Iterator[Tuple[str, str]]:
     """
-    Découpe le texte en chunks d'une taille fixe de 3000 caractères.
+    Rend, contenu par contenu, le couple (en-tête, texte) des contenus d'un dataset.
+
+    Les métadonnées sont chargées sans la colonne content_text ; les textes sont lus par
+    pages de CONTENT_TEXT_PAGE_SIZE contenus, de sorte qu'au plus une page de textes est
+    en mémoire. `stats` (optionnel) reçoit les contenus utilisés et la longueur totale.
+    """
+    contents = (
+        db.query(Content)
+        .options(load_only(Content.id, Content.name, Content.status, Content.error_message))
+        .filter(Content.id.in_(content_ids))
+        .order_by(Content.id)
+        .all()
+    )
+    usable = []
+    for content in contents:
+        if content.status == 'error':
+            logger.warning(f"Skipping content {content.id} due to previous error: {content.error_message}")
+            continue
+        usable.append((content.id, content.name, content.status))
+
+    if stats is not None:
+        stats.setdefault("content_ids", [])
+        stats.setdefault("total_length", 0)
+
+    for start in range(0, len(usable), CONTENT_TEXT_PAGE_SIZE):
+        page = usable[start:start + CONTENT_TEXT_PAGE_SIZE]
+        texts = dict(
+            db.query(Content.id, Content.content_text)
+            .filter(Content.id.in_([content_id for content_id, _, _ in page]))
+            .all()
+        )
+        for content_id, name, status in page:
+            text = texts.pop(content_id, None)
+            if not text:
+                logger.warning(f"No text found in content {content_id} (status: {status}) despite being 'completed'.")
+                continue
+            header = f"\n\n--- Contenu {content_id}: {name} ---\n\n"
+            if stats is not None:
+                stats["content_ids"].append(content_id)
+                stats["total_length"] += len(header) + len(text)
+            yield header, text
+
+def get_default_model(provider_name: str) -> str:
+    """
+    Modèle utilisé pour un dataset sans modèle choisi : celui du provider local, ou DEFAULT_AI_MODEL.
+    """
+    return settings.LOCAL_LLM_MODEL if provider_name == "local" else DEFAULT_MODEL
+
+def get_generation_concurrency(provider_name: str) -> int:
+    """
+    Nombre d'appels generate_qa_pairs autorisés en parallèle pour un provider.
+    """
+    limit = settings.DATASET_GENERATION_CONCURRENCY.get(
+        provider_name, settings.DATASET_GENERATION_DEFAULT_CONCURRENCY
+    )
+    return max(1, int(limit))
+
+def generate_chunk_pairs(provider, chunk: str, model: str, system_content: str, chunk_number: int, total_chunks: int, outcomes: Optional[GenerationOutcomes] = None, controller: Optional[AdaptiveConcurrencyController] = None, ledger: Optional[UsageLedger] = None) -> Optional[List[Dict]]:
     """
-    if not text:
+    Génère les paires QA d'un chunk et ne garde que celles au bon format.
+    Retourne None si l'appel a échoué : le chunk n'est alors pas checkpointé et sera
+    retenté à la prochaine reprise. Les réponses reçues sont comptées dans `outcomes`
+    et leur usage (tokens, latence) inscrit dans `ledger`.
+    Avec un `controller`, l'appel attend une place dans sa fenêtre adaptative.
+    """
+    logger.info(f"Processing aggregated chunk {chunk_number}/{total_chunks}")
+    try:
+        if controller is not None:
+            result = controller.generate_qa_pairs_detailed(provider, chunk, model, system_content=system_content)
+        else:
+            result = provider.generate_qa_pairs_detailed(chunk, model, system_content=system_content)
+    except Exception as e:
+        logger.error(f"Error processing aggregated chunk {chunk_number}: {str(e)}")
+        logger.error(traceback.format_exc())
+        return None
+
+    if outcomes is not None:
+        outcomes.add(result)
+    if ledger is not None:
+        ledger.add(chunk_number - 1, result, model)
+    return filter_valid_pairs(result["pairs"], chunk_number)
+
+def filter_valid_pairs(qa_pairs: Optional[List], chunk_number: int) -> List[Dict]:
+    """
+    Ne garde que les paires au format {"question": ..., "answer": ...}.
+    """
+    if not qa_pairs:
+        logger.warning(f"No QA pairs generated for chunk {chunk_number}.")
         return []
-    return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+
+    valid_pairs = []
+    for pair in qa_pairs:
+        if isinstance(pair, dict) and "question" in pair and "answer" in pair:
+            valid_pairs.append(pair)
+        else:
+            logger.warning(f"Invalid QA pair format skipped: {pair}")
+
+    if valid_pairs:
+        logger.info(f"Generated {len(valid_pairs)} pairs for chunk {chunk_number}.")
+    else:
+        logger.warning(f"No valid QA pairs generated for chunk {chunk_number}.")
+    return valid_pairs
+
+def iter_chunk_packs(chunk_items: Iterable[Tuple[int, str]], cached_pairs: Dict[int, List[Dict]], max_chunks: int = 1, max_tokens: int = 0) -> Iterator[List[Tuple[int, str]]]:
+    """
+    Regroupe les chunks consécutifs à générer par paquets d'au plus `max_chunks` chunks
+    et `max_tokens` tokens estimés, envoyés en une seule requête. Les chunks du cache,
+    et tous les chunks si `max_chunks` vaut 1, forment des paquets d'un seul chunk.
+    """
+    pack: List[Tuple[int, str]] = []
+    pack_tokens = 0
+    for chunk_index, chunk in chunk_items:
+        if max_chunks <= 1 or chunk_index in cached_pairs:
+            if pack:
+                yield pack
+                pack, pack_tokens = [], 0
+            yield [(chunk_index, chunk)]
+            continue
+        tokens = estimate_tokens(chunk)
+        if pack and (len(pack) >= max_chunks or pack_tokens + tokens > max_tokens):
+            yield pack
+            pack, pack_tokens = [], 0
+        pack.append((chunk_index, chunk))
+        pack_tokens += tokens
+    if pack:
+        yield pack
+
+def generate_pack_pairs(provider, pack: List[Tuple[int, str]], model: str, system_content: str, total_chunks: int, outcomes: Optional[GenerationOutcomes] = None, controller: Optional[AdaptiveConcurrencyController] = None, ledger: Optional[UsageLedger] = None, packed_indexes: Optional[Set[int]] = None) -> List[Tuple[int, Optional[List[Dict]]]]:
+    """
+    Génère les paires d'un paquet de chunks (index, texte) en une requête, et les
+    rend par chunk comme generate_chunk_pairs. Un chunk auquel la réponse n'attribue
+    aucune paire (réponse illisible, chunk ignoré) est regénéré seul, dans la limite de
+    DATASET_PACK_MAX_SOLO_RETRIES chunks par paquet : les suivants sont rendus à None,
+    sans checkpoint, pour ne pas payer deux fois tout un paquet.
+
+    `packed_indexes` (optionnel) reçoit les index des chunks dont les paires viennent de
+    la requête groupée, et donc de son prompt (voir get_packed_qa_prompt_version).
+    """
+    if len(pack) == 1:
+        chunk_index, chunk = pack[0]
+        return [(chunk_index, generate_chunk_pairs(provider, chunk, model, system_content, chunk_index + 1, total_chunks, outcomes, controller, ledger))]
+
+    logger.info(f"Processing aggregated chunks {pack[0][0] + 1}-{pack[-1][0] + 1}/{total_chunks} in one request")
+    texts = [chunk for _, chunk in pack]
+    result = None
+    try:
+        if controller is not None:
+            result = controller.call(provider.generate_packed_qa_pairs_detailed, texts, model, system_content)
+        else:
+            result = provider.generate_packed_qa_pairs_detailed(texts, model, system_content)
+    except Exception as e:
+        logger.error(f"Error processing packed chunks {pack[0][0] + 1}-{pack[-1][0] + 1}: {str(e)}")
+        logger.error(traceback.format_exc())
+
+    if result is not None:
+        if outcomes is not None:
+            outcomes.add(result)
+        if ledger is not None:
+            # Une ligne par requête, rattachée au premier chunk du paquet
+            ledger.add(pack[0][0], result, model)
+    groups = result["pairs_by_chunk"] if result is not None else [[] for _ in pack]
+
+    chunk_pairs = []
+    solo_retries = 0
+    for (chunk_index, chunk), pairs in zip(pack, groups):
+        valid_pairs = filter_valid_pairs(pairs, chunk_index + 1) if pairs else []
+        if valid_pairs:
+            if packed_indexes is not None:
+                packed_indexes.add(chunk_index)
+        elif solo_retries < settings.DATASET_PACK_MAX_SOLO_RETRIES:
+            solo_retries += 1
+            valid_pairs = generate_chunk_pairs(provider, chunk, model, system_content, chunk_index + 1, total_chunks, outcomes, controller, ledger)
+        else:
+            logger.warning(f"Chunk {chunk_index + 1}/{total_chunks} got no pair from its pack and is left for the next run ({solo_retries} chunk(s) of the pack already regenerated alone)")
+            valid_pairs = None
+        chunk_pairs.append((chunk_index, valid_pairs))
+    return chunk_pairs
+
+def get_packed_qa_prompt_version() -> str:
+    """Version du prompt des requêtes groupées : toujours en sortie structurée et disposition cacheable."""
+    return get_qa_prompt_version(structured=True, cacheable=True)
+
+def iter_chunk_pairs(provider, chunk_items: Iterable[Tuple[int, str]], total_chunks: int, model: str, system_content: str, max_in_flight: int, cached_pairs: Optional[Dict[int, List[Dict]]] = None, outcomes: Optional[GenerationOutcomes] = None, controller: Optional[AdaptiveConcurrencyController] = None, ledger: Optional[UsageLedger] = None, pack_max_chunks: int = 1, pack_max_tokens: int = 0, packed_indexes: Optional[Set[int]] = None) -> Iterator[Tuple[int, Optional[List[Dict]]]]:
+    """
+    Appelle generate_qa_pairs sur les chunks (index, texte) de `chunk_items` avec au plus
+    `max_in_flight` requêtes en vol ; avec un `controller`, sa fenêtre adaptative limite
+    en plus le nombre d'appels réellement envoyés. Avec `pack_max_chunks` > 1, les petits
+    chunks consécutifs sont regroupés dans une même requête (voir iter_chunk_packs) ;
+    `packed_indexes` reçoit alors les chunks générés par une requête groupée.
+
+    Les résultats sont rendus dans l'ordre des chunks, quel que soit l'ordre de
+    fin des appels : la fenêtre avance sur le paquet le plus ancien, ce qui garde
+    la sortie déterministe et la mémoire bornée à `max_in_flight` paquets et résultats.
+    Les chunks présents dans `cached_pairs` sont rendus sans appel au provider.
+    """
+    cached_pairs = cached_pairs or {}
+    packs = iter_chunk_packs(chunk_items, cached_pairs, pack_max_chunks, pack_max_tokens)
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="qa-gen") as executor:
+        def submit(pack: List[Tuple[int, str]]) -> Future:
+            chunk_index = pack[0][0]
+            if chunk_index in cached_pairs:
+                future = Future()
+                future.set_result([(chunk_index, cached_pairs[chunk_index])])
+                return future
+            return executor.submit(
+                generate_pack_pairs, provider, pack, model,
+                system_content, total_chunks, outcomes, controller, ledger, packed_indexes
+            )
+
+        window = deque()
+        for pack in packs:
+            window.append(submit(pack))
+            if len(window) >= max_in_flight:
+                break
+        while window:
+            future = window.popleft()
+            next_pack = next(packs, None)
+            if next_pack is not None:
+                window.append(submit(next_pack))
+            yield from future.result()
+
+def compute_chunk_hash(chunk: str) -> str:
+    """
+    Empreinte SHA-256 d'un chunk, utilisée pour vérifier qu'un checkpoint correspond toujours au texte.
+    """
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+def persist_chunk_pairs(db: Session, dataset_id: int, chunk_index: int, chunk_hash: str, pairs: List[Dict], ledger: Optional[UsageLedger] = None) -> int:
+    """
+    Enregistre les paires d'un chunk, son checkpoint et l'avancement du dataset dans
+    une même transaction : les paires sont visibles dès que le chunk est terminé. Avec un
+    `ledger`, les appels qu'il a accumulés sont écrits dans la même transaction.
+
+    La contrainte unique (dataset_id, chunk_index) rend l'opération idempotente :
+    si le chunk a déjà été enregistré (tâche relancée en double), rien n'est ajouté.
+    Retourne le nombre de paires enregistrées.
+
+    Les paires sont insérées en une seule requête executemany (regroupée en INSERT
+    multi-lignes par SQLAlchemy), sans créer d'objet ORM.
+    """
+    metadata = {"aggregated_chunk_index": chunk_index, "chunk_hash": chunk_hash, "source": GENERATED_PAIR_SOURCE}
+    staged_usage: List[Dict] = []
+    try:
+        # Le checkpoint d'abord : un doublon échoue avant d'envoyer les paires
+        db.execute(insert(DatasetChunk).values(
+            dataset_id=dataset_id,
+            chunk_index=chunk_index,
+            chunk_hash=chunk_hash,
+            pairs_count=len(pairs)
+        ))
+        if ledger is not None:
+            staged_usage = ledger.stage(db)
+        if pairs:
+            db.execute(insert(DatasetPair), [
+                {
+                    "question": pair_data["question"],
+                    "answer": pair_data["answer"],
+                    "dataset_id": dataset_id,
+                    "pair_metadata": metadata,
+                }
+                for pair_data in pairs
+            ])
+        # Incréments en SQL : plusieurs workers (mode chord) peuvent avancer le même dataset
+        db.execute(
+            update(Dataset)
+            .where(Dataset.id == dataset_id)
+            .values(
+                chunks_completed=func.coalesce(Dataset.chunks_completed, 0) + 1,
+                pairs_count=func.coalesce(Dataset.pairs_count, 0) + len(pairs)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        if ledger is not None:
+            ledger.restore(staged_usage)
+        logger.warning(f"Chunk {chunk_index + 1} of dataset {dataset_id} already checkpointed, skipping duplicate pairs.")
+        return 0
+    except Exception:
+        db.rollback()
+        if ledger is not None:
+            ledger.restore(staged_usage)
+        raise
+    return len(pairs)
+
+def get_dataset_pair_totals(db: Session, dataset_id: int) -> Tuple[int, int]:
+    """
+    Nombre de paires d'un dataset et total des caractères question + réponse,
+    calculés par une seule requête d'agrégat.
+    """
+    pairs_count, characters = db.query(
+        func.count(DatasetPair.id),
+        func.coalesce(func.sum(func.length(DatasetPair.question) + func.length(DatasetPair.answer)), 0)
+    ).filter(DatasetPair.dataset_id == dataset_id).one()
+    return int(pairs_count), int(characters)
+
+def get_pending_chunk_indexes(db: Session, dataset_id: int, chunk_hashes: List[str]) -> List[int]:
+    """
+    Retourne les index des chunks restant à générer pour une reprise.
+
+    Si un checkpoint ne correspond plus au texte actuel (contenus modifiés depuis
+    la dernière tentative), les checkpoints et les paires générées pour ces chunks
+    (pair_metadata["chunk_hash"]) sont supprimés et la génération repart de zéro.
+    Les paires ajoutées à la main par l'utilisateur sont conservées.
+    """
+    checkpoints = {
+        chunk_index: chunk_hash
+        for chunk_index, chunk_hash in db.query(DatasetChunk.chunk_index, DatasetChunk.chunk_hash)
+        .filter(DatasetChunk.dataset_id == dataset_id)
+        .all()
+    }
+    if not checkpoints:
+        return list(range(len(chunk_hashes)))
+
+    stale = any(
+        chunk_index >= len(chunk_hashes) or chunk_hashes[chunk_index] != chunk_hash
+        for chunk_index, chunk_hash in checkpoints.items()
+    )
+    if stale:
+        logger.warning(f"Dataset {dataset_id}: checkpoints no longer match the contents, restarting generation from scratch.")
+        db.query(DatasetPair).filter(
+            DatasetPair.dataset_id == dataset_id,
+            DatasetPair.pair_metadata["chunk_hash"].as_string().in_(set(checkpoints.values()))
+        ).delete(synchronize_session=False)
+        db.query(DatasetChunk).filter(DatasetChunk.dataset_id == dataset_id).delete(synchronize_session=False)
+        db.commit()
+        return list(range(len(chunk_hashes)))
+
+    pending = [i for i in range(len(chunk_hashes)) if i not in checkpoints]
+    logger.info(f"Dataset {dataset_id}: resuming generation, {len(checkpoints)} chunk(s) already done, {len(pending)} remaining.")
+    return pending
+
+def scan_dataset_chunks(db: Session, chunker, content_ids: List[int], model: str, provider_name: str, system_content: str, stats: Optional[Dict] = None, structured: Optional[bool] = None) -> Tuple[List[str], List[str]]:
+    """
+    Parcourt les chunks du dataset sans garder leur texte.
+
+    `structured` (défaut : settings.QA_STRUCTURED_OUTPUT) choisit la version de prompt
+    des clés de cache.
+
+    Returns:
+        (empreintes des chunks, clés de cache des chunks), dans l'ordre des chunks.
+    """
+    prompt_version = get_qa_prompt_version(structured)
+    chunk_hashes = []
+    cache_keys = []
+    for chunk in chunker.chunk_documents(iter_dataset_documents(db, content_ids, stats)):
+        chunk_hashes.append(compute_chunk_hash(chunk))
+        cache_keys.append(qa_pair_cache.make_key(chunk, model, provider_name, system_content, prompt_version))
+    return chunk_hashes, cache_keys
+
+def make_batch_custom_id(chunk_index: int, chunk_hash: str) -> str:
+    """
+    custom_id d'une requête batch : l'index du chunk et le début de son empreinte,
+    pour ignorer les résultats si les contenus ont changé entre soumission et relève.
+    """
+    return f"chunk-{chunk_index}-{chunk_hash[:16]}"
+
+def parse_batch_custom_id(custom_id: str) -> Tuple[int, str]:
+    _, chunk_index, hash_prefix = custom_id.split("-", 2)
+    return int(chunk_index), hash_prefix
+
+def resolve_generation_api_key(db: Session, dataset: Dataset, provider_name: str) -> Optional[str]:
+    """
+    Retourne la clé API à utiliser pour générer le dataset, ou None si aucune n'est disponible.
+    """
+    # -------------------------------------------------------------
+    # Admin-key override : on utilise la clé définie dans settings
+    # (OPENAI_API_KEY, ANTHROPIC_API_KEY, etc.) pour générer le dataset.
+    # Si elle est absente on retombe sur la clé utilisateur.
+    # -------------------------------------------------------------
+    admin_key_map = {
+        "openai": settings.OPENAI_API_KEY,
+        "anthropic": settings.ANTHROPIC_API_KEY,
+        "mistral": settings.MISTRAL_API_KEY,
+        # Modèle local : pas de clé utilisateur, seulement celle du serveur éventuel
+        "local": settings.LOCAL_LLM_API_KEY,
+    }
+
+    admin_key = admin_key_map.get(provider_name)
+
+    if admin_key:
+        logger.info(
+            f"Using admin {provider_name} key for dataset generation (dataset {dataset.id})."
+        )
+        return admin_key
+
+    # Fallback : clé utilisateur comme avant
+    if not dataset.project or not dataset.project.user_id:
+        logger.error(
+            f"Dataset {dataset.id} is not associated with a project or user."
+        )
+        raise ValueError(
+            f"Dataset {dataset.id} has no valid project/user association."
+        )
+
+    api_key_record = (
+        db.query(ApiKey)
+        .filter(
+            ApiKey.user_id == dataset.project.user_id,
+            ApiKey.provider == provider_name,
+        )
+        .first()
+    )
+    return api_key_record.key if api_key_record else None
+
+def finalize_generated_dataset(db: Session, dataset: Dataset) -> Dict:
+    """
+    Calcule pairs_count / character_count à partir des paires en base, passe le
+    dataset en "ready" (ou "error" sans paire) et déclenche le fine-tuning en attente.
+    """
+    dataset_id = dataset.id
+    # Les paires quasi identiques (chunks qui se recouvrent, transcriptions répétées)
+    # sont retirées avant le décompte : elles ne sont ni comptées ni facturées
+    dedup_stats = deduplicate_dataset_pairs(db, dataset)
+    total_pairs, total_characters = get_dataset_pair_totals(db, dataset_id)
+
+    if total_pairs == 0:
+        dataset.status = "error"
+        dataset.error_message = "No QA pairs could be generated from the aggregated content."
+        db.commit()
+        logger.error(f"No pairs generated for dataset {dataset_id} from aggregated chunks.")
+        return {"status": "error", "message": "No pairs could be generated"}
+
+    system_content = dataset.system_content or ""
+    total_characters += len(system_content) * total_pairs
+    logger.info(f"Dataset {dataset_id} final character count: {total_characters}")
+
+    # -------------------------------------------------------------
+    # Ancien : Décompte des caractères (déplacé)
+    # -------------------------------------------------------------
+    # Remplacer par la logique de process_dataset_characters si besoin d'infos
+    # sans modifier le solde.
+
+    dataset.status = "ready"
+    dataset.pairs_count = total_pairs
+    dataset.character_count = total_characters
+    dataset.size = total_pairs * 1024
+    dataset.completed_at = datetime.now().isoformat()
+    db.commit()
+    logger.info(f"Dataset {dataset_id} generation completed successfully.")
+
+    qa_pair_cache.evict(db)
+
+    # --- Déclenchement Fine-Tuning (reste inchangé) ---
+    if dataset.status == "ready":
+        try:
+            from celery_app import celery_app
+            existing_fine_tuning = db.query(FineTuning).filter(
+                FineTuning.dataset_id == dataset_id,
+                FineTuning.status == "pending"
+            ).first()
+            if existing_fine_tuning:
+                api_key = db.query(ApiKey).filter(
+                    ApiKey.user_id == dataset.project.user_id,
+                    ApiKey.provider == existing_fine_tuning.provider
+                ).first()
+                if api_key:
+                    logger.info(f"Triggering pending fine-tuning {existing_fine_tuning.id}")
+                    existing_fine_tuning.status = "queued"
+                    db.commit()
+                    celery_app.send_task("start_fine_tuning", args=[existing_fine_tuning.id], queue='fine_tuning')
+                else:
+                    logger.warning(f"Cannot start fine-tuning {existing_fine_tuning.id}: User missing API key...")
+                    existing_fine_tuning.status = "error"
+                    existing_fine_tuning.error_message = f"User missing API key for provider {existing_fine_tuning.provider}"
+                    db.commit()
+            else:
+                 logger.info(f"No pending fine-tuning found for dataset {dataset_id}.")
+        except Exception as e:
+            logger.error(f"Error auto-triggering fine-tuning for dataset {dataset_id}: {str(e)}", exc_info=True)
+
+    return {"status": "success", "dataset_id": dataset_id, "pairs_count": total_pairs, "dedup": dedup_stats}
+
+def submit_dataset_batch(db: Session, dataset: Dataset, provider, pending_indexes: List[int], chunk_hashes: List[str], cache_keys: List[str], iter_pending_chunks, model: str, system_content: str) -> Dict:
+    """
+    Mode batch : enregistre les chunks présents dans le cache, soumet les autres en un
+    seul job batch du provider, puis programme poll_dataset_batch pour relever le résultat.
+
+    Si le dataset a déjà un batch en cours (tâche relancée), aucun nouveau job n'est soumis.
+    """
+    dataset_id = dataset.id
+    submitted = 0
+    if not dataset.batch_job_id:
+        cached = qa_pair_cache.get_many(db, (cache_keys[i] for i in pending_indexes))
+        for chunk_index in pending_indexes:
+            if cache_keys[chunk_index] in cached:
+                persist_chunk_pairs(db, dataset_id, chunk_index, chunk_hashes[chunk_index], cached[cache_keys[chunk_index]])
+        to_submit = {i for i in pending_indexes if cache_keys[i] not in cached}
+        logger.info(f"Dataset {dataset_id}: {len(pending_indexes) - len(to_submit)} chunk(s) served from the QA pair cache, {len(to_submit)} to submit as a batch")
+
+        if not to_submit:
+            return finalize_generated_dataset(db, dataset)
+
+        # Le mode de sortie est enregistré avec le batch : les résultats sont relus dans
+        # ce mode même si QA_STRUCTURED_OUTPUT change avant la fin du batch
+        structured = use_structured_output()
+        dataset.batch_job_id = provider.submit_qa_batch(
+            (
+                (make_batch_custom_id(chunk_index, chunk_hashes[chunk_index]), chunk)
+                for chunk_index, chunk in iter_pending_chunks()
+                if chunk_index in to_submit
+            ),
+            model,
+            system_content,
+            metadata={"dataset_id": str(dataset_id)},
+            structured=structured
+        )
+        dataset.batch_structured = structured
+        db.commit()
+        submitted = len(to_submit)
+    else:
+        logger.info(f"Dataset {dataset_id} already has batch {dataset.batch_job_id} in progress")
+
+    poll_dataset_batch.apply_async(args=[dataset_id], countdown=settings.DATASET_BATCH_POLL_SECONDS, queue="dataset_generation")
+    return {"status": "batch_submitted", "dataset_id": dataset_id, "batch_id": dataset.batch_job_id, "chunks": submitted}
+
+def mark_dataset_failed(dataset_id: int, error_message: str):
+    """
+    Marque le dataset en erreur DANS UNE NOUVELLE SESSION.
+    """
+    try:
+        with SessionLocal() as error_db:
+             dataset_to_fail = error_db.query(Dataset).filter(Dataset.id == dataset_id).first()
+             if dataset_to_fail and dataset_to_fail.status != 'error':
+                 dataset_to_fail.status = "error"
+                 dataset_to_fail.error_message = error_message
+                 error_db.commit()
+    except Exception as db_err:
+        logger.error(f"Failed to mark dataset {dataset_id} as error: {db_err}")
 
 @shared_task(name="generate_dataset", bind=True, max_retries=5, default_retry_delay=60)
-def generate_dataset(self: Task, dataset_id: int):
+def generate_dataset(self: Task, dataset_id: int, mode: Optional[str] = None):
     """
     Generate a dataset from selected contents.
     Aggregates text from all completed contents, chunks the combined text,
     and generates QA pairs from those chunks.
+
+    `mode` (défaut : settings.DATASET_GENERATION_MODE) :
+    - "threads" : les chunks sont générés dans cette tâche via un pool de threads ;
+    - "chord" : une sous-tâche generate_dataset_chunk par chunk, finalisé par finalize_dataset ;
+    - "batch" : un job batch du provider, relevé et ingéré par poll_dataset_batch.
     """
     logger.info(f"Tâche generate_dataset reçue pour dataset ID: {dataset_id}")
     db: Optional[Session] = None # Initialiser à None
@@ -76,7 +619,12 @@ def generate_dataset(self: Task, dataset_id: int):
             db.commit()
             return {"status": "error", "message": "No contents linked to dataset"}
             
-        contents = db.query(Content).filter(Content.id.in_(content_ids)).all()
+        contents = (
+            db.query(Content)
+            .options(load_only(Content.id, Content.status))
+            .filter(Content.id.in_(content_ids))
+            .all()
+        )
         pending_contents = [c for c in contents if c.status not in ['completed', 'error']]
         if pending_contents:
             pending_ids = [c.id for c in pending_contents]
@@ -95,215 +643,306 @@ def generate_dataset(self: Task, dataset_id: int):
 
         # Récupérer provider et clé API (reste inchangé)
         provider_name = getattr(dataset, "provider", "openai")
-
-        # -------------------------------------------------------------
-        # Admin-key override : on utilise la clé définie dans settings
-        # (OPENAI_API_KEY, ANTHROPIC_API_KEY, etc.) pour générer le dataset.
-        # Si elle est absente on retombe sur la clé utilisateur.
-        # -------------------------------------------------------------
-        admin_key_map = {
-            "openai": settings.OPENAI_API_KEY,
-            "anthropic": settings.ANTHROPIC_API_KEY,
-            "mistral": settings.MISTRAL_API_KEY,
-        }
-
-        admin_key = admin_key_map.get(provider_name)
-
-        if admin_key:
-            logger.info(
-                f"Using admin {provider_name} key for dataset generation (dataset {dataset_id})."
-            )
-            api_key_value = admin_key
-        else:
-            # Fallback : clé utilisateur comme avant
-            if not dataset.project or not dataset.project.user_id:
-                logger.error(
-                    f"Dataset {dataset_id} is not associated with a project or user."
-                )
-                raise ValueError(
-                    f"Dataset {dataset_id} has no valid project/user association."
-                )
-
-            api_key_record = (
-                db.query(ApiKey)
-                .filter(
-                    ApiKey.user_id == dataset.project.user_id,
-                    ApiKey.provider == provider_name,
-                )
-                .first()
+        api_key_value = resolve_generation_api_key(db, dataset, provider_name)
+        if not api_key_value:
+            error_msg = (
+                f"API Key for provider {provider_name} not found for user {dataset.project.user_id}"
             )
+            logger.error(error_msg)
+            dataset.status = "error"
+            dataset.error_message = error_msg
+            db.commit()
+            return {"status": "error", "message": error_msg}
+
+        model = dataset.model or get_default_model(provider_name)
+        dataset_system_content = dataset.system_content or "No specific training goal provided for the dataset." # Get system content
 
-            if not api_key_record:
-                error_msg = (
-                    f"API Key for provider {provider_name} not found for user {dataset.project.user_id}"
-                )
-                logger.error(error_msg)
-                dataset.status = "error"
-                dataset.error_message = error_msg
-                db.commit()
-                return {"status": "error", "message": error_msg}
+        # --- Agrégation et chunking en flux ---
+        # Premier passage : empreintes et clés de cache des chunks, sans garder leur texte.
+        # Le second passage relit les contenus et ne rend que les chunks à générer.
+        chunker = get_chunker()
 
-            api_key_value = api_key_record.key
+        def iter_chunks() -> Iterator[str]:
+            return chunker.chunk_documents(iter_dataset_documents(db, content_ids))
 
-        provider = get_ai_provider(provider_name, api_key_value)
-        model = dataset.model or DEFAULT_MODEL
-
-        # --- Logique d'agrégation, chunking, génération QA (reste inchangée) ---
-        aggregated_text = ""
-        processed_content_ids = []
-        for content in contents:
-            if content.status == 'error':
-                logger.warning(f"Skipping content {content.id} due to previous error: {content.error_message}")
-                continue
-            
-            text = content.content_text
-            if text:
-                aggregated_text += f"\n\n--- Contenu {content.id}: {content.name} ---\n\n" + text 
-                processed_content_ids.append(content.id)
-            else:
-                logger.warning(f"No text found in content {content.id} (status: {content.status}) despite being 'completed'.")
-        
-        if not aggregated_text:
+        text_stats: Dict = {}
+        chunk_hashes, cache_keys = scan_dataset_chunks(db, chunker, content_ids, model, provider_name, dataset_system_content, text_stats)
+
+        if not chunk_hashes:
             dataset.status = "error"
             dataset.error_message = "No text could be extracted from any of the selected contents."
             db.commit()
-            logger.error(f"No text aggregated for dataset {dataset_id} from contents {processed_content_ids}.")
+            logger.error(f"No text aggregated for dataset {dataset_id} from contents {content_ids}.")
             return {"status": "error", "message": "No text found in contents"}
 
-        logger.info(f"Aggregated text from {len(processed_content_ids)} contents for dataset {dataset_id}. Total length: {len(aggregated_text)}")
-        chunks = split_text_into_chunks(aggregated_text)
-        logger.info(f"Split aggregated text into {len(chunks)} chunks for dataset {dataset_id}")
+        total_chunks = len(chunk_hashes)
+        logger.info(f"Aggregated text from {len(text_stats['content_ids'])} contents for dataset {dataset_id}. Total length: {text_stats['total_length']}")
+        logger.info(f"Split aggregated text into {total_chunks} chunks ({chunker.name} chunker) for dataset {dataset_id}")
 
-        total_pairs = 0
-        all_pairs = []
-        dataset_system_content = dataset.system_content or "No specific training goal provided for the dataset." # Get system content
+        generation_mode = mode or settings.DATASET_GENERATION_MODE
 
-        for i, chunk in enumerate(chunks):
-            logger.info(f"Processing aggregated chunk {i+1}/{len(chunks)} for dataset {dataset_id}")
-            try:
-                # Pass system_content to generate_qa_pairs
-                qa_pairs = provider.generate_qa_pairs(chunk, model, system_content=dataset_system_content)
-                
-                if qa_pairs:
-                    valid_pairs_in_chunk = []
-                    for pair in qa_pairs:
-                         if isinstance(pair, dict) and "question" in pair and "answer" in pair:
-                             valid_pairs_in_chunk.append(pair)
-                         else:
-                             logger.warning(f"Invalid QA pair format skipped: {pair}")
-                    
-                    if valid_pairs_in_chunk:
-                        all_pairs.extend(valid_pairs_in_chunk) 
-                        total_pairs += len(valid_pairs_in_chunk)
-                        logger.info(f"Generated {len(valid_pairs_in_chunk)} pairs for chunk {i+1}.")
-                    else:
-                        logger.warning(f"No valid QA pairs generated for chunk {i+1}.")
-                else:
-                     logger.warning(f"No QA pairs generated for chunk {i+1}.")
-                time.sleep(1)
-            except Exception as e:
-                logger.error(f"Error processing aggregated chunk {i+1}: {str(e)}")
-                logger.error(traceback.format_exc())
-        
-        if total_pairs == 0:
-            dataset.status = "error"
-            dataset.error_message = "No QA pairs could be generated from the aggregated content."
-            db.commit()
-            logger.error(f"No pairs generated for dataset {dataset_id} from aggregated chunks.")
-            return {"status": "error", "message": "No pairs could be generated"}
-
-        logger.info(f"Adding {total_pairs} generated pairs to dataset {dataset_id}...")
-        for idx, pair_data in enumerate(all_pairs):
-             db_pair = DatasetPair(
-                 question=pair_data["question"],
-                 answer=pair_data["answer"],
-                 dataset_id=dataset_id,
-                 metadata={"aggregated_chunk_index": idx // (len(qa_pairs)/len(chunks)) if len(chunks)>0 and len(qa_pairs)>0 else 0} 
-             )
-             db.add(db_pair)
-        db.commit()
-        logger.info(f"Successfully added {total_pairs} pairs to the database.")
-
-        total_characters = 0
-        for pair in db.query(DatasetPair).filter(DatasetPair.dataset_id == dataset_id).all():
-            total_characters += len(pair.question) + len(pair.answer)
-        system_content = dataset.system_content or ""
-        total_characters += len(system_content) * total_pairs
-        logger.info(f"Dataset {dataset_id} final character count: {total_characters}")
-
-        # -------------------------------------------------------------
-        # Ancien : Décompte des caractères (déplacé)
-        # -------------------------------------------------------------
-        # Remplacer par la logique de process_dataset_characters si besoin d'infos
-        # sans modifier le solde.
-
-        dataset.status = "ready"
-        dataset.pairs_count = total_pairs
-        dataset.character_count = total_characters
-        dataset.size = total_pairs * 1024
-        dataset.completed_at = datetime.now().isoformat()
+        # --- Reprise : ne générer que les chunks sans checkpoint ---
+        pending_indexes = get_pending_chunk_indexes(db, dataset_id, chunk_hashes)
+        pending_set = set(pending_indexes)
+
+        # Avancement de départ : les chunks déjà checkpointés sont comptés comme faits
+        dataset.chunks_total = total_chunks
+        dataset.chunks_completed = total_chunks - len(pending_indexes)
+        dataset.pairs_count = get_dataset_pair_totals(db, dataset_id)[0]
         db.commit()
-        logger.info(f"Dataset {dataset_id} generation completed successfully.")
-        
-        # --- Déclenchement Fine-Tuning (reste inchangé) ---
-        if dataset.status == "ready":
-            try:
-                from celery_app import celery_app
-                existing_fine_tuning = db.query(FineTuning).filter(
-                    FineTuning.dataset_id == dataset_id,
-                    FineTuning.status == "pending"
-                ).first()
-                if existing_fine_tuning:
-                    api_key = db.query(ApiKey).filter(
-                        ApiKey.user_id == dataset.project.user_id,
-                        ApiKey.provider == existing_fine_tuning.provider
-                    ).first()
-                    if api_key:
-                        logger.info(f"Triggering pending fine-tuning {existing_fine_tuning.id}")
-                        existing_fine_tuning.status = "queued"
-                        db.commit()
-                        celery_app.send_task("start_fine_tuning", args=[existing_fine_tuning.id], queue='fine_tuning')
-                    else:
-                        logger.warning(f"Cannot start fine-tuning {existing_fine_tuning.id}: User missing API key...")
-                        existing_fine_tuning.status = "error"
-                        existing_fine_tuning.error_message = f"User missing API key for provider {existing_fine_tuning.provider}"
-                        db.commit()
-                else:
-                     logger.info(f"No pending fine-tuning found for dataset {dataset_id}.")
-            except Exception as e:
-                logger.error(f"Error auto-triggering fine-tuning for dataset {dataset_id}: {str(e)}", exc_info=True)
 
-        return {"status": "success", "dataset_id": dataset_id, "pairs_count": total_pairs}
+        def iter_pending_chunks() -> Iterator[Tuple[int, str]]:
+            return ((i, chunk) for i, chunk in enumerate(iter_chunks()) if i in pending_set)
+
+        provider = get_ai_provider(provider_name, api_key_value)
+        if generation_mode == "batch" and not provider.supports_qa_batch:
+            logger.warning(f"Provider {provider_name} has no batch API, generating dataset {dataset_id} in threads mode")
+            generation_mode = "threads"
+
+        if generation_mode == "batch" and (pending_indexes or dataset.batch_job_id):
+            return submit_dataset_batch(db, dataset, provider, pending_indexes, chunk_hashes, cache_keys, iter_pending_chunks, model, dataset_system_content)
+
+        if generation_mode == "chord" and pending_indexes:
+            # Une sous-tâche par chunk : tous les workers de la queue dataset_generation
+            # se partagent le dataset, et finalize_dataset agrège une fois le groupe terminé.
+            header = group(
+                generate_dataset_chunk.s(dataset_id, chunk_index, chunk, total_chunks).set(queue="dataset_generation")
+                for chunk_index, chunk in iter_pending_chunks()
+            )
+            callback = finalize_dataset.s(dataset_id).set(queue="dataset_generation")
+            chord(header)(callback)
+            logger.info(f"Dispatched {len(pending_indexes)} chunk subtasks for dataset {dataset_id}")
+            return {"status": "dispatched", "dataset_id": dataset_id, "chunks": len(pending_indexes)}
+
+        cache_hits = 0
+        cache_misses = 0
+        outcomes = GenerationOutcomes(provider_name, model)
+        ledger = UsageLedger(dataset_id, provider_name)
+        controller = None
+        if pending_indexes:
+            max_in_flight = get_generation_concurrency(provider_name)
+            if settings.DATASET_GENERATION_ADAPTIVE:
+                # La fenêtre part de la limite configurée et s'ajuste aux réponses du provider
+                controller = AdaptiveConcurrencyController(initial=max_in_flight)
+                max_in_flight = controller.max_window
+            logger.info(f"Generating QA pairs for dataset {dataset_id} with {controller.window if controller else max_in_flight} concurrent requests ({provider_name}{', adaptive' if controller else ''})")
+            # Regroupement des petits chunks : moins de requêtes pour les corpus de contenus courts
+            pack_max_chunks = settings.DATASET_PACK_MAX_CHUNKS if settings.DATASET_PACKING else 1
+
+            # Les chunks déjà générés avec les mêmes paramètres sont repris du cache
+            cached = qa_pair_cache.get_many(db, (cache_keys[i] for i in pending_indexes))
+            cached_pairs = {i: cached[cache_keys[i]] for i in pending_indexes if cache_keys[i] in cached}
+            cache_hits = len(cached_pairs)
+            cache_misses = len(pending_indexes) - cache_hits
+            logger.info(f"Dataset {dataset_id}: {cache_hits} chunk(s) served from the QA pair cache, {cache_misses} to generate")
+
+            # Chaque chunk est enregistré dès qu'il est prêt : un crash ne perd que les chunks en vol.
+            total_pairs = 0
+            prompt_version = get_qa_prompt_version()
+            packed_prompt_version = get_packed_qa_prompt_version()
+            # Les paires d'une requête groupée viennent d'un autre prompt que celui des chunks
+            # seuls : elles sont mises en cache sous la version de ce prompt, ce qui demande le
+            # texte du chunk (gardé le temps de sa génération)
+            packed_indexes: Set[int] = set()
+            chunks_in_flight: Dict[int, str] = {}
+            persisted_chunks = 0
+
+            def iter_tracked_chunks() -> Iterator[Tuple[int, str]]:
+                for chunk_index, chunk in iter_pending_chunks():
+                    chunks_in_flight[chunk_index] = chunk
+                    yield chunk_index, chunk
+
+            for chunk_index, valid_pairs_in_chunk in iter_chunk_pairs(provider, iter_tracked_chunks(), total_chunks, model, dataset_system_content, max_in_flight, cached_pairs, outcomes, controller, ledger, pack_max_chunks, settings.DATASET_PACK_MAX_TOKENS, packed_indexes):
+                chunk = chunks_in_flight.pop(chunk_index)
+                if valid_pairs_in_chunk is None:
+                    continue
+                total_pairs += persist_chunk_pairs(db, dataset_id, chunk_index, chunk_hashes[chunk_index], valid_pairs_in_chunk, ledger)
+                persisted_chunks += 1
+                if persisted_chunks % USAGE_REFRESH_CHUNKS == 0:
+                    outcomes.flush(db)
+                    ledger.flush(db)
+                if chunk_index in packed_indexes:
+                    packed_key = qa_pair_cache.make_key(chunk, model, provider_name, dataset_system_content, packed_prompt_version)
+                    qa_pair_cache.store(db, packed_key, valid_pairs_in_chunk, provider_name, model, packed_prompt_version)
+                elif chunk_index not in cached_pairs:
+                    qa_pair_cache.store(db, cache_keys[chunk_index], valid_pairs_in_chunk, provider_name, model, prompt_version)
+            logger.info(f"Successfully added {total_pairs} pairs to the database.")
+            outcomes.flush(db)
+            ledger.flush(db)
+
+        result = finalize_generated_dataset(db, dataset)
+        result.update({"cache_hits": cache_hits, "cache_misses": cache_misses, "parse": outcomes.summary()})
+        if controller is not None:
+            result["concurrency"] = controller.summary()
+        return result
 
     except self.MaxRetriesExceededError as e:
         logger.error(f"Dataset {dataset_id} generation failed after max retries: {e}")
-        # Marquer le dataset comme échoué DANS UNE NOUVELLE SESSION
-        try:
-            with SessionLocal() as error_db:
-                 dataset_to_fail = error_db.query(Dataset).filter(Dataset.id == dataset_id).first()
-                 if dataset_to_fail and dataset_to_fail.status != 'error':
-                     dataset_to_fail.status = "error"
-                     dataset_to_fail.error_message = f"Task failed after max retries: {str(e)[:200]}"
-                     error_db.commit()
-        except Exception as db_err:
-            logger.error(f"Failed to mark dataset {dataset_id} as error after retries: {db_err}")
+        mark_dataset_failed(dataset_id, f"Task failed after max retries: {str(e)[:200]}")
         return {"status": "error", "message": f"Task failed after max retries: {e}"}
         
     except Exception as e:
         logger.error(f"Unhandled error generating dataset {dataset_id}: {str(e)}")
         logger.error(traceback.format_exc())
-        # Marquer le dataset comme échoué DANS UNE NOUVELLE SESSION
-        try:
-            with SessionLocal() as error_db:
-                 dataset_to_fail = error_db.query(Dataset).filter(Dataset.id == dataset_id).first()
-                 if dataset_to_fail and dataset_to_fail.status != 'error':
-                     dataset_to_fail.status = "error"
-                     dataset_to_fail.error_message = f"Internal error: {str(e)[:200]}"
-                     error_db.commit()
-        except Exception as db_err:
-            logger.error(f"Failed to mark dataset {dataset_id} as error after unhandled exception: {db_err}")
+        mark_dataset_failed(dataset_id, f"Internal error: {str(e)[:200]}")
         return {"status": "error", "message": str(e)}
     
     finally:
         if db: # Fermer la session si elle a été ouverte et assignée
-            db.close() 
\ No newline at end of file
+            db.close() 
+
+@shared_task(name="generate_dataset_chunk", bind=True, acks_late=True)
+def generate_dataset_chunk(self: Task, dataset_id: int, chunk_index: int, chunk: str, total_chunks: int):
+    """
+    Sous-tâche du chord de generate_dataset : génère et enregistre les paires d'un chunk.
+    Ne lève jamais d'exception pour que le callback finalize_dataset soit toujours exécuté.
+    """
+    db = SessionLocal()
+    try:
+        dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+        if not dataset:
+            logger.error(f"Dataset {dataset_id} not found for chunk {chunk_index + 1}")
+            return {"chunk_index": chunk_index, "status": "error", "pairs_count": 0}
+
+        provider_name = getattr(dataset, "provider", "openai")
+        api_key_value = resolve_generation_api_key(db, dataset, provider_name)
+        if not api_key_value:
+            logger.error(f"No API key for provider {provider_name} (dataset {dataset_id}, chunk {chunk_index + 1})")
+            return {"chunk_index": chunk_index, "status": "error", "pairs_count": 0, "cache_hit": False}
+
+        provider = get_ai_provider(provider_name, api_key_value)
+        model = dataset.model or get_default_model(provider_name)
+        system_content = dataset.system_content or "No specific training goal provided for the dataset."
+
+        prompt_version = get_qa_prompt_version()
+        cache_key = qa_pair_cache.make_key(chunk, model, provider_name, system_content, prompt_version)
+        pairs = qa_pair_cache.get(db, cache_key)
+        cache_hit = pairs is not None
+        if not cache_hit:
+            outcomes = GenerationOutcomes(provider_name, model)
+            ledger = UsageLedger(dataset_id, provider_name)
+            pairs = generate_chunk_pairs(provider, chunk, model, system_content, chunk_index + 1, total_chunks, outcomes, ledger=ledger)
+            outcomes.flush(db)
+            ledger.flush(db)
+        if pairs is None:
+            return {"chunk_index": chunk_index, "status": "error", "pairs_count": 0, "cache_hit": False}
+        pairs_count = persist_chunk_pairs(db, dataset_id, chunk_index, compute_chunk_hash(chunk), pairs)
+        if not cache_hit:
+            qa_pair_cache.store(db, cache_key, pairs, provider_name, model, prompt_version)
+        return {"chunk_index": chunk_index, "status": "success", "pairs_count": pairs_count, "cache_hit": cache_hit}
+
+    except Exception as e:
+        logger.error(f"Error generating chunk {chunk_index + 1} of dataset {dataset_id}: {str(e)}")
+        logger.error(traceback.format_exc())
+        db.rollback()
+        return {"chunk_index": chunk_index, "status": "error", "pairs_count": 0}
+
+    finally:
+        db.close()
+
+@shared_task(name="finalize_dataset")
+def finalize_dataset(chunk_results: List[Dict], dataset_id: int):
+    """
+    Callback du chord : finalise pairs_count, character_count et status du dataset.
+    """
+    failed_chunks = [r["chunk_index"] for r in chunk_results if r and r.get("status") != "success"]
+    if failed_chunks:
+        logger.warning(f"Dataset {dataset_id}: {len(failed_chunks)} chunk(s) failed: {failed_chunks[:20]}")
+
+    db = SessionLocal()
+    try:
+        dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+        if not dataset:
+            logger.error(f"Dataset {dataset_id} not found during finalization")
+            return {"status": "error", "message": "Dataset not found"}
+        result = finalize_generated_dataset(db, dataset)
+        cache_hits = sum(1 for r in chunk_results if r and r.get("cache_hit"))
+        result.update({"cache_hits": cache_hits, "cache_misses": len(chunk_results) - cache_hits})
+        return result
+    except Exception as e:
+        logger.error(f"Error finalizing dataset {dataset_id}: {str(e)}")
+        logger.error(traceback.format_exc())
+        mark_dataset_failed(dataset_id, f"Internal error: {str(e)[:200]}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
+
+@shared_task(name="poll_dataset_batch", bind=True, max_retries=None)
+def poll_dataset_batch(self: Task, dataset_id: int):
+    """
+    Relève le job batch d'un dataset : se reprogramme tant que le batch est en cours,
+    puis ingère les paires chunk par chunk et finalise le dataset.
+
+    Les requêtes du batch en échec laissent leur chunk sans checkpoint : une reprise
+    de generate_dataset ne regénère que ceux-là.
+    """
+    db = SessionLocal()
+    still_running = False
+    try:
+        dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+        if not dataset or not dataset.batch_job_id:
+            logger.warning(f"No batch to poll for dataset {dataset_id}")
+            return {"status": "skipped", "dataset_id": dataset_id}
+
+        provider_name = getattr(dataset, "provider", "openai")
+        api_key_value = resolve_generation_api_key(db, dataset, provider_name)
+        if not api_key_value:
+            raise ValueError(f"API Key for provider {provider_name} not found for user {dataset.project.user_id}")
+        provider = get_ai_provider(provider_name, api_key_value)
+
+        batch_id = dataset.batch_job_id
+        batch = provider.get_qa_batch(batch_id)
+        if batch["status"] in provider.BATCH_PENDING_STATUSES:
+            counts = batch["request_counts"]
+            logger.info(f"Batch {batch_id} of dataset {dataset_id} is {batch['status']} ({counts['completed']}/{counts['total']} requests done)")
+            still_running = True
+        else:
+            if batch["status"] != "completed":
+                logger.warning(f"Batch {batch_id} of dataset {dataset_id} ended with status {batch['status']}, ingesting partial results")
+
+            content_ids = [dc.content_id for dc in db.query(DatasetContent).filter(DatasetContent.dataset_id == dataset_id).all()]
+            model = dataset.model or get_default_model(provider_name)
+            system_content = dataset.system_content or "No specific training goal provided for the dataset."
+            # Batch soumis avant l'enregistrement du mode (None) : réglage courant
+            structured = dataset.batch_structured
+            chunk_hashes, cache_keys = scan_dataset_chunks(db, get_chunker(), content_ids, model, provider_name, system_content, structured=structured)
+
+            ingested_chunks = 0
+            outcomes = GenerationOutcomes(provider_name, model)
+            ledger = UsageLedger(dataset_id, provider_name)
+            prompt_version = get_qa_prompt_version(structured)
+            if batch["output_file_id"]:
+                for custom_id, qa_result in provider.iter_qa_batch_results(batch["output_file_id"], structured=structured):
+                    chunk_index, hash_prefix = parse_batch_custom_id(custom_id)
+                    if chunk_index >= len(chunk_hashes) or not chunk_hashes[chunk_index].startswith(hash_prefix):
+                        logger.warning(f"Batch result {custom_id} no longer matches the contents of dataset {dataset_id}, skipped")
+                        continue
+                    if qa_result is None:
+                        continue
+                    outcomes.add(qa_result)
+                    ledger.add(chunk_index, qa_result, model)
+                    valid_pairs = filter_valid_pairs(qa_result["pairs"], chunk_index + 1)
+                    persist_chunk_pairs(db, dataset_id, chunk_index, chunk_hashes[chunk_index], valid_pairs)
+                    qa_pair_cache.store(db, cache_keys[chunk_index], valid_pairs, provider_name, model, prompt_version)
+                    ingested_chunks += 1
+            logger.info(f"Ingested {ingested_chunks} chunk(s) from batch {batch_id} for dataset {dataset_id}")
+            outcomes.flush(db)
+            ledger.flush(db)
+
+            dataset.batch_job_id = None
+            dataset.batch_structured = None
+            db.commit()
+            result = finalize_generated_dataset(db, dataset)
+            result.update({"batch_id": batch_id, "batch_status": batch["status"], "ingested_chunks": ingested_chunks, "parse": outcomes.summary()})
+            return result
+    except Exception as e:
+        logger.error(f"Error polling batch of dataset {dataset_id}: {str(e)}")
+        logger.error(traceback.format_exc())
+        db.rollback()
+        mark_dataset_failed(dataset_id, f"Batch error: {str(e)[:200]}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
+
+    if still_running:
+        raise self.retry(countdown=settings.DATASET_BATCH_POLL_SECONDS)
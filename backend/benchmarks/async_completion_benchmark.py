@@ -0,0 +1,114 @@
+"""
+Benchmark de concurrence des complétions appelées depuis une boucle d'événements.
+
+Un serveur LLM local (réponses OpenAI, Anthropic et Mistral après --delay-ms) reçoit
+--requests complétions lancées en même temps sur une seule boucle asyncio, comme les
+requêtes simultanées d'un worker uvicorn :
+- "blocking" : une coroutine appelle generate_completion (client synchrone), ce que
+  faisaient les endpoints /helpers et /fine-tunings/{id}/test ;
+- "async" : la coroutine attend generate_completion_async.
+
+Pour chaque mode : durée totale, et retard maximal d'un battement de 10 ms planifié sur
+la même boucle (le temps pendant lequel les autres requêtes du worker sont bloquées).
+
+Usage (depuis backend/) :
+    python -m benchmarks.async_completion_benchmark [--requests 50] [--delay-ms 200]
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.core.config import settings
+from app.services.ai_providers import get_ai_provider
+from app.services.provider_clients import provider_clients
+
+CHAT_COMPLETION = {
+    "id": "cmpl-1", "object": "chat.completion", "created": 0, "model": "stub",
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}
+ANTHROPIC_MESSAGE = {
+    "id": "msg-1", "type": "message", "role": "assistant", "model": "stub",
+    "content": [{"type": "text", "text": "ok"}], "stop_reason": "end_turn", "stop_sequence": None,
+    "usage": {"input_tokens": 1, "output_tokens": 1},
+}
+HEARTBEAT_SECONDS = 0.01
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        time.sleep(self.delay)
+        payload = ANTHROPIC_MESSAGE if self.path.endswith("/messages") else CHAT_COMPLETION
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+async def heartbeat(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        expected = time.perf_counter() + HEARTBEAT_SECONDS
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+async def run_mode(provider_name: str, requests: int, blocking: bool):
+    provider = get_ai_provider(provider_name, "sk-bench")
+
+    async def one_request():
+        if blocking:
+            return provider.generate_completion("ping", "stub")
+        return await provider.generate_completion_async("ping", "stub")
+
+    # Connexions ouvertes hors mesure, dans les deux modes
+    await one_request()
+
+    stop = asyncio.Event()
+    lags = []
+    ticker = asyncio.create_task(heartbeat(stop, lags))
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker
+    return elapsed, max(lags, default=0.0)
+
+def run(requests: int, delay_ms: float):
+    from loguru import logger
+    logger.remove()  # les logs fausseraient les mesures
+
+    StubLLMHandler.delay = delay_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLLMHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    root = f"http://127.0.0.1:{server.server_port}"
+    settings.OPENAI_BASE_URL = f"{root}/v1"
+    settings.MISTRAL_BASE_URL = f"{root}/v1"
+    settings.ANTHROPIC_BASE_URL = root
+    provider_clients.clear()
+
+    print(f"{'provider':<11}{'mode':<10}{'total s':>9}{'req/s':>8}{'max loop lag ms':>17}")
+    try:
+        for provider_name in ("openai", "anthropic", "mistral"):
+            for blocking in (True, False):
+                elapsed, lag = asyncio.run(run_mode(provider_name, requests, blocking))
+                mode = "blocking" if blocking else "async"
+                print(f"{provider_name:<11}{mode:<10}{elapsed:>9.2f}{requests / elapsed:>8.1f}{lag * 1000:>17.1f}")
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--delay-ms", type=float, default=200.0)
+    args = parser.parse_args()
+    run(args.requests, args.delay_ms)
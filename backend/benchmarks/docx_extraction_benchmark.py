@@ -0,0 +1,99 @@
+"""
+Benchmark de l'extraction du texte des DOCX.
+
+Compare l'ancienne extraction (modèle objet python-docx, `extracted_text += para.text + "\\n"`)
+à extract_docx_text (app.services.docx_extraction, lecture en flux avec lxml.iterparse) sur
+des DOCX de test générés (paragraphes et tableaux, 10 et 100 Mo de XML par défaut) ou sur
+des fichiers passés avec --docx. Chaque extraction tourne dans un processus séparé pour
+mesurer son pic de mémoire (RSS maximal).
+
+Usage (depuis backend/) :
+    python -m benchmarks.docx_extraction_benchmark [--mb 10 100] [--docx contrat.docx ...]
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import docx
+
+from app.services.docx_extraction import extract_docx_text
+
+WORDS = "le présent contrat est conclu entre les parties pour une durée déterminée".split()
+
+def write_fixture_docx(directory, megabytes):
+    """DOCX d'environ `megabytes` Mo de XML, écrit en flux : un tableau tous les 50 paragraphes."""
+    path = os.path.join(directory, f"fixture_{megabytes}_mb.docx")
+    namespace = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", (
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            "</Types>"
+        ))
+        archive.writestr("_rels/.rels", (
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+            "</Relationships>"
+        ))
+        with archive.open("word/document.xml", "w", force_zip64=True) as part:
+            part.write(f"<w:document {namespace}><w:body>".encode("utf-8"))
+            written, number = 0, 0
+            while written < megabytes * 1024 * 1024:
+                number += 1
+                text = f"Article {number} : " + " ".join(WORDS[(number + i) % len(WORDS)] for i in range(20))
+                xml = f'<w:p><w:pPr><w:pStyle w:val="Normal"/></w:pPr><w:r><w:rPr><w:lang w:val="fr-FR"/></w:rPr><w:t>{text}</w:t></w:r></w:p>'
+                if number % 50 == 0:
+                    xml += "<w:tbl>" + f"<w:tr><w:tc><w:p><w:r><w:t>{number}</w:t></w:r></w:p></w:tc><w:tc><w:p><w:r><w:t>{text}</w:t></w:r></w:p></w:tc></w:tr>" * 3 + "</w:tbl>"
+                data = xml.encode("utf-8")
+                part.write(data)
+                written += len(data)
+            part.write(b"<w:sectPr/></w:body></w:document>")
+    return path
+
+def legacy_extract(file_path):
+    """Ancienne extraction de process_docx_content, reproduite à l'identique pour comparaison."""
+    extracted_text = ""
+    document = docx.Document(file_path)
+    for para in document.paragraphs:
+        extracted_text += para.text + "\n"
+    return extracted_text
+
+def measure(name, file_path):
+    """(secondes, pic de RSS en Mo, caractères) d'une extraction, depuis un processus neuf."""
+    extract = {"legacy": legacy_extract, "streaming": lambda path: extract_docx_text(path)[0]}[name]
+    start = time.perf_counter()
+    text = extract(file_path)
+    elapsed = time.perf_counter() - start
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, len(text)
+
+def run(docx_paths, sizes):
+    from loguru import logger
+    logger.remove()  # les logs fausseraient les mesures
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = list(docx_paths) + [write_fixture_docx(directory, size) for size in sizes]
+        print(f"{'docx':<24}{'file MB':>9}{'legacy s':>10}{'legacy MB':>11}{'stream s':>10}{'stream MB':>11}{'chars':>12}")
+        for path in paths:
+            results = {}
+            for name in ("legacy", "streaming"):
+                # max_tasks_per_child=1 : un processus neuf par mesure pour un pic de RSS propre
+                with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as executor:
+                    results[name] = executor.submit(measure, name, path).result()
+            (legacy_time, legacy_rss, _), (stream_time, stream_rss, chars) = results["legacy"], results["streaming"]
+            print(
+                f"{os.path.basename(path)[:23]:<24}{os.path.getsize(path) / 1024 / 1024:>9.1f}"
+                f"{legacy_time:>10.2f}{legacy_rss:>11.0f}{stream_time:>10.2f}{stream_rss:>11.0f}{chars:>12}"
+            )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docx", nargs="*", default=[], help="DOCX supplémentaires à mesurer")
+    parser.add_argument("--mb", nargs="*", type=int, default=[10, 100], help="taille du XML des DOCX générés (Mo)")
+    args = parser.parse_args()
+    run(args.docx, args.mb)
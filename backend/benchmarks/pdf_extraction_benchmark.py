@@ -0,0 +1,111 @@
+"""
+Benchmark de l'extraction du texte des PDF.
+
+Compare l'ancienne boucle séquentielle (`extracted_text += page.extract_text() + "\\n"`)
+à extract_pdf_text (app.services.pdf_extraction), en séquentiel puis avec un pool de
+processus, sur des PDF de test générés (pages de texte dense en Helvetica, 30, 120 et
+300 pages par défaut) ou sur des fichiers passés avec --pdf. Le texte obtenu doit être
+identique dans tous les cas.
+
+Usage (depuis backend/) :
+    python -m benchmarks.pdf_extraction_benchmark [--pages 30 120 300] [--workers 4] [--pdf manuel.pdf ...]
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+
+import PyPDF2
+
+from app.core.config import settings
+from app.services.pdf_extraction import extract_pdf_text
+
+LINES_PER_PAGE = 50
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore".split()
+
+def build_text_pdf(pages):
+    """PDF minimal d'une page par texte (une ligne de PDF par ligne de texte)."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        lines = [line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in text.split("\n")]
+        stream = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{kid} 0 R' for kid in kids)}] /Count {len(kids)} >>"
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1"))
+    xref_offset = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("ascii"))
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode("ascii"))
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode("ascii"))
+    return out.getvalue()
+
+def write_fixture_pdf(directory, page_count):
+    pages = [
+        "\n".join(
+            f"Page {page} ligne {line} " + " ".join(WORDS[(page + line + i) % len(WORDS)] for i in range(12))
+            for line in range(LINES_PER_PAGE)
+        )
+        for page in range(1, page_count + 1)
+    ]
+    path = os.path.join(directory, f"fixture_{page_count}_pages.pdf")
+    with open(path, "wb") as f:
+        f.write(build_text_pdf(pages))
+    return path
+
+def legacy_extract(file_path):
+    """Ancienne extraction de process_pdf_content, reproduite à l'identique pour comparaison."""
+    extracted_text = ""
+    with open(file_path, "rb") as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        for page_num in range(len(pdf_reader.pages)):
+            page = pdf_reader.pages[page_num]
+            extracted_text += page.extract_text() + "\n"
+    return extracted_text
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def run(pdf_paths, page_counts, workers):
+    from loguru import logger
+    logger.remove()  # les logs fausseraient les mesures
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = list(pdf_paths) + [write_fixture_pdf(directory, count) for count in page_counts]
+        print(f"{'pdf':<28}{'pages':>7}{'legacy s':>10}{'seq s':>8}{f'{workers} procs s':>12}{'speed-up':>10}")
+        for path in paths:
+            expected, legacy_time = timed(legacy_extract, path)
+
+            settings.PDF_PARALLEL_MIN_PAGES = 10 ** 9
+            (sequential, metadata), sequential_time = timed(extract_pdf_text, path)
+            settings.PDF_PARALLEL_MIN_PAGES = 2
+            settings.PDF_EXTRACTION_WORKERS = workers
+            (parallel, _), parallel_time = timed(extract_pdf_text, path)
+
+            assert sequential == expected and parallel == expected, f"extracted text differs for {path}"
+            print(
+                f"{os.path.basename(path)[:27]:<28}{metadata['page_count']:>7}{legacy_time:>10.2f}"
+                f"{sequential_time:>8.2f}{parallel_time:>12.2f}{legacy_time / parallel_time:>9.1f}x"
+            )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", nargs="*", default=[], help="PDF supplémentaires à mesurer")
+    parser.add_argument("--pages", nargs="*", type=int, default=[30, 120, 300], help="tailles des PDF générés")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    run(args.pdf, args.pages, args.workers)
@@ -0,0 +1,118 @@
+"""
+Micro-benchmark de la latence par appel des providers, avec et sans clients partagés.
+
+Un serveur local compatible OpenAI/Mistral (HTTP/1.1 keep-alive, réponse fixe après
+--delay-ms) reçoit des appels de complétion :
+- "fresh" : le registre provider_clients est vidé avant chaque appel, ce qui reproduit
+  l'ancien comportement (un client et une connexion TCP par appel) ;
+- "pooled" : les appels réutilisent le client et les connexions du registre.
+
+Chaque mode est mesuré en séquentiel puis avec --threads appels en parallèle, comme
+les workers de génération de dataset.
+
+Usage (depuis backend/) :
+    python -m benchmarks.provider_client_benchmark [--calls 300] [--threads 8] [--delay-ms 0]
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.core.config import settings
+from app.services.ai_providers import get_ai_provider
+from app.services.provider_clients import provider_clients
+
+COMPLETION = json.dumps({
+    "id": "cmpl-1", "object": "chat.completion", "created": 0, "model": "stub",
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}).encode("utf-8")
+
+class StubCompletionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            type(self).connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.delay:
+            time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(COMPLETION)))
+        self.end_headers()
+        self.wfile.write(COMPLETION)
+
+def send_completion(provider_name, provider):
+    if provider_name == "openai":
+        provider.client.chat.completions.create(model="stub", messages=[{"role": "user", "content": "ping"}])
+    else:
+        provider.generate_completion("ping", "stub")
+
+def measure(provider_name, calls, threads, fresh):
+    def call(_):
+        start = time.perf_counter()
+        if fresh:
+            provider_clients.clear()
+        send_completion(provider_name, get_ai_provider(provider_name, "sk-bench"))
+        return (time.perf_counter() - start) * 1000
+
+    provider_clients.clear()
+    StubCompletionHandler.connections = 0
+    start = time.perf_counter()
+    if threads == 1:
+        latencies = [call(i) for i in range(calls)]
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            latencies = list(executor.map(call, range(calls)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "throughput": calls / elapsed,
+        "connections": StubCompletionHandler.connections,
+    }
+
+def run(calls, threads, delay_ms):
+    from loguru import logger
+    logger.remove()  # les logs fausseraient les mesures
+
+    StubCompletionHandler.delay = delay_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubCompletionHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    settings.OPENAI_BASE_URL = base_url
+    settings.MISTRAL_BASE_URL = base_url
+
+    print(f"{'provider':<10}{'threads':>8}{'mode':>8}{'p50 ms':>9}{'p95 ms':>9}{'calls/s':>10}{'connections':>13}")
+    try:
+        for provider_name in ("openai", "mistral"):
+            for thread_count in (1, threads):
+                for fresh in (True, False):
+                    stats = measure(provider_name, calls, thread_count, fresh)
+                    mode = "fresh" if fresh else "pooled"
+                    print(f"{provider_name:<10}{thread_count:>8}{mode:>8}{stats['p50']:>9.2f}{stats['p95']:>9.2f}{stats['throughput']:>10.0f}{stats['connections']:>13}")
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--delay-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    run(args.calls, args.threads, args.delay_ms)
@@ -0,0 +1,106 @@
+"""
+Micro-benchmark du parsing des réponses QA.
+
+Compare parse_qa_pairs (app.services.qa_parser) à l'ancien parser des providers
+(tableau JSON complet, puis ligne par ligne, puis regex DOTALL en dernier recours)
+sur le corpus benchmarks/data/qa_responses.jsonl : réponses bien formées, JSONL,
+blocs de code entourés de texte, virgules finales, tableau tronqué, retours à la
+ligne bruts dans les chaînes, objet enveloppe, réponse sans JSON, chaîne non fermée.
+
+Usage (depuis backend/) :
+    python -m benchmarks.qa_parser_benchmark [--repeat 200]
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+from app.services.qa_parser import parse_qa_pairs
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "qa_responses.jsonl")
+
+def _legacy_pair(data):
+    if 'messages' in data:
+        messages = data['messages']
+        user_msg = next((m for m in messages if m['role'] == 'user'), None)
+        assistant_msg = next((m for m in messages if m['role'] == 'assistant'), None)
+        if user_msg and assistant_msg:
+            return {'question': user_msg['content'], 'answer': assistant_msg['content']}
+    elif 'question' in data and 'answer' in data:
+        return {'question': data['question'], 'answer': data['answer']}
+    return None
+
+def legacy_parse(content):
+    """Ancien parser de generate_qa_pairs, reproduit à l'identique pour comparaison."""
+    if "```json" in content or "```" in content:
+        json_content = re.search(r'```(?:json)?\n([\s\S]*?)\n```', content)
+        if json_content:
+            content = json_content.group(1)
+    if content.strip().startswith('[') and ']' in content:
+        content = content[:content.rindex(']') + 1]
+
+    qa_pairs = []
+    if content.strip().startswith('[') and content.strip().endswith(']'):
+        try:
+            for item in json.loads(content):
+                if isinstance(item, dict):
+                    pair = _legacy_pair(item)
+                    if pair:
+                        qa_pairs.append(pair)
+            if qa_pairs:
+                return qa_pairs
+        except json.JSONDecodeError:
+            pass
+
+    lines = [line.strip() for line in content.split('\n') if line.strip()
+             and not line.strip().startswith('```')
+             and not line.strip().startswith('#')]
+    for line in lines:
+        try:
+            start_idx = line.find('{')
+            end_idx = line.rfind('}')
+            if start_idx != -1 and end_idx != -1 and start_idx < end_idx:
+                pair = _legacy_pair(json.loads(line[start_idx:end_idx + 1]))
+                if pair:
+                    qa_pairs.append(pair)
+        except (json.JSONDecodeError, ValueError):
+            continue
+
+    if not qa_pairs:
+        message_pattern = r'"messages"\s*:\s*\[\s*{.*?"role"\s*:\s*"user".*?"content"\s*:\s*"(.*?)".*?},\s*{.*?"role"\s*:\s*"assistant".*?"content"\s*:\s*"(.*?)".*?}\s*\]'
+        for match in re.finditer(message_pattern, content, re.DOTALL):
+            question, answer = match.groups()
+            qa_pairs.append({'question': question, 'answer': answer})
+    return qa_pairs
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def run(repeat):
+    from loguru import logger
+    logger.remove()  # les logs fausseraient les mesures
+
+    corpus = load_corpus()
+    print(f"{'response':<26}{'legacy pairs':>14}{'new pairs':>11}{'legacy µs':>12}{'new µs':>10}")
+    totals = [0.0, 0.0]
+    for sample in corpus:
+        content = sample["content"]
+        timings = []
+        counts = []
+        for parser in (legacy_parse, parse_qa_pairs):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                pairs = parser(content)
+            timings.append((time.perf_counter() - start) / repeat * 1e6)
+            counts.append(len(pairs))
+        totals[0] += timings[0]
+        totals[1] += timings[1]
+        print(f"{sample['name']:<26}{counts[0]:>14}{counts[1]:>11}{timings[0]:>12.1f}{timings[1]:>10.1f}")
+    print(f"{'total':<26}{'':>14}{'':>11}{totals[0]:>12.1f}{totals[1]:>10.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    run(parser.parse_args().repeat)
@@ -38,6 +38,9 @@ celery_app.conf.update(
         
         # Routes pour les tâches sans préfixe (utilisées dans les appels send_task)
         "generate_dataset": {"queue": "dataset_generation"},
+        "generate_dataset_chunk": {"queue": "dataset_generation"},
+        "finalize_dataset": {"queue": "dataset_generation"},
+        "poll_dataset_batch": {"queue": "dataset_generation"},
         "process_pdf_content": {"queue": "content_processing"},
         "process_text_content": {"queue": "content_processing"},
         "process_youtube_content": {"queue": "content_processing"},
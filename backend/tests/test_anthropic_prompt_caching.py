@@ -0,0 +1,82 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from app.core.config import settings
+from app.services.ai_providers import AnthropicProvider, build_qa_prompts
+from app.services.rate_limiter import rate_limiter
+
+class StubMessagesHandler(BaseHTTPRequestHandler):
+    """Minimal Anthropic Messages endpoint recording the path and beta header of each request."""
+
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append((self.path, self.headers.get("anthropic-beta"), request))
+        body = json.dumps({
+            "id": "msg_1", "type": "message", "role": "assistant", "model": request["model"],
+            "content": [{"type": "text", "text": json.dumps({"pairs": [{"question": "Q?", "answer": "A."}]})}],
+            "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": {"input_tokens": 20, "output_tokens": 10, "cache_creation_input_tokens": 0, "cache_read_input_tokens": 900},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture
+def stub_anthropic(monkeypatch):
+    monkeypatch.setattr(settings, "QA_STRUCTURED_OUTPUT", False)
+    monkeypatch.setattr(rate_limiter, "enabled", False)
+    server = HTTPServer(("127.0.0.1", 0), StubMessagesHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(settings, "ANTHROPIC_BASE_URL", f"http://127.0.0.1:{server.server_port}")
+    StubMessagesHandler.requests = []
+    yield
+    server.shutdown()
+
+# Objectif de dataset assez long pour que le préfixe commun dépasse 1024 tokens
+LONG_GOAL = "Answer customer questions about the warranty, returns, shipping and repair policies of the store. " * 40
+
+def test_prompt_caching_is_off_by_default():
+    """The cacheable layout, and the cache keys that go with it, are opt-in."""
+    assert settings.QA_PROMPT_CACHING is False
+
+def test_cache_breakpoint_needs_a_supported_model_and_a_long_enough_prefix():
+    """Below the model's minimum prefix size, or on a model without prompt caching, no breakpoint is set."""
+    long_prefix = build_qa_prompts("chunk", LONG_GOAL, structured=False, cacheable=True)[0]
+    short_prefix = build_qa_prompts("chunk", "goal", structured=False, cacheable=True)[0]
+
+    assert AnthropicProvider.can_cache_prefix("claude-3-5-sonnet-20240620", long_prefix)
+    assert not AnthropicProvider.can_cache_prefix("claude-3-5-sonnet-20240620", short_prefix)
+    assert not AnthropicProvider.can_cache_prefix("claude-3-sonnet-20240229", long_prefix)
+    # Claude 3 Haiku demande un préfixe de 2048 tokens
+    assert not AnthropicProvider.can_cache_prefix("claude-3-haiku-20240307", long_prefix)
+
+def test_cacheable_prompts_use_the_prompt_caching_beta(stub_anthropic, monkeypatch):
+    """A long shared prefix on a caching model goes to the beta endpoint and is read back from the cache; others use the stable API."""
+    provider = AnthropicProvider("sk-ant-test")
+    monkeypatch.setattr(settings, "QA_PROMPT_CACHING", True)
+
+    result = provider.generate_qa_pairs_detailed("Premier texte.", "claude-3-5-sonnet-20240620", LONG_GOAL)
+    provider.generate_qa_pairs_detailed("Second texte.", "claude-3-5-sonnet-20240620", "goal")
+    provider.generate_qa_pairs_detailed("Troisième texte.", "claude-3-sonnet-20240229", LONG_GOAL)
+
+    (cached_path, cached_beta, cached_request), *plain_requests = StubMessagesHandler.requests
+    assert cached_path == "/v1/messages?beta=prompt_caching"
+    assert cached_beta == "prompt-caching-2024-07-31"
+    assert cached_request["system"][0]["cache_control"] == {"type": "ephemeral"}
+    assert LONG_GOAL.strip() in cached_request["system"][0]["text"]
+    for path, beta, request in plain_requests:
+        assert (path, beta) == ("/v1/messages", None)
+        assert isinstance(request["system"], str)
+    assert result["pairs"] == [{"question": "Q?", "answer": "A."}]
+    assert (result["prompt_tokens"], result["cached_tokens"]) == (920, 900)
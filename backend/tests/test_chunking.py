@@ -0,0 +1,75 @@
+from app.services.chunking import (
+    iter_text_chunks,
+    split_text_into_chunks,
+    estimate_tokens,
+    SemanticChunker,
+)
+
+def test_iter_text_chunks_matches_split_of_concatenation():
+    """Streaming chunking yields the same chunks as splitting the joined text."""
+    pieces = ["a" * 10, "", "b" * 7000, "c" * 2999, "d", "e" * 3001]
+    
+    assert list(iter_text_chunks(pieces)) == split_text_into_chunks("".join(pieces))
+    assert list(iter_text_chunks(pieces, chunk_size=7)) == split_text_into_chunks("".join(pieces), chunk_size=7)
+
+def test_iter_text_chunks_is_lazy():
+    """Chunks are produced before the whole input has been consumed."""
+    consumed = []
+    
+    def pieces():
+        for i in range(1000):
+            consumed.append(i)
+            yield "x" * 1000
+    
+    first = next(iter_text_chunks(pieces()))
+    assert len(first) == 3000
+    assert len(consumed) == 3
+
+def test_iter_text_chunks_empty_input():
+    """No text gives no chunk."""
+    assert list(iter_text_chunks([])) == []
+    assert list(iter_text_chunks(["", ""])) == []
+
+def test_semantic_chunker_cuts_on_sentence_boundaries():
+    """Chunks end on a sentence and stay within the token budget."""
+    text = "Le chat dort sur le canapé. " * 400
+    chunks = list(SemanticChunker(max_tokens=100).chunk_text(text))
+    
+    assert len(chunks) > 1
+    assert all(chunk.endswith(".") for chunk in chunks)
+    assert all(estimate_tokens(chunk) <= 100 for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+def test_semantic_chunker_prefers_paragraph_breaks():
+    """A paragraph break in the second half of a chunk is preferred over a sentence end."""
+    paragraph = "Une phrase courte. " * 30
+    text = "\n\n".join([paragraph] * 4)
+    chunks = list(SemanticChunker(max_tokens=200).chunk_text(text))
+    
+    assert chunks == [paragraph.strip()] * 4
+
+def test_semantic_chunker_overlap():
+    """The tail of a chunk is repeated at the head of the next one."""
+    text = " ".join(f"Phrase numéro {i}." for i in range(200))
+    chunks = list(SemanticChunker(max_tokens=60, overlap_tokens=10).chunk_text(text))
+    
+    assert len(chunks) > 1
+    for previous, following in zip(chunks, chunks[1:]):
+        first_sentence = following.split(". ", 1)[0] + "."
+        assert previous.endswith(first_sentence) or f"{first_sentence} " in previous
+
+def test_semantic_chunker_splits_oversized_segments():
+    """Text without any boundary is still split within the budget."""
+    chunks = list(SemanticChunker(max_tokens=50).chunk_text("x" * 10000))
+    
+    assert "".join(chunks) == "x" * 10000
+    assert all(estimate_tokens(chunk) <= 50 for chunk in chunks)
+
+def test_semantic_chunker_does_not_overlap_across_documents():
+    """Documents are packed together but overlap never crosses a document boundary."""
+    documents = [("\n\n--- Contenu 1: a ---\n\n", "Premier document. " * 10), ("\n\n--- Contenu 2: b ---\n\n", "Second document. " * 10)]
+    chunks = list(SemanticChunker(max_tokens=80, overlap_tokens=20).chunk_documents(documents))
+    
+    assert len(chunks) == 2
+    assert chunks[1].startswith("--- Contenu 2: b ---")
+    assert "Premier" not in chunks[1]
@@ -0,0 +1,107 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services.concurrency import AdaptiveConcurrencyController
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class RateLimitError(Exception):
+    status_code = 429
+
+class SimulatedProvider:
+    """Answers in `latency` simulated seconds, and with a 429 once the window exceeds `capacity`."""
+
+    def __init__(self, clock, capacity, latency=1.0):
+        self.clock = clock
+        self.capacity = capacity
+        self.latency = latency
+        self.controller = None
+
+    def generate_qa_pairs_detailed(self, chunk_text, model=None, **kwargs):
+        self.clock.now += self.latency
+        if self.controller.window > self.capacity:
+            raise RateLimitError("rate limited")
+        return {"pairs": [{"question": chunk_text, "answer": "a"}], "parse_ok": True, "structured": True}
+
+def test_window_grows_additively_and_halves_on_throttling():
+    """The window climbs towards the provider's capacity and is halved on each 429."""
+    clock = FakeClock()
+    provider = SimulatedProvider(clock, capacity=10)
+    controller = AdaptiveConcurrencyController(initial=2, max_window=32, decrease_factor=0.5, clock=clock)
+    provider.controller = controller
+
+    windows = []
+    for i in range(300):
+        try:
+            controller.generate_qa_pairs_detailed(provider, f"chunk {i}")
+        except RateLimitError:
+            pass
+        windows.append(controller.window)
+
+    assert windows[:3] == [2, 2, 3]
+    assert max(windows) == 11
+    assert min(windows[100:]) >= 5
+    assert controller.summary()["decreases"] > 0
+
+def test_slow_responses_and_limiter_waits():
+    """An abnormally slow call shrinks the window; a call that waited for the rate limiter does not grow it."""
+    clock = FakeClock()
+    controller = AdaptiveConcurrencyController(initial=8, latency_tolerance=3.0, clock=clock)
+
+    def call(latency, **result):
+        def fn():
+            clock.now += latency
+            return result
+        return controller.call(fn)
+
+    call(1.0)
+    window = controller.window
+    call(10.0)
+    assert controller.window == window // 2
+
+    window = controller.window
+    for _ in range(20):
+        call(1.0, waited=2.5)
+    assert controller.window == window
+
+def test_other_errors_do_not_change_the_window():
+    """Client errors (400) propagate without being taken for saturation."""
+    controller = AdaptiveConcurrencyController(initial=4)
+
+    class BadRequest(Exception):
+        status_code = 400
+
+    def fail():
+        raise BadRequest("invalid request")
+
+    with pytest.raises(BadRequest):
+        controller.call(fail)
+    assert controller.window == 4 and controller.in_flight == 0
+
+def test_in_flight_calls_never_exceed_the_window():
+    """Concurrent callers wait for a slot in the window."""
+    controller = AdaptiveConcurrencyController(initial=3, max_window=3)
+    lock = threading.Lock()
+    active = []
+    peak = []
+
+    def fn():
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.01)
+        with lock:
+            active.pop()
+        return {}
+
+    with ThreadPoolExecutor(max_workers=12) as executor:
+        list(executor.map(lambda _: controller.call(fn), range(48)))
+    assert max(peak) == 3
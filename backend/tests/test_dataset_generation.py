@@ -0,0 +1,402 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+import celery_app
+from app.core.config import settings
+from app.db import fix_stuck_datasets as fix_stuck_module
+from app.models.api_key import ApiKey
+from app.models.content import Content
+from app.models.dataset import Dataset, DatasetChunk, DatasetContent, DatasetPair, DatasetUsage
+from app.models.fine_tuning import FineTuning
+from app.models.project import Project
+from app.models.qa_pair_cache import QAPairCacheEntry
+from app.models.user import User
+from app.services.ai_providers import get_qa_prompt_version
+from app.services.qa_cache import qa_pair_cache
+from app.tasks import dataset_generation
+from app.tasks.dataset_generation import CONTENT_TEXT_PAGE_SIZE, get_pending_chunk_indexes, persist_chunk_pairs, get_dataset_pair_totals, iter_chunk_pairs, iter_dataset_documents
+
+# Textes sans mots communs : la déduplication du finalize ne retire aucune paire
+TEXTS = [
+    "alpha bravo charlie delta", "echo foxtrot golf hotel", "india juliett kilo lima",
+    "mike november oscar papa", "quebec romeo sierra tango", "uniform victor whiskey xray",
+]
+
+def test_persist_chunk_pairs_updates_progress(db):
+    """Each checkpointed chunk makes its pairs visible and advances the dataset progress."""
+    dataset = Dataset(name="Dataset", project_id=1, status="processing", chunks_total=2, chunks_completed=0, pairs_count=0)
+    db.add(dataset)
+    db.commit()
+
+    pairs = [{"question": "Q1?", "answer": "A1."}, {"question": "Q2?", "answer": "A2."}]
+    assert persist_chunk_pairs(db, dataset.id, 0, "hash-0", pairs) == 2
+    db.refresh(dataset)
+    assert dataset.chunks_completed == 1
+    assert dataset.pairs_count == 2
+    assert dataset.progress == 0.5
+    assert get_dataset_pair_totals(db, dataset.id) == (2, 12)
+
+    # Le même chunk rejoué n'ajoute rien
+    assert persist_chunk_pairs(db, dataset.id, 0, "hash-0", pairs) == 0
+    db.refresh(dataset)
+    assert dataset.chunks_completed == 1
+    assert db.query(DatasetPair).filter(DatasetPair.dataset_id == dataset.id).count() == 2
+
+class PackingProvider:
+    """Answers packed requests for every chunk but the last one, which must then be generated alone."""
+
+    def __init__(self):
+        self.packed_calls = []
+        self.single_calls = []
+
+    def generate_packed_qa_pairs_detailed(self, chunk_texts, model=None, system_content=None):
+        self.packed_calls.append(list(chunk_texts))
+        groups = [[{"question": f"{text}?", "answer": "A."}] for text in chunk_texts[:-1]] + [[]]
+        return {"pairs": [pair for group in groups for pair in group], "pairs_by_chunk": groups, "parse_ok": True, "structured": True}
+
+    def generate_qa_pairs_detailed(self, chunk_text, model=None, system_content=None):
+        self.single_calls.append(chunk_text)
+        return {"pairs": [{"question": f"{chunk_text}?", "answer": "B."}], "parse_ok": True, "structured": True}
+
+def test_small_chunks_are_packed_into_one_request():
+    """Consecutive chunks share a request; cached chunks break packs and unattributed chunks are retried alone."""
+    provider = PackingProvider()
+    chunks = [(i, f"c{i}") for i in range(6)]
+    cached = {3: [{"question": "cached?", "answer": "C."}]}
+
+    results = list(iter_chunk_pairs(provider, chunks, 6, "gpt-4.1", "goal", 2, cached, pack_max_chunks=2, pack_max_tokens=1000))
+
+    assert [index for index, _ in results] == list(range(6))
+    assert provider.packed_calls == [["c0", "c1"], ["c4", "c5"]]
+    assert sorted(provider.single_calls) == ["c1", "c2", "c5"]
+    assert results[0][1] == [{"question": "c0?", "answer": "A."}]
+    assert results[1][1] == [{"question": "c1?", "answer": "B."}]
+    assert results[3][1] == cached[3]
+
+def create_dataset_with_checkpoints(db, chunk_hashes):
+    dataset = Dataset(name="Dataset", project_id=1, status="processing")
+    db.add(dataset)
+    db.commit()
+    for chunk_index, chunk_hash in enumerate(chunk_hashes):
+        persist_chunk_pairs(db, dataset.id, chunk_index, chunk_hash, [{"question": f"Q{chunk_index}?", "answer": "A."}])
+    db.add(DatasetPair(question="Manual?", answer="Kept.", dataset_id=dataset.id, pair_metadata={"source": "manual"}))
+    db.add(DatasetPair(question="Untagged?", answer="Kept.", dataset_id=dataset.id))
+    db.commit()
+    return dataset
+
+def test_resume_skips_checkpointed_chunks(db):
+    """Only chunks without a matching checkpoint are generated again; nothing is deleted."""
+    dataset = create_dataset_with_checkpoints(db, ["h0", "h1"])
+
+    assert get_pending_chunk_indexes(db, dataset.id, ["h0", "h1", "h2", "h3"]) == [2, 3]
+    assert db.query(DatasetChunk).filter(DatasetChunk.dataset_id == dataset.id).count() == 2
+    assert get_dataset_pair_totals(db, dataset.id)[0] == 4
+
+def test_stale_checkpoints_reset_only_generated_pairs(db):
+    """Changed contents drop the checkpoints and their generated pairs, never pairs added by users."""
+    dataset = create_dataset_with_checkpoints(db, ["h0", "h1"])
+    other = create_dataset_with_checkpoints(db, ["h0"])
+
+    assert get_pending_chunk_indexes(db, dataset.id, ["h0", "changed"]) == [0, 1]
+
+    remaining = db.query(DatasetPair.question).filter(DatasetPair.dataset_id == dataset.id).order_by(DatasetPair.question).all()
+    assert [question for question, in remaining] == ["Manual?", "Untagged?"]
+    assert db.query(DatasetChunk).filter(DatasetChunk.dataset_id == dataset.id).count() == 0
+    assert get_dataset_pair_totals(db, other.id)[0] == 3
+
+def test_fix_stuck_datasets_relaunches_inactive_generations(db, monkeypatch):
+    """Datasets without recent activity are resumed: generate_dataset, or the batch poll in batch mode."""
+    old = datetime.utcnow() - timedelta(hours=2)
+    stuck = Dataset(name="Stuck", project_id=1, status="processing", created_at=old, updated_at=old)
+    batch = Dataset(name="Batch", project_id=1, status="processing", created_at=old, updated_at=old, batch_job_id="batch_1")
+    active = Dataset(name="Active", project_id=1, status="processing", created_at=old, updated_at=old)
+    ready = Dataset(name="Ready", project_id=1, status="ready", created_at=old, updated_at=old)
+    db.add_all([stuck, batch, active, ready])
+    db.commit()
+    # Un chunk checkpointé récemment : la génération avance encore
+    persist_chunk_pairs(db, active.id, 0, "h0", [])
+
+    sent = []
+    monkeypatch.setattr(celery_app.celery_app, "send_task", lambda name, args, queue: sent.append((name, args[0])))
+    monkeypatch.setattr(fix_stuck_module, "SessionLocal", sessionmaker(bind=db.get_bind()))
+    fix_stuck_module.fix_stuck_datasets(stale_after_minutes=30)
+
+    assert sorted(sent) == sorted([("generate_dataset", stuck.id), ("poll_dataset_batch", batch.id)])
+
+class FakeProvider:
+    """Answers one pair per chunk after `delays[chunk]` seconds, fails on `failing` chunks and tracks concurrency."""
+    supports_qa_batch = False
+
+    def __init__(self, delays=None, failing=()):
+        self.delays = delays or {}
+        self.failing = set(failing)
+        self.completed = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def generate_qa_pairs_detailed(self, chunk_text, model=None, system_content=None):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.delays.get(chunk_text, 0))
+            if chunk_text in self.failing:
+                raise RuntimeError(f"provider error on {chunk_text}")
+            self.completed.append(chunk_text)
+            return {"pairs": [{"question": f"{chunk_text}?", "answer": f"Answer about {chunk_text}."}], "parse_ok": True, "structured": True}
+        finally:
+            with self._lock:
+                self.active -= 1
+
+def test_results_follow_chunk_order_when_calls_finish_out_of_order():
+    """Later chunks answer first, yet pairs are yielded in chunk order."""
+    chunks = [(i, f"c{i}") for i in range(6)]
+    provider = FakeProvider(delays={text: (6 - i) * 0.02 for i, text in chunks})
+
+    results = list(iter_chunk_pairs(provider, chunks, 6, "gpt-4.1", "goal", 4))
+
+    assert [index for index, _ in results] == list(range(6))
+    assert [pairs[0]["question"] for _, pairs in results] == [f"c{i}?" for i in range(6)]
+    assert provider.completed.index("c3") < provider.completed.index("c0")
+
+def test_window_bounds_calls_and_read_ahead():
+    """At most `max_in_flight` calls run at once and chunks are read only one window ahead."""
+    pulled = []
+
+    def chunk_items():
+        for i in range(10):
+            pulled.append(i)
+            yield i, f"c{i}"
+
+    provider = FakeProvider(delays={f"c{i}": 0.01 * (i % 3) for i in range(10)})
+    read_ahead = [(index, len(pulled)) for index, _ in iter_chunk_pairs(provider, chunk_items(), 10, "gpt-4.1", "goal", 3)]
+
+    assert [index for index, _ in read_ahead] == list(range(10))
+    assert provider.peak <= 3
+    assert all(count <= index + 1 + 3 for index, count in read_ahead)
+
+class OneChunkPerContent:
+    name = "test"
+
+    def chunk_documents(self, documents):
+        return (text for _, text in documents)
+
+def create_generation(db, monkeypatch, provider, texts=TEXTS):
+    """Dataset over `texts` with a pending fine-tuning, generated through `provider`; returns (dataset id, sent tasks)."""
+    user = User(email="generation@example.com", hashed_password="x", name="Test")
+    db.add(user)
+    db.flush()
+    project = Project(name="Project", user_id=user.id)
+    db.add(project)
+    db.flush()
+    dataset = Dataset(name="Dataset", project_id=project.id, status="pending", model="gpt-4.1", system_content="goal")
+    db.add(dataset)
+    db.flush()
+    for number, text in enumerate(texts):
+        content = Content(name=f"content-{number}", type="text", status="completed", content_text=text, project_id=project.id)
+        db.add(content)
+        db.flush()
+        db.add(DatasetContent(dataset_id=dataset.id, content_id=content.id))
+    db.add(FineTuning(name="Fine-tuning", status="pending", model="gpt-4.1", provider="openai", dataset_id=dataset.id))
+    db.add(ApiKey(provider="openai", key="sk-user", user_id=user.id))
+    db.commit()
+
+    sent = []
+    monkeypatch.setattr(dataset_generation, "SessionLocal", sessionmaker(bind=db.get_bind()))
+    monkeypatch.setattr(dataset_generation, "get_ai_provider", lambda name, key: provider)
+    monkeypatch.setattr(dataset_generation, "get_chunker", lambda: OneChunkPerContent())
+    monkeypatch.setattr(qa_pair_cache, "enabled", False)
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(celery_app.celery_app, "send_task", lambda name, args=None, queue=None, **kwargs: sent.append((name, args)))
+    return dataset.id, sent
+
+def test_failed_chunk_is_not_checkpointed(db, monkeypatch):
+    """A chunk whose call fails gets no checkpoint, so the next run generates it again."""
+    provider = FakeProvider(failing=[TEXTS[2]])
+    dataset_id, _ = create_generation(db, monkeypatch, provider)
+
+    assert list(iter_chunk_pairs(provider, enumerate(TEXTS[:3]), 3, "gpt-4.1", "goal", 2))[2] == (2, None)
+
+    result = dataset_generation.generate_dataset(dataset_id, mode="threads")
+
+    assert (result["status"], result["pairs_count"]) == ("success", 5)
+    checkpointed = db.query(DatasetChunk.chunk_index).filter(DatasetChunk.dataset_id == dataset_id).order_by(DatasetChunk.chunk_index).all()
+    assert [index for index, in checkpointed] == [0, 1, 3, 4, 5]
+    hashes = [dataset_generation.compute_chunk_hash(text) for text in TEXTS]
+    assert get_pending_chunk_indexes(db, dataset_id, hashes) == [2]
+
+def run_generation(db, mode):
+    dataset_id = db.query(Dataset.id).scalar()
+    result = dataset_generation.generate_dataset(dataset_id, mode=mode)
+    db.expire_all()
+    dataset = db.get(Dataset, dataset_id)
+    fine_tuning = db.query(FineTuning).filter(FineTuning.dataset_id == dataset_id).one()
+    return result, (dataset.status, dataset.pairs_count, dataset.chunks_completed, dataset.progress, fine_tuning.status)
+
+def test_chord_mode_matches_threads_mode(db, monkeypatch):
+    """Run eagerly, the chord of chunk subtasks and its finalize callback give the same dataset as threads mode."""
+    _, sent = create_generation(db, monkeypatch, FakeProvider())
+    threads_result, threads_state = run_generation(db, "threads")
+    threads_sent = list(sent)
+    db.query(DatasetPair).delete()
+    db.query(DatasetChunk).delete()
+    db.query(Dataset).update({"status": "pending", "pairs_count": None, "chunks_completed": None})
+    db.query(FineTuning).update({"status": "pending"})
+    db.commit()
+    sent.clear()
+
+    monkeypatch.setattr(celery_app.celery_app.conf, "task_always_eager", True)
+    chord_result, chord_state = run_generation(db, "chord")
+
+    assert threads_state == chord_state == ("ready", len(TEXTS), len(TEXTS), 1.0, "queued")
+    assert chord_result == {"status": "dispatched", "dataset_id": chord_result["dataset_id"], "chunks": len(TEXTS)}
+    assert threads_result["pairs_count"] == len(TEXTS)
+    assert sent == threads_sent == [("start_fine_tuning", [db.query(FineTuning.id).scalar()])]
+
+def test_dataset_documents_are_paged_lazily(db):
+    """Texts are read one page at a time, in id order, without skipping or repeating contents across pages."""
+    project = Project(name="Project", user_id=1)
+    db.add(project)
+    db.flush()
+    contents = []
+    for number in range(CONTENT_TEXT_PAGE_SIZE * 2 + 4):
+        status = "error" if number == CONTENT_TEXT_PAGE_SIZE - 1 else "completed"
+        text = "" if number == CONTENT_TEXT_PAGE_SIZE else f"text {number}"
+        contents.append(Content(name=f"content-{number}", type="text", status=status, content_text=text, project_id=project.id))
+    db.add_all(contents)
+    db.commit()
+    content_ids = [content.id for content in contents]
+    skipped = {content_ids[CONTENT_TEXT_PAGE_SIZE - 1], content_ids[CONTENT_TEXT_PAGE_SIZE]}
+
+    selects = []
+    record = lambda conn, cursor, statement, *args: selects.append(statement)
+    event.listen(db.get_bind(), "before_cursor_execute", record)
+    stats = {}
+    documents = iter_dataset_documents(db, list(reversed(content_ids)), stats)
+    assert selects == []
+
+    first = next(documents)
+    # Métadonnées puis première page de textes seulement
+    assert len(selects) == 2
+    rest = list(documents)
+    assert len(selects) == 4
+    event.remove(db.get_bind(), "before_cursor_execute", record)
+
+    expected = [f"text {number}" for number, content_id in enumerate(content_ids) if content_id not in skipped]
+    assert [text for _, text in [first] + rest] == expected
+    assert stats["content_ids"] == [content_id for content_id in content_ids if content_id not in skipped]
+
+class FakeBatchProvider(FakeProvider):
+    """Batch API answering every submitted chunk, recording the output mode of each call."""
+    supports_qa_batch = True
+    BATCH_PENDING_STATUSES = ("validating", "in_progress", "finalizing")
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+        self.modes = {}
+
+    def submit_qa_batch(self, chunks, model="gpt-4.1", system_content=None, metadata=None, structured=None):
+        self.requests = list(chunks)
+        self.modes["submit"] = structured
+        return "batch-1"
+
+    def get_qa_batch(self, batch_id):
+        return {"status": "completed", "output_file_id": "file-out", "request_counts": {"completed": len(self.requests), "total": len(self.requests)}}
+
+    def iter_qa_batch_results(self, output_file_id, structured=None):
+        self.modes["results"] = structured
+        for custom_id, chunk in self.requests:
+            yield custom_id, {"pairs": [{"question": f"{chunk}?", "answer": f"Answer about {chunk}."}], "parse_ok": True, "structured": structured}
+
+def test_batch_results_are_read_in_the_submitted_output_mode(db, monkeypatch):
+    """Changing QA_STRUCTURED_OUTPUT while a batch runs does not change how its results are parsed."""
+    provider = FakeBatchProvider()
+    dataset_id, _ = create_generation(db, monkeypatch, provider)
+    monkeypatch.setattr(dataset_generation.poll_dataset_batch, "apply_async", lambda *args, **kwargs: None)
+    monkeypatch.setattr(settings, "QA_STRUCTURED_OUTPUT", True)
+
+    assert dataset_generation.generate_dataset(dataset_id, mode="batch")["status"] == "batch_submitted"
+    db.expire_all()
+    assert (db.get(Dataset, dataset_id).batch_job_id, db.get(Dataset, dataset_id).batch_structured) == ("batch-1", True)
+
+    monkeypatch.setattr(settings, "QA_STRUCTURED_OUTPUT", False)
+    result = dataset_generation.poll_dataset_batch(dataset_id)
+
+    assert (result["status"], result["ingested_chunks"]) == ("success", len(TEXTS))
+    assert provider.modes == {"submit": True, "results": True}
+    db.expire_all()
+    assert (db.get(Dataset, dataset_id).batch_job_id, db.get(Dataset, dataset_id).batch_structured) == (None, None)
+
+def test_packed_pairs_are_cached_under_the_packed_prompt_version(db, monkeypatch):
+    """Pairs from a packed request and pairs regenerated alone are cached under the prompt that produced them."""
+    dataset_id, _ = create_generation(db, monkeypatch, PackingProvider())
+    monkeypatch.setattr(qa_pair_cache, "enabled", True)
+    monkeypatch.setattr(settings, "DATASET_PACKING", True)
+    monkeypatch.setattr(settings, "DATASET_PACK_MAX_CHUNKS", 3)
+    monkeypatch.setattr(settings, "DATASET_PACK_MAX_TOKENS", 1000)
+    monkeypatch.setattr(settings, "QA_STRUCTURED_OUTPUT", False)
+    monkeypatch.setattr(settings, "QA_PROMPT_CACHING", False)
+
+    assert dataset_generation.generate_dataset(dataset_id, mode="threads")["status"] == "success"
+
+    packed_version = get_qa_prompt_version(structured=True, cacheable=True)
+    single_version = get_qa_prompt_version()
+    assert packed_version != single_version
+    entries = dict(db.query(QAPairCacheEntry.cache_key, QAPairCacheEntry.prompt_version).all())
+    # Paquets [0, 1, 2] et [3, 4, 5] : le dernier chunk de chaque paquet est regénéré seul
+    expected = {
+        qa_pair_cache.make_key(text, "gpt-4.1", "openai", "goal", single_version if index in (2, 5) else packed_version): single_version if index in (2, 5) else packed_version
+        for index, text in enumerate(TEXTS)
+    }
+    assert entries == expected
+
+def test_solo_retries_of_a_pack_are_capped(monkeypatch):
+    """Only DATASET_PACK_MAX_SOLO_RETRIES empty chunks of a pack are billed again; the others are left unchecked."""
+    class FirstChunkOnlyProvider(PackingProvider):
+        def generate_packed_qa_pairs_detailed(self, chunk_texts, model=None, system_content=None):
+            groups = [[{"question": f"{chunk_texts[0]}?", "answer": "A."}]] + [[] for _ in chunk_texts[1:]]
+            return {"pairs": groups[0], "pairs_by_chunk": groups, "parse_ok": True, "structured": True}
+
+    monkeypatch.setattr(settings, "DATASET_PACK_MAX_SOLO_RETRIES", 1)
+    provider = FirstChunkOnlyProvider()
+    packed = set()
+    chunks = [(i, f"c{i}") for i in range(3)]
+
+    results = list(iter_chunk_pairs(provider, chunks, 3, "gpt-4.1", "goal", 2, pack_max_chunks=3, pack_max_tokens=1000, packed_indexes=packed))
+
+    assert provider.single_calls == ["c1"]
+    assert [pairs is None for _, pairs in results] == [False, False, True]
+    assert packed == {0}
+
+class CrashingProvider(FakeProvider):
+    """Kills the generation, like a worker shutdown, when it reaches `crash_on`."""
+
+    def __init__(self, crash_on):
+        super().__init__()
+        self.crash_on = crash_on
+
+    def generate_qa_pairs_detailed(self, chunk_text, model=None, system_content=None):
+        if chunk_text == self.crash_on:
+            raise SystemExit("worker killed")
+        result = super().generate_qa_pairs_detailed(chunk_text, model, system_content)
+        return {**result, "prompt_tokens": 100, "completion_tokens": 20}
+
+def test_usage_of_checkpointed_chunks_survives_a_crash(db, monkeypatch):
+    """Token usage is written with each chunk checkpoint, so chunks skipped on resume are still billed."""
+    dataset_id, _ = create_generation(db, monkeypatch, CrashingProvider(crash_on=TEXTS[3]))
+    monkeypatch.setattr(dataset_generation, "get_generation_concurrency", lambda provider_name: 1)
+    monkeypatch.setattr(settings, "DATASET_GENERATION_ADAPTIVE", False)
+
+    with pytest.raises(SystemExit):
+        dataset_generation.generate_dataset(dataset_id, mode="threads")
+
+    checkpointed = {index for index, in db.query(DatasetChunk.chunk_index).filter(DatasetChunk.dataset_id == dataset_id)}
+    billed = {index for index, in db.query(DatasetUsage.chunk_index).filter(DatasetUsage.dataset_id == dataset_id)}
+    assert checkpointed == billed == {0, 1, 2}
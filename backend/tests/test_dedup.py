@@ -0,0 +1,82 @@
+from app.api.endpoints.datasets import add_bulk_pairs
+from app.models.dataset import Dataset, DatasetPair
+from app.models.project import Project
+from app.models.user import User
+from app.schemas.dataset import BulkPairUpload
+from app.services.dedup import NearDuplicateIndex, deduplicate_dataset_pairs
+
+QUESTION = "What is the capital of France?"
+ANSWER = "The capital of France is Paris, a city known for the Eiffel tower, its museums and its food."
+GENERATED_H0 = {"chunk_hash": "h0", "source": "generated"}
+GENERATED_H1 = {"chunk_hash": "h1", "source": "generated"}
+
+def test_index_drops_near_duplicates_only():
+    """Case, punctuation and spacing variants are duplicates; a different pair is kept."""
+    index = NearDuplicateIndex(threshold=0.8, num_perm=64, bands=16)
+
+    assert index.add(f"{QUESTION}\n{ANSWER}")
+    assert not index.add(f"{QUESTION.upper()}\n  {ANSWER.replace(',', '')} ")
+    assert index.add("How do I bake bread?\nMix flour, water, yeast and salt, knead the dough and let it rise.")
+    assert len(index) == 2
+
+def test_deduplicate_dataset_pairs_keeps_oldest(db):
+    """Later near-duplicate generated pairs are deleted and the stats are recorded on the dataset."""
+    dataset = Dataset(name="Dataset", project_id=1, status="processing")
+    db.add(dataset)
+    db.commit()
+    db.add_all([
+        DatasetPair(dataset_id=dataset.id, question=QUESTION, answer=ANSWER, pair_metadata=GENERATED_H0),
+        DatasetPair(dataset_id=dataset.id, question=QUESTION.lower(), answer=ANSWER + "!", pair_metadata=GENERATED_H1),
+        DatasetPair(dataset_id=dataset.id, question="Who wrote Les Misérables?", answer="Victor Hugo wrote it in 1862.", pair_metadata=GENERATED_H1),
+    ])
+    db.commit()
+
+    stats = deduplicate_dataset_pairs(db, dataset)
+
+    remaining = db.query(DatasetPair).filter(DatasetPair.dataset_id == dataset.id).order_by(DatasetPair.id).all()
+    assert [pair.question for pair in remaining] == [QUESTION, "Who wrote Les Misérables?"]
+    assert stats["pairs_checked"] == 3
+    assert stats["pairs_dropped"] == 1
+    assert dataset.dedup_stats["total_dropped"] == 1
+
+def test_deduplicate_dataset_pairs_never_deletes_manual_pairs(db):
+    """Pairs added by users win over generated duplicates, even newer ones, and are only counted when duplicated."""
+    dataset = Dataset(name="Dataset", project_id=1, status="processing")
+    db.add(dataset)
+    db.commit()
+    db.add_all([
+        DatasetPair(dataset_id=dataset.id, question=QUESTION, answer=ANSWER, pair_metadata=GENERATED_H0),
+        DatasetPair(dataset_id=dataset.id, question=QUESTION.upper(), answer=ANSWER, pair_metadata={"source": "manual"}),
+        DatasetPair(dataset_id=dataset.id, question=QUESTION.lower(), answer=ANSWER),
+        # Re-imported export: it still carries a chunk_hash but remains a user pair
+        DatasetPair(dataset_id=dataset.id, question=QUESTION + "!", answer=ANSWER, pair_metadata={"chunk_hash": "h0"}),
+    ])
+    db.commit()
+
+    stats = deduplicate_dataset_pairs(db, dataset)
+
+    remaining = db.query(DatasetPair.question).filter(DatasetPair.dataset_id == dataset.id).order_by(DatasetPair.id).all()
+    assert [question for question, in remaining] == [QUESTION.upper(), QUESTION.lower(), QUESTION + "!"]
+    assert (stats["pairs_checked"], stats["pairs_dropped"], stats["manual_pairs_skipped"]) == (4, 1, 2)
+
+def test_bulk_upload_reports_rejected_pairs_and_strips_generation_marks(db):
+    """Near-duplicates of the upload are counted in the response; uploaded pairs never look generated."""
+    user = User(email="dedup@example.com", name="Dedup", hashed_password="x")
+    db.add(user)
+    db.commit()
+    project = Project(name="Project", user_id=user.id)
+    db.add(project)
+    db.commit()
+    dataset = Dataset(name="Dataset", project_id=project.id, status="ready")
+    db.add(dataset)
+    db.commit()
+
+    response = add_bulk_pairs(dataset.id, BulkPairUpload(pairs=[
+        {"question": QUESTION, "answer": ANSWER, "pair_metadata": {"chunk_hash": "h0", "source": "generated", "topic": "geo"}},
+        {"question": QUESTION.upper(), "answer": ANSWER},
+        {"question": "Who wrote Les Misérables?", "answer": "Victor Hugo wrote it in 1862."},
+    ]), current_user=user, db=db)
+
+    assert (response.pairs_added, response.pairs_rejected, response.pairs_count) == (2, 1, 2)
+    first = db.query(DatasetPair).filter(DatasetPair.dataset_id == dataset.id).order_by(DatasetPair.id).first()
+    assert first.pair_metadata == {"topic": "geo"}
@@ -0,0 +1,58 @@
+import zipfile
+
+import docx
+
+from app.services.docx_extraction import extract_docx_text
+
+NAMESPACES = (
+    'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006"'
+)
+
+def paragraph(text):
+    return f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>"
+
+def row(*cells):
+    return "<w:tr>" + "".join(f"<w:tc>{paragraph(cell)}</w:tc>" for cell in cells) + "</w:tr>"
+
+def write_docx(path, body, **parts):
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("word/document.xml", f"<w:document {NAMESPACES}><w:body>{body}</w:body></w:document>")
+        for name, xml in parts.items():
+            archive.writestr(f"word/{name}.xml", xml)
+    return str(path)
+
+def test_matches_python_docx_paragraphs(tmp_path):
+    """Paragraph text is the same as python-docx's, one line per paragraph."""
+    document = docx.Document()
+    for text in ["Contrat de prestation", "", "Article 1 : objet", "Article 2 : durée"]:
+        document.add_paragraph(text)
+    path = tmp_path / "contract.docx"
+    document.save(path)
+
+    text, metadata = extract_docx_text(str(path))
+
+    assert text == "\n".join(paragraph.text for paragraph in docx.Document(path).paragraphs)
+    assert metadata == {"paragraph_count": 4, "table_count": 0}
+
+def test_tables_notes_headers_and_text_boxes(tmp_path):
+    """Table rows, footnotes and headers are kept; text box fallbacks are not duplicated."""
+    text_box = (
+        '<w:p><w:r><mc:AlternateContent><mc:Choice Requires="wps"><w:txbxContent>'
+        f'{paragraph("Encadré")}</w:txbxContent></mc:Choice><mc:Fallback><w:txbxContent>'
+        f'{paragraph("Encadré")}</w:txbxContent></mc:Fallback></mc:AlternateContent></w:r>'
+        '<w:r><w:t xml:space="preserve">Après </w:t><w:tab/><w:t>encadré</w:t></w:r></w:p>'
+    )
+    body = (
+        paragraph("Titre")
+        + f'<w:tbl>{row("Prix", "Quantité")}{row("10", "")}{row("", "")}</w:tbl>'
+        + text_box
+    )
+    note = f"<w:footnotes {NAMESPACES}><w:footnote w:type=\"separator\"><w:p/></w:footnote><w:footnote>{paragraph('Voir annexe.')}</w:footnote></w:footnotes>"
+    header = f"<w:hdr {NAMESPACES}>{paragraph('Confidentiel')}</w:hdr>"
+    path = write_docx(tmp_path / "report.docx", body, footnotes=note, header1=header, header2=header)
+
+    text, metadata = extract_docx_text(path)
+
+    assert text.split("\n") == ["Titre", "Prix | Quantité", "10 | ", "Encadré", "Après \tencadré", "Voir annexe.", "Confidentiel"]
+    assert metadata == {"paragraph_count": 11, "table_count": 1}
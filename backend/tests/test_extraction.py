@@ -0,0 +1,175 @@
+import io
+import os
+import zipfile
+
+import pytest
+from loguru import logger
+from sqlalchemy import event
+
+from app.models.content import Content
+from app.models.project import Project
+from app.models.user import User
+from app.models.stored_blob import StoredBlob
+from app.services.extraction import ExtractionError, extract_content, extractor_registry, reuse_blob_extraction
+from benchmarks.pdf_extraction_benchmark import build_text_pdf
+
+def resolve_name(content_type, file_path=None):
+    resolved = extractor_registry.resolve(content_type, file_path)
+    return resolved[0] if resolved else None
+
+def extract(tmp_path, name, data, content_type=None):
+    path = tmp_path / name
+    path.write_bytes(data) if isinstance(data, bytes) else path.write_text(data, encoding="utf-8")
+    content = Content(name=name, type=content_type or name.rsplit(".", 1)[-1], file_path=str(path))
+    _, extractor = extractor_registry.resolve(content.type, content.file_path)
+    return extractor(content)
+
+def write_zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+def test_registry_resolves_by_extension_then_type():
+    """The file extension wins over the declared type; unknown formats resolve to None."""
+    assert resolve_name("text", "/uploads/report.docx") == "docx"
+    assert resolve_name("text", "/uploads/notes.md") == "text"
+    assert resolve_name("PDF") == "pdf"
+    assert resolve_name("text/vtt") == "subtitles"
+    assert resolve_name("youtube") == "youtube"
+    assert resolve_name("doc", "/uploads/old.doc") == "doc"
+    assert resolve_name("image/png", "/uploads/photo.png") is None
+
+def test_doc_files_are_rejected(tmp_path):
+    """Legacy .doc files get the same explicit error message as before."""
+    with pytest.raises(ExtractionError, match=r"\.doc n'est pas supporté"):
+        extract(tmp_path, "old.doc", b"\xd0\xcf\x11\xe0")
+
+def test_html_drops_scripts_and_layout_whitespace(tmp_path):
+    """Scripts, styles and the head are dropped; runs of blank lines collapse to one."""
+    html = "<html><head><title>T</title><style>p{}</style></head><body><h1>Titre</h1>\n\n\n<p>Un   paragraphe.</p><script>x()</script></body></html>"
+    text, _ = extract(tmp_path, "page.html", html)
+    assert text == "Titre\n\nUn paragraphe."
+
+def test_csv_rows_become_labelled_lines(tmp_path):
+    """The delimiter is sniffed and each value is prefixed with its column name."""
+    text, metadata = extract(tmp_path, "faq.csv", "question;answer\nQui ?;Nous\nQuoi ?;\n")
+    assert text == "question: Qui ?, answer: Nous\nquestion: Quoi ?"
+    assert metadata == {"row_count": 2, "columns": ["question", "answer"]}
+
+def test_subtitles_keep_only_spoken_text(tmp_path):
+    """Cue numbers, timings, tags, NOTE blocks and repeated lines are dropped."""
+    srt = "1\n00:00:01,000 --> 00:00:02,000\n<i>Bonjour</i> à tous\n\n2\n00:00:02,500 --> 00:00:04,000\nBienvenue.\n"
+    vtt = "WEBVTT\n\nNOTE commentaire\nignoré\n\nintro\n00:01.000 --> 00:02.000 align:start\nBonjour à tous\n\n00:02.000 --> 00:03.000\nBonjour à tous\nBienvenue.\n"
+    assert extract(tmp_path, "talk.srt", srt) == ("Bonjour à tous\nBienvenue.", {"cue_count": 2})
+    assert extract(tmp_path, "talk.vtt", vtt) == ("Bonjour à tous\nBienvenue.", {"cue_count": 2})
+
+def test_pptx_slides_are_read_in_numeric_order(tmp_path):
+    def slide(*paragraphs):
+        body = "".join(f"<a:p><a:r><a:t>{text}</a:t></a:r></a:p>" for text in paragraphs)
+        return f'<p:sld xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main" xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main">{body}</p:sld>'
+
+    pptx = write_zip({
+        "ppt/slides/slide10.xml": slide("Dix"),
+        "ppt/slides/slide2.xml": slide("Deux", "Suite"),
+        "ppt/slides/slide1.xml": slide("Un"),
+        "ppt/notesSlides/notesSlide1.xml": slide("Note un"),
+    })
+    text, metadata = extract(tmp_path, "deck.pptx", pptx)
+    assert text == "Un\nNote un\n\nDeux\nSuite\n\nDix"
+    assert metadata == {"slide_count": 3}
+
+def test_epub_chapters_follow_the_spine(tmp_path):
+    container = '<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container"><rootfiles><rootfile full-path="OEBPS/content.opf"/></rootfiles></container>'
+    opf = (
+        '<package xmlns="http://www.idpf.org/2007/opf"><manifest>'
+        '<item id="a" href="text/a.xhtml"/><item id="b" href="text/b.xhtml"/></manifest>'
+        '<spine><itemref idref="b"/><itemref idref="a"/></spine></package>'
+    )
+    epub = write_zip({
+        "META-INF/container.xml": container,
+        "OEBPS/content.opf": opf,
+        "OEBPS/text/a.xhtml": "<html><body><p>Chapitre deux</p></body></html>",
+        "OEBPS/text/b.xhtml": "<html><body><p>Chapitre un</p></body></html>",
+    })
+    text, metadata = extract(tmp_path, "book.epub", epub)
+    assert text == "Chapitre un\n\nChapitre deux"
+    assert metadata == {"chapter_count": 2}
+
+def create_content(db, tmp_path, name, data, content_type):
+    user = User(email=f"{name}@example.com", hashed_password="x", name="Test")
+    db.add(user)
+    db.flush()
+    project = Project(name="Project", user_id=user.id)
+    db.add(project)
+    db.flush()
+    path = tmp_path / name
+    path.write_text(data, encoding="utf-8")
+    content = Content(name=name, type=content_type, file_path=str(path), project_id=project.id, content_metadata={"source": "upload"})
+    db.add(content)
+    db.commit()
+    return content.id
+
+def count_statements(db):
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement.split()[0]))
+    return statements
+
+def test_pipeline_reads_and_writes_content_once(db, tmp_path):
+    """One SELECT and one UPDATE store the text, merged metadata and status together."""
+    content_id = create_content(db, tmp_path, "cues.srt", "1\n00:00:01,000 --> 00:00:02,000\nBonjour\n", "text")
+    db.expire_all()
+    statements = count_statements(db)
+
+    result = extract_content(db, content_id)
+
+    assert result == {"status": "success", "content_id": content_id, "character_count": 7}
+    assert statements == ["SELECT", "UPDATE"]
+    content = db.get(Content, content_id)
+    assert (content.status, content.content_text) == ("completed", "Bonjour")
+    assert content.content_metadata == {"source": "upload", "cue_count": 1, "character_count": 7, "is_exact_count": True, "extractor": "subtitles"}
+
+def test_pipeline_records_extraction_errors(db, tmp_path):
+    """Unsupported formats leave the content in error with the reason."""
+    content_id = create_content(db, tmp_path, "scan.png", "", "image/png")
+
+    result = extract_content(db, content_id)
+
+    content = db.get(Content, content_id)
+    assert result == {"status": "error", "message": "Unsupported content type: image/png"}
+    assert (content.status, content.error_message) == ("error", "Unsupported content type: image/png")
+
+def test_identical_files_are_extracted_once(db, tmp_path):
+    """Text extracted from a blob is reused by every content that uploads the same file."""
+    content_id = create_content(db, tmp_path, "blob", "Bonjour\n", "text")
+    first = db.get(Content, content_id)
+    db.add(StoredBlob(sha256="a" * 64, file_path=first.file_path, size=8, ref_count=2))
+    first.content_metadata = {"original_name": "notes.md", "sha256": "a" * 64}
+    db.commit()
+
+    assert extract_content(db, content_id)["status"] == "success"
+    blob = db.get(StoredBlob, "a" * 64)
+    assert (blob.extractor, blob.extracted_text) == ("text", "Bonjour\n")
+
+    os.remove(first.file_path)
+    second = Content(name="copy", type="text", file_path=first.file_path, project_id=first.project_id, content_metadata={"original_name": "copy.txt", "sha256": "a" * 64})
+    assert reuse_blob_extraction(second, blob)
+    assert (second.status, second.content_text) == ("completed", "Bonjour\n")
+    assert second.content_metadata["reused_extraction"] is True
+    # A different extractor for the same bytes extracts again
+    assert not reuse_blob_extraction(Content(type="csv", file_path=first.file_path, content_metadata={"original_name": "copy.csv"}), blob)
+
+def test_pdf_progress_is_logged_while_pages_are_extracted(tmp_path):
+    """The PDF extractor reports its progress through on_page, every tenth of the pages."""
+    messages = []
+    sink = logger.add(lambda message: messages.append(message.record["message"]), filter=lambda record: "PDF pages extracted" in record["message"])
+    try:
+        text, metadata = extract(tmp_path, "manual.pdf", build_text_pdf([f"Page {number}" for number in range(1, 21)]))
+    finally:
+        logger.remove(sink)
+
+    assert metadata["page_count"] == 20
+    assert [message.split(":")[1].split()[0] for message in messages] == [f"{number}/20" for number in range(2, 21, 2)]
+    # Le texte final compte en plus un saut de ligne par page
+    assert messages[-1].endswith(f"({len(text) - 20} characters)")
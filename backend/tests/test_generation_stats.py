@@ -0,0 +1,18 @@
+from app.models.qa_generation_stat import QAGenerationStat
+from app.services.generation_stats import GenerationOutcomes
+
+def test_outcomes_are_accumulated_per_output_mode(db):
+    """Successive flushes add up in one row per provider/model/mode; failed requests are not counted."""
+    outcomes = GenerationOutcomes("openai", "gpt-4.1")
+    outcomes.add({"pairs": [{"question": "Q?", "answer": "A."}], "parse_ok": True, "structured": True})
+    outcomes.add({"pairs": [], "parse_ok": False, "structured": True})
+    outcomes.add(None)
+    outcomes.flush(db)
+    outcomes.add({"pairs": [], "parse_ok": False, "structured": True})
+    outcomes.add({"pairs": [{"question": "Q?", "answer": "A."}], "parse_ok": True, "structured": False})
+    outcomes.flush(db)
+
+    rows = {row.structured: row for row in db.query(QAGenerationStat).all()}
+    assert (rows[True].calls, rows[True].parse_failures, rows[True].pairs) == (3, 2, 1)
+    assert (rows[False].calls, rows[False].parse_failures, rows[False].pairs) == (1, 0, 1)
+    assert outcomes.summary() == {"calls": 0, "parse_failures": 0, "pairs": 0}
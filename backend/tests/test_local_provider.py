@@ -0,0 +1,86 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.core.config import settings
+from app.services import ai_providers
+from app.services.ai_providers import get_ai_provider
+from app.services.local_llm import LocalModelRunner
+from app.services.rate_limiter import rate_limiter
+from app.tasks.dataset_generation import iter_chunk_pairs
+
+def answer_for(messages):
+    chunk = messages[-1]["content"].strip().splitlines()[-1]
+    return json.dumps({"pairs": [{"question": f"{chunk}?", "answer": "A."}]})
+
+class StubChatHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible chat completions server, like llama.cpp server or vLLM."""
+
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append(request)
+        body = json.dumps({
+            "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": request["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": answer_for(request["messages"])}}],
+            "usage": {"prompt_tokens": 200, "completion_tokens": 20, "total_tokens": 220},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class FakeModel:
+    """Stands for the in-process model and records the size of each generated batch."""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def generate(self, conversations):
+        self.batch_sizes.append(len(conversations))
+        return [(answer_for(messages), 100, 10) for messages in conversations]
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "enabled", False)
+    monkeypatch.setattr(settings, "QA_STRUCTURED_OUTPUT", True)
+    monkeypatch.setattr(settings, "QA_PROMPT_CACHING", True)
+
+def test_local_server_generates_qa_pairs(monkeypatch):
+    """The local provider sends OpenAI-style chat requests to LOCAL_LLM_BASE_URL."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubChatHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(settings, "LOCAL_LLM_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    StubChatHandler.requests = []
+    try:
+        provider = get_ai_provider("local")
+        result = provider.generate_qa_pairs_detailed("Un texte.", "llama-3.1-8b", "goal")
+    finally:
+        server.shutdown()
+
+    assert result["pairs"] == [{"question": "Un texte.?", "answer": "A."}]
+    assert result["parse_ok"] and result["model"] == "llama-3.1-8b"
+    assert (result["prompt_tokens"], result["completion_tokens"]) == (200, 20)
+    assert StubChatHandler.requests[0]["response_format"]["type"] == "json_schema"
+
+def test_in_process_model_batches_concurrent_chunks(monkeypatch):
+    """Without a server, concurrent chunks are generated together by the in-process model."""
+    monkeypatch.setattr(settings, "LOCAL_LLM_BASE_URL", None)
+    model = FakeModel()
+    runner = LocalModelRunner(model, max_batch_size=4, max_wait=0.5)
+    monkeypatch.setattr(ai_providers, "get_local_runner", lambda model_name: runner)
+
+    provider = get_ai_provider("local")
+    chunks = [(i, f"chunk {i}") for i in range(8)]
+    results = list(iter_chunk_pairs(provider, chunks, 8, settings.LOCAL_LLM_MODEL, "goal", 4))
+
+    assert [pairs for _, pairs in results] == [[{"question": f"chunk {i}?", "answer": "A."}] for i in range(8)]
+    assert sum(model.batch_sizes) == 8
+    assert max(model.batch_sizes) > 1
@@ -0,0 +1,93 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from app.core.config import settings
+from app.services.ai_providers import OpenAIProvider
+
+class StubBatchHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible server: file upload, batch creation/retrieval, result download."""
+
+    uploads = []
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _batch(self, status):
+        return {
+            "id": "batch-1", "object": "batch", "endpoint": "/v1/chat/completions",
+            "input_file_id": "file-in", "completion_window": "24h", "created_at": 0,
+            "status": status, "output_file_id": "file-out", "error_file_id": None,
+            "request_counts": {"total": 2, "completed": 2, "failed": 0},
+        }
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path == "/v1/files":
+            self.uploads.append(body)
+            self._send_json({"id": "file-in", "object": "file", "bytes": len(body), "created_at": 0, "filename": "qa_batch.jsonl", "purpose": "batch", "status": "processed"})
+        elif self.path == "/v1/batches":
+            self._send_json(self._batch("validating"))
+
+    def do_GET(self):
+        if self.path == "/v1/batches/batch-1":
+            self._send_json(self._batch("completed"))
+        elif self.path == "/v1/files/file-out/content":
+            answer = json.dumps({"pairs": [{"question": "Q?", "answer": "A."}]})
+            lines = [
+                {"custom_id": "chunk-0-abc", "response": {"status_code": 200, "body": {
+                    "model": "gpt-4.1-2025-04-14", "choices": [{"message": {"content": answer}}],
+                    "usage": {"prompt_tokens": 120, "completion_tokens": 30, "total_tokens": 150},
+                }}},
+                {"custom_id": "chunk-1-def", "response": {"status_code": 500, "body": {}}, "error": "server error"},
+            ]
+            body = "\n".join(json.dumps(line) for line in lines).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+@pytest.fixture
+def stub_openai(monkeypatch):
+    monkeypatch.setattr(settings, "QA_STRUCTURED_OUTPUT", True)
+    server = HTTPServer(("127.0.0.1", 0), StubBatchHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(settings, "OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    StubBatchHandler.uploads = []
+    yield
+    server.shutdown()
+
+def test_qa_batch_round_trip(stub_openai):
+    """Chunks are submitted as one JSONL batch and results are parsed back per custom_id."""
+    provider = OpenAIProvider("sk-test")
+
+    batch_id = provider.submit_qa_batch([("chunk-0-abc", "Premier texte."), ("chunk-1-def", "Second texte.")], "gpt-4.1", "goal")
+    assert batch_id == "batch-1"
+    uploaded = StubBatchHandler.uploads[0]
+    assert b'"custom_id": "chunk-0-abc"' in uploaded and b'"custom_id": "chunk-1-def"' in uploaded
+    assert b'"response_format": {"type": "json_schema"' in uploaded
+
+    batch = provider.get_qa_batch(batch_id)
+    assert batch["status"] == "completed"
+    assert batch["output_file_id"] == "file-out"
+
+    results = dict(provider.iter_qa_batch_results(batch["output_file_id"]))
+    assert results == {
+        "chunk-0-abc": {
+            "pairs": [{"question": "Q?", "answer": "A."}], "parse_ok": True, "structured": True,
+            "prompt_tokens": 120, "completion_tokens": 30, "cached_tokens": None, "model": "gpt-4.1-2025-04-14",
+        },
+        "chunk-1-def": None,
+    }
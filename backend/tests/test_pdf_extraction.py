@@ -0,0 +1,75 @@
+import time
+
+import PyPDF2
+import pytest
+
+from app.core.config import settings
+from app.services import pdf_extraction
+from app.services.pdf_extraction import extract_pdf_text, get_page_ranges
+from benchmarks.pdf_extraction_benchmark import build_text_pdf
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    path = tmp_path / "manual.pdf"
+    path.write_bytes(build_text_pdf([f"Page {number}\nSection {number}" for number in range(1, 25)]))
+    return str(path)
+
+def test_page_ranges_cover_every_page_in_order():
+    """Page ranges are consecutive, cover the document and give each process several ranges."""
+    ranges = get_page_ranges(300, 4)
+    assert ranges[0][0] == 0 and ranges[-1][1] == 300
+    assert all(end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+    assert len(ranges) >= 12
+    assert get_page_ranges(3, 8) == [(0, 1), (1, 2), (2, 3)]
+
+def test_parallel_extraction_matches_sequential(pdf_path, monkeypatch):
+    """Pages extracted by the process pool are joined back in page order."""
+    monkeypatch.setattr(settings, "PDF_PARALLEL_MIN_PAGES", 1000)
+    sequential, metadata = extract_pdf_text(pdf_path)
+    monkeypatch.setattr(settings, "PDF_PARALLEL_MIN_PAGES", 2)
+    monkeypatch.setattr(settings, "PDF_EXTRACTION_WORKERS", 3)
+    streamed = []
+    parallel, parallel_metadata = extract_pdf_text(pdf_path, on_page=lambda number, count, text: streamed.append(number))
+
+    assert parallel == sequential
+    assert sequential.index("Page 2\n") < sequential.index("Page 10\n") < sequential.index("Page 24\n")
+    assert metadata == {"page_count": 24, "extraction_workers": 1}
+    assert parallel_metadata["extraction_workers"] == 3
+    assert streamed == list(range(1, 25))
+
+def test_slow_page_is_skipped_after_timeout(pdf_path, monkeypatch):
+    """A page that takes longer than PDF_PAGE_TIMEOUT_SECONDS is left empty; the others are kept."""
+    monkeypatch.setattr(settings, "PDF_PARALLEL_MIN_PAGES", 1000)
+    monkeypatch.setattr(settings, "PDF_PAGE_TIMEOUT_SECONDS", 0.2)
+    extract_text = PyPDF2.PageObject.extract_text
+
+    def slow_extract_text(page, *args, **kwargs):
+        text = extract_text(page, *args, **kwargs)
+        if text.startswith("Page 3\n"):
+            time.sleep(5)
+        return text
+
+    monkeypatch.setattr(PyPDF2.PageObject, "extract_text", slow_extract_text)
+    text, metadata = extract_pdf_text(pdf_path)
+
+    assert metadata["timed_out_pages"] == [3]
+    assert "Page 3\n" not in text and "Page 4\n" in text
+
+def test_pool_is_reused_across_pdfs(pdf_path, tmp_path, monkeypatch):
+    """Successive PDFs share one process pool, whose processes reopen the file they are given."""
+    monkeypatch.setattr(settings, "PDF_PARALLEL_MIN_PAGES", 2)
+    monkeypatch.setattr(settings, "PDF_EXTRACTION_WORKERS", 2)
+    other_path = tmp_path / "other.pdf"
+    other_path.write_bytes(build_text_pdf([f"Autre {number}" for number in range(1, 9)]))
+
+    try:
+        first, _ = extract_pdf_text(pdf_path)
+        pool = pdf_extraction.get_extraction_pool()
+        other, _ = extract_pdf_text(str(other_path))
+        again, _ = extract_pdf_text(pdf_path)
+
+        assert pdf_extraction.get_extraction_pool() is pool
+        assert again == first and "Page 24\n" in first
+        assert other.startswith("Autre 1\n") and "Page" not in other
+    finally:
+        pdf_extraction.shutdown_extraction_pool()
@@ -0,0 +1,105 @@
+import asyncio
+import os
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.provider_clients import ProviderClientRegistry, provider_clients
+
+def test_clients_are_shared_per_provider_key_and_base_url():
+    """One client per (provider, API key, base URL), created once even under concurrent access."""
+    registry = ProviderClientRegistry(max_size=8)
+    created = []
+
+    def factory():
+        created.append(object())
+        return created[-1]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        clients = list(executor.map(lambda _: registry.get("openai", "sk-a", None, factory), range(32)))
+    assert len(created) == 1 and all(client is created[0] for client in clients)
+
+    assert registry.get("openai", "sk-b", None, factory) is not created[0]
+    assert registry.get("openai", "sk-a", "http://localhost:8080/v1", factory) is not created[0]
+    assert registry.get("mistral", "sk-a", None, factory) is not created[0]
+    assert len(created) == 4
+
+def test_least_recently_used_client_is_dropped():
+    """Beyond max_size, the least recently used client is forgotten and rebuilt on demand."""
+    registry = ProviderClientRegistry(max_size=2)
+    first = registry.get("openai", "sk-1", None, object)
+    registry.get("openai", "sk-2", None, object)
+    assert registry.get("openai", "sk-1", None, object) is first
+    registry.get("openai", "sk-3", None, object)
+
+    assert registry.get("openai", "sk-1", None, object) is first
+    assert registry.key_fingerprint("sk-1") != "sk-1"
+
+class ClosableClient:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class AsyncClosableClient:
+    def __init__(self):
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+def test_evicted_clients_are_closed():
+    """The least recently used client is closed when evicted; async clients are closed on their own loop."""
+    registry = ProviderClientRegistry(max_size=1)
+    first = registry.get("openai", "sk-1", None, ClosableClient)
+    second = registry.get("openai", "sk-2", None, ClosableClient)
+    assert first.closed and not second.closed
+
+    async def evict():
+        evicted = registry.get_async("mistral", "sk-1", None, AsyncClosableClient)
+        kept = registry.get_async("mistral", "sk-2", None, AsyncClosableClient)
+        await asyncio.sleep(0)
+        return evicted, kept
+
+    evicted, kept = asyncio.run(evict())
+    assert evicted.closed and not kept.closed
+
+def test_async_clients_are_scoped_to_the_event_loop():
+    """Async clients are reused within an event loop and never handed to another loop."""
+    registry = ProviderClientRegistry()
+
+    async def fetch_twice():
+        first = registry.get_async("mistral", "sk-a", None, object)
+        return first, registry.get_async("mistral", "sk-a", None, object)
+
+    first, second = asyncio.run(fetch_twice())
+    assert first is second
+    assert asyncio.run(fetch_twice())[0] is not first
+
+def test_reset_after_fork_does_not_wait_for_the_lock(tmp_path):
+    """A lock held by a parent thread at fork time cannot block the child: it gets a fresh lock and an empty registry."""
+    registry = ProviderClientRegistry()
+    first = registry.get("openai", "sk-a", None, object)
+    registry._lock.acquire()
+    registry.reset_after_fork()
+    assert registry.get("openai", "sk-a", None, object) is not first
+
+    if not hasattr(os, "fork"):
+        return
+    # Fork réel pendant que le verrou du singleton est détenu dans le parent
+    marker = tmp_path / "child"
+    with provider_clients._lock:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                provider_clients.get("openai", "sk-a", None, object)
+                marker.write_text("ok")
+            finally:
+                os._exit(0)
+    deadline = time.monotonic() + 10
+    while os.waitpid(pid, os.WNOHANG) == (0, 0) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    if not marker.exists():
+        os.kill(pid, signal.SIGKILL)
+    assert marker.exists()
@@ -0,0 +1,35 @@
+from app.services.qa_cache import QAPairCache
+
+def test_make_key_depends_on_every_parameter():
+    """The cache key changes with the chunk, model, provider, goal and prompt version."""
+    cache = QAPairCache(enabled=True)
+    base = cache.make_key("chunk", "gpt-4.1", "openai", "goal", "v1")
+    
+    assert base == cache.make_key("chunk", "gpt-4.1", "openai", "goal", "v1")
+    assert base != cache.make_key("chunk!", "gpt-4.1", "openai", "goal", "v1")
+    assert base != cache.make_key("chunk", "gpt-4o", "openai", "goal", "v1")
+    assert base != cache.make_key("chunk", "gpt-4.1", "mistral", "goal", "v1")
+    assert base != cache.make_key("chunk", "gpt-4.1", "openai", "other goal", "v1")
+    assert base != cache.make_key("chunk", "gpt-4.1", "openai", "goal", "v2")
+
+def test_store_and_get_many(db):
+    """Stored pairs are returned on lookup and empty results are not cached."""
+    cache = QAPairCache(enabled=True)
+    key = cache.make_key("chunk", "gpt-4.1", "openai", "goal", "v1")
+    pairs = [{"question": "Q?", "answer": "A."}]
+    
+    assert cache.store(db, key, pairs, "openai", "gpt-4.1", "v1")
+    assert not cache.store(db, key, pairs, "openai", "gpt-4.1", "v1")  # déjà présent
+    assert cache.get_many(db, [key, "missing"]) == {key: pairs}
+    
+    empty_key = cache.make_key("empty", "gpt-4.1", "openai", "goal", "v1")
+    assert not cache.store(db, empty_key, [], "openai", "gpt-4.1", "v1")
+    assert cache.get(db, empty_key) is None
+
+def test_disabled_cache_is_a_no_op(db):
+    """A disabled cache never stores nor returns entries."""
+    cache = QAPairCache(enabled=False)
+    key = cache.make_key("chunk", "gpt-4.1", "openai", "goal", "v1")
+    
+    assert not cache.store(db, key, [{"question": "Q?", "answer": "A."}], "openai", "gpt-4.1", "v1")
+    assert cache.get(db, key) is None
@@ -0,0 +1,57 @@
+import json
+
+from app.services.qa_parser import parse_qa_pairs, parse_structured_qa_pairs, parse_packed_qa_pairs
+
+def chatml(question, answer):
+    return {"messages": [{"role": "system", "content": ""}, {"role": "user", "content": question}, {"role": "assistant", "content": answer}]}
+
+def test_parses_array_jsonl_and_code_fences():
+    """ChatML objects are extracted from an array, JSONL lines or a fenced block surrounded by prose."""
+    objects = [chatml("Q1?", "A1."), chatml("Q2?", "A2.")]
+    expected = [{"question": "Q1?", "answer": "A1."}, {"question": "Q2?", "answer": "A2."}]
+
+    assert parse_qa_pairs(json.dumps(objects)) == expected
+    assert parse_qa_pairs("\n".join(json.dumps(o) + "," for o in objects)) == expected
+    assert parse_qa_pairs("Voici :\n```json\n" + json.dumps(objects, indent=2) + "\n```\nBonne journée !") == expected
+
+def test_parses_flat_and_wrapped_pairs():
+    """The flat question/answer form is accepted, including inside a wrapper object."""
+    content = json.dumps({"pairs": [{"question": "Q?", "answer": "A."}]})
+
+    assert parse_qa_pairs(content) == [{"question": "Q?", "answer": "A."}]
+
+def test_recovers_complete_objects_from_truncated_response():
+    """Objects before the truncation point are kept; raw newlines in strings are tolerated."""
+    content = '[{"question": "Q1?", "answer": "ligne 1\nligne 2"}, {"question": "Q2?", "answer": "coup'
+
+    assert parse_qa_pairs(content) == [{"question": "Q1?", "answer": "ligne 1\nligne 2"}]
+
+def test_no_pairs():
+    """Prose, empty content and objects of another shape give no pair."""
+    assert parse_qa_pairs("Désolé, je ne peux pas.") == []
+    assert parse_qa_pairs("") == []
+    assert parse_qa_pairs('{"role": "user", "content": "orphan"}') == []
+
+def test_structured_output_is_validated_against_schema():
+    """A schema-valid payload parses cleanly; anything else falls back to text parsing and is flagged."""
+    payload = {"pairs": [{"question": "Q?", "answer": "A."}]}
+
+    assert parse_structured_qa_pairs(payload) == ([{"question": "Q?", "answer": "A."}], True)
+    assert parse_structured_qa_pairs(json.dumps(payload)) == ([{"question": "Q?", "answer": "A."}], True)
+    assert parse_structured_qa_pairs(json.dumps([chatml("Q?", "A.")])) == ([{"question": "Q?", "answer": "A."}], False)
+    assert parse_structured_qa_pairs({"pairs": [{"question": "Q?"}]}) == ([], False)
+    assert parse_structured_qa_pairs(None) == ([], False)
+
+def test_packed_output_is_split_by_source_chunk():
+    """Pairs of a packed request go back to their chunk; unknown chunk ids are dropped."""
+    payload = {"pairs": [
+        {"chunk": 2, "question": "Q2?", "answer": "A2."},
+        {"chunk": 1, "question": "Q1?", "answer": "A1."},
+        {"chunk": 7, "question": "Q7?", "answer": "A7."},
+    ]}
+
+    assert parse_packed_qa_pairs(json.dumps(payload), 3) == (
+        [[{"question": "Q1?", "answer": "A1."}], [{"question": "Q2?", "answer": "A2."}], []], True
+    )
+    # Sans identifiant de chunk, aucune paire ne peut être attribuée
+    assert parse_packed_qa_pairs({"pairs": [{"question": "Q?", "answer": "A."}]}, 2) == ([[], []], False)
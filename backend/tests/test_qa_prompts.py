@@ -0,0 +1,23 @@
+from app.services.ai_providers import build_qa_prompts, get_qa_prompt_version
+
+def test_cacheable_layout_shares_the_prefix_across_chunks():
+    """In the cacheable layout only the user message depends on the chunk."""
+    first_system, first_user = build_qa_prompts("Premier chunk.", "Parler comme un pirate", True, cacheable=True)
+    second_system, second_user = build_qa_prompts("Second chunk.", "Parler comme un pirate", True, cacheable=True)
+
+    assert first_system == second_system
+    assert "Parler comme un pirate" in first_system
+    assert first_user.endswith("Premier chunk.") and "Premier chunk." not in first_system
+    assert "Parler comme un pirate" not in first_user
+
+    # La disposition historique garde l'objectif et les consignes après le chunk
+    system, user = build_qa_prompts("Premier chunk.", "Parler comme un pirate", True, cacheable=False)
+    assert "Parler comme un pirate" not in system and "Parler comme un pirate" in user
+
+def test_prompt_version_depends_on_the_layout():
+    """Pairs generated with another prompt layout are not served from the QA pair cache."""
+    versions = {
+        get_qa_prompt_version(structured, cacheable)
+        for structured in (True, False) for cacheable in (True, False)
+    }
+    assert len(versions) == 4
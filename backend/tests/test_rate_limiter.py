@@ -0,0 +1,36 @@
+import time
+
+from app.services.rate_limiter import ProviderRateLimiter, parse_reset_seconds, retry_after_seconds
+
+def test_parse_reset_seconds_formats():
+    """OpenAI durations, plain seconds and RFC 3339 dates are all converted to seconds."""
+    assert parse_reset_seconds("6m0s") == 360
+    assert parse_reset_seconds("1.5s") == 1.5
+    assert abs(parse_reset_seconds("20ms") - 0.02) < 1e-9
+    assert parse_reset_seconds("12") == 12
+    now = 1_700_000_000.0
+    assert parse_reset_seconds("2023-11-14T22:13:30Z", now=now) == 10
+    assert parse_reset_seconds("not a date") is None
+    assert parse_reset_seconds(None) is None
+
+def test_retry_after_prefers_milliseconds_header():
+    """retry-after-ms is more precise than Retry-After and wins when both are present."""
+    assert retry_after_seconds({"retry-after-ms": "250", "retry-after": "3"}) == 0.25
+    assert retry_after_seconds({"retry-after": "3"}) == 3
+    assert retry_after_seconds({}) is None
+
+def test_limiter_fails_open_without_redis():
+    """An unreachable Redis lets calls through and is not retried on every call."""
+    limiter = ProviderRateLimiter(redis_url="redis://127.0.0.1:1/0", enabled=True)
+    start = time.monotonic()
+    assert limiter.acquire("openai", "sk-test", 1000) == 0
+    assert not limiter.available
+
+    limiter.block("openai", "sk-test", 30)
+    assert limiter.acquire("openai", "sk-test", 1000) == 0
+    assert time.monotonic() - start < 5
+
+def test_disabled_limiter_never_waits():
+    """With RATE_LIMIT_ENABLED off, acquire returns immediately."""
+    limiter = ProviderRateLimiter(redis_url="redis://127.0.0.1:1/0", enabled=False)
+    assert limiter.acquire("anthropic", "sk-test", 10**9) == 0
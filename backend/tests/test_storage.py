@@ -0,0 +1,145 @@
+import asyncio
+import codecs
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import UploadFile
+from sqlalchemy.exc import IntegrityError
+
+from app.api.endpoints import contents
+from app.models.content import Content
+from app.models.project import Project
+from app.models.stored_blob import StoredBlob
+from app.models.user import User
+from app.services import storage
+from app.services.storage import FileTooLargeError, StorageService, detect_encoding, iter_normalized_text, storage_service
+
+FRENCH = "Le contrat a été signé à Paris, « déjà » révisé – 5 €.\n"
+
+def test_detects_windows_1252_and_boms():
+    """Non UTF-8 French text is read as cp1252 rather than a neighbouring code page."""
+    assert detect_encoding(FRENCH.encode("utf-8")) == "utf-8"
+    assert detect_encoding(FRENCH.encode("utf-8")[:-3]) == "utf-8"  # "€" cut at the end of the sample
+    assert detect_encoding((FRENCH * 3).encode("cp1252")) == "cp1252"
+    assert detect_encoding(("Привет, это тест кодировки.\n" * 5).encode("cp1251")) == "cp1251"
+    assert detect_encoding(codecs.BOM_UTF8 + b"abc") == "utf-8-sig"
+    assert detect_encoding("abc".encode("utf-16")) == "utf-16"
+
+def test_detects_utf16_without_bom(tmp_path):
+    """BOM-less UTF-16 is recognised from its NUL bytes, even when the sample would also decode as UTF-8."""
+    ascii_text = "Plain ASCII notes, exported by a Windows tool.\r\n" * 3
+    codecs.getincrementaldecoder("utf-8")().decode(ascii_text.encode("utf-16-le"))  # valide en UTF-8
+    assert detect_encoding(ascii_text.encode("utf-16-le")) == "utf-16-le"
+    assert detect_encoding(ascii_text.encode("utf-16-be")) == "utf-16-be"
+    assert detect_encoding(FRENCH.encode("utf-16-le")[:-1]) == "utf-16-le"  # échantillon coupé au milieu d'un caractère
+    assert detect_encoding("Premier\x00 paragraphe".encode("utf-8")) == "utf-8"
+
+    path = tmp_path / "export.txt"
+    path.write_bytes((FRENCH * 3).encode("utf-16-be"))
+    assert storage_service.read_text_file(str(path)) == (FRENCH * 3, "utf-16-be")
+
+def test_reads_legacy_encodings(tmp_path):
+    """Latin-1/Windows-1252 uploads no longer fail to decode."""
+    path = tmp_path / "notes.txt"
+    path.write_bytes((FRENCH * 3).encode("cp1252"))
+    assert storage_service.get_file_content(str(path)) == FRENCH * 3
+
+    path.write_bytes(FRENCH.encode("utf-16"))
+    assert storage_service.read_text_file(str(path)) == (FRENCH, "utf-16")
+
+    path.write_bytes(b"")
+    assert storage_service.get_file_content(str(path)) == ""
+
+def test_normalization_is_the_same_across_block_boundaries():
+    """Newlines, trailing spaces, control characters and blank runs are normalized chunk by chunk."""
+    data = "Titre  \r\n\r\n\r\n\r\nPremier\x00 paragraphe\t\rSuite é\r\nFin".encode("utf-8")
+    expected = "Titre\n\nPremier paragraphe\nSuite é\nFin"
+    for chunk_size in (1, 2, 3, 5, len(data)):
+        assert "".join(iter_normalized_text(data, "utf-8", chunk_size)) == expected
+
+def test_large_file_is_read_in_blocks(tmp_path, monkeypatch):
+    """The mapped file is decoded block by block, with multi-byte characters split across blocks."""
+    monkeypatch.setattr(storage, "TEXT_READ_CHUNK_BYTES", 7)
+    path = tmp_path / "dump.txt"
+    path.write_bytes((FRENCH * 50).encode("utf-8"))
+    assert storage_service.get_file_content(str(path)) == FRENCH * 50
+
+def upload(service, db, data, filename="report.pdf", max_size=1024):
+    return asyncio.run(service.store_upload(db, UploadFile(file=io.BytesIO(data), filename=filename), max_size))
+
+def test_identical_uploads_share_one_blob(db, tmp_path, monkeypatch):
+    """Identical uploads are stored once under their SHA-256, with one reference per upload."""
+    monkeypatch.setattr(storage, "UPLOAD_CHUNK_BYTES", 10)
+    service = StorageService(str(tmp_path))
+    data = b"%PDF-1.4 identical bytes" * 10
+
+    first = upload(service, db, data)
+    second = upload(service, db, data, filename="copy.pdf")
+
+    assert first.sha256 == second.sha256 == hashlib.sha256(data).hexdigest()
+    assert (second.ref_count, second.size) == (2, len(data))
+    assert open(second.file_path, "rb").read() == data
+    assert os.listdir(tmp_path / "blobs" / "tmp") == []
+
+    with pytest.raises(FileTooLargeError):
+        upload(service, db, data, max_size=100)
+    assert os.listdir(tmp_path / "blobs" / "tmp") == []
+
+def test_blob_is_deleted_with_its_last_reference(db, tmp_path):
+    """Releasing a reference keeps the file until no content uses it; the last release hands the file back for deletion after commit."""
+    service = StorageService(str(tmp_path))
+    blob = upload(service, db, b"shared")
+    upload(service, db, b"shared")
+    file_path = blob.file_path
+
+    assert service.release_blob(db, blob.sha256) is None
+    db.commit()
+    assert os.path.exists(file_path)
+
+    # Suppression annulée : la ligne et le fichier sont toujours là
+    assert service.release_blob(db, blob.sha256) == file_path
+    db.rollback()
+    assert os.path.exists(file_path)
+    assert db.get(StoredBlob, blob.sha256).ref_count == 1
+
+    assert service.release_blob(db, blob.sha256) == file_path
+    assert os.path.exists(file_path)
+    db.commit()
+    assert service.delete_file(file_path)
+    assert not os.path.exists(file_path)
+
+def test_failed_content_insert_releases_the_blob_reference(db, tmp_path, monkeypatch):
+    """When the Content row cannot be created, the upload gives its blob reference back and a new blob is deleted."""
+    service = StorageService(str(tmp_path))
+    monkeypatch.setattr(contents, "storage_service", service)
+    monkeypatch.setattr(contents.process_content, "delay", lambda content_id: None)
+    user = User(email="upload@example.com", name="Upload", hashed_password="x")
+    db.add(user)
+    db.commit()
+    project = Project(name="Project", user_id=user.id)
+    db.add(project)
+    db.commit()
+    shared = upload(service, db, b"shared")
+
+    def failing_reuse(content, blob):
+        content.project_id = None  # NOT NULL : l'insertion du contenu échoue
+        return True
+    monkeypatch.setattr(contents, "reuse_blob_extraction", failing_reuse)
+
+    def upload_content(data):
+        file = UploadFile(file=io.BytesIO(data), filename="report.pdf")
+        return asyncio.run(contents.upload_file(file=file, project_id=project.id, name="Report", description=None, file_type="pdf", current_user=user, db=db))
+
+    with pytest.raises(IntegrityError):
+        upload_content(b"shared")
+    assert db.get(StoredBlob, shared.sha256).ref_count == 1
+    assert os.path.exists(shared.file_path)
+
+    with pytest.raises(IntegrityError):
+        upload_content(b"new file")
+    new_sha256 = hashlib.sha256(b"new file").hexdigest()
+    assert db.get(StoredBlob, new_sha256) is None
+    assert not os.path.exists(service.get_blob_path(new_sha256))
+    assert db.query(Content).count() == 0
@@ -0,0 +1,48 @@
+from app.models.dataset import Dataset, DatasetUsage
+from app.services.usage_ledger import UsageLedger, estimate_cost, summarize_dataset_usage
+
+def qa_result(pairs, prompt_tokens, completion_tokens, parse_ok=True, retries=0, model="gpt-4.1-2025-04-14"):
+    return {
+        "pairs": [{"question": f"Q{i}?", "answer": f"A{i}."} for i in range(pairs)],
+        "parse_ok": parse_ok, "structured": True, "model": model, "retries": retries,
+        "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "latency": 1.5,
+    }
+
+def test_estimate_cost_uses_longest_model_prefix():
+    """Dated model names are priced like their family; unknown models have no cost."""
+    assert estimate_cost("gpt-4.1-2025-04-14", 1_000_000, 0) == 2.0
+    assert estimate_cost("gpt-4.1-mini-2025-04-14", 1_000_000, 1_000_000) == 2.0
+    assert estimate_cost("local-model", 1000, 1000) is None
+    assert estimate_cost("gpt-4.1", None, 10) is None
+    # Les tokens lus dans le cache du provider sont facturés au tarif réduit
+    assert estimate_cost("gpt-4.1", 1_000_000, 0, cached_tokens=1_000_000) == 0.5
+
+def test_ledger_records_calls_and_dataset_totals(db):
+    """Each call becomes a ledger row; the dataset row keeps the aggregated usage."""
+    dataset = Dataset(name="Dataset", project_id=1, status="processing")
+    db.add(dataset)
+    db.commit()
+
+    ledger = UsageLedger(dataset.id, "openai")
+    ledger.add(0, qa_result(4, 1000, 500))
+    ledger.add(1, qa_result(0, 1200, 40, parse_ok=False, retries=2))
+    ledger.add(2, None)
+    ledger.flush(db)
+    ledger.add(2, qa_result(2, 800, 300, model=None), model="mistral-large-latest")
+    ledger.flush(db)
+
+    assert db.query(DatasetUsage).filter(DatasetUsage.dataset_id == dataset.id).count() == 3
+    db.refresh(dataset)
+    totals = dataset.token_usage
+    assert totals["calls"] == 3
+    assert (totals["prompt_tokens"], totals["completion_tokens"], totals["total_tokens"]) == (3000, 840, 3840)
+    assert (totals["retries"], totals["parse_failures"], totals["pairs"]) == (2, 1, 6)
+    assert totals["avg_latency_ms"] == 1500
+    assert totals["tokens_per_pair"] == 640.0
+
+    summary = summarize_dataset_usage(db, dataset)
+    assert {(entry["model"], entry["calls"]) for entry in summary["by_model"]} == {
+        ("gpt-4.1-2025-04-14", 2), ("mistral-large-latest", 1)
+    }
+    # Le chunk sans paire est le moins efficace
+    assert summary["least_efficient_chunks"][0]["chunk_index"] == 1